@@ -8,11 +8,17 @@
 # + Sidebar GLPI connection tester
 # ==========================================================
 
-import os, re, io, requests
-from itertools import combinations
+import os, re, io, time, hashlib
 import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
+from cn_matching import PartitionedCNIndex, assign_globally
+from parsing import fmt_date, parse_amounts
+from payment_export import body_no_total, code_sheet, write_excel_export
+import glpi_client
+import send_journal
+from glpi_client import (OUTCOME_UNKNOWN, glpi_link_document_many, glpi_plan, glpi_send_batched,
+                         glpi_send_many, glpi_session, glpi_session_info, glpi_upload_document)
 
 # ----------------------------------------------------------
 # UI
@@ -42,47 +48,17 @@ def _get(name, default=""):
 GLPI_URL   = (_get("GLPI_URL") or "").strip().rstrip("/")
 APP_TOKEN  = (_get("APP_TOKEN") or "").strip()
 USER_TOKEN = (_get("USER_TOKEN") or "").strip()
+glpi_client.configure(
+    url=GLPI_URL, app_token=APP_TOKEN, user_token=USER_TOKEN, user_id=DEFAULT_USER_ID,
+    max_workers=_get("GLPI_MAX_WORKERS", glpi_client.MAX_WORKERS),
+    rate_limit=_get("GLPI_RATE_LIMIT", glpi_client.RATE_LIMIT),
+    retries=_get("GLPI_RETRIES", glpi_client.RETRIES),
+)
 
 
 # ----------------------------------------------------------
 # HELPERS
 # ----------------------------------------------------------
-def parse_amount(v):
-    if pd.isna(v):
-        return 0.0
-    s = str(v).strip()
-    s = re.sub(r"[^\d,.\-]", "", s)
-    if s.count(",") == 1 and s.count(".") == 1:
-        if s.find(",") > s.find("."):
-            s = s.replace(".", "").replace(",", ".")
-        else:
-            s = s.replace(",", "")
-    elif s.count(",") == 1:
-        s = s.replace(",", ".")
-    try:
-        return float(s)
-    except:
-        return 0.0
-
-
-def fmt_date(v):
-    """Format a payment date from the Excel into dd/mm/yyyy (European). Falls back to raw text."""
-    if pd.isna(v):
-        return ""
-    if hasattr(v, "strftime"):
-        try:
-            return v.strftime("%d/%m/%Y")
-        except Exception:
-            pass
-    try:
-        ts = pd.to_datetime(v, dayfirst=True, errors="coerce")
-        if pd.notna(ts):
-            return ts.strftime("%d/%m/%Y")
-    except Exception:
-        pass
-    return str(v).strip()
-
-
 def find_col(df, names):
     for c in df.columns:
         clean = c.strip().lower().replace(" ", "").replace(".", "")
@@ -106,227 +82,59 @@ def col_by_letter(df, letter):
     return None
 
 
-def find_cn_combo(pool, used, target, max_combo=3):
-    target = round(abs(target), 2)
-    if target <= 0:
-        return None
-
-    avail = [t for t in pool if t[0] not in used and 0 < t[2] <= target]
-    if not avail:
-        return None
-
-    for entry in avail:
-        if entry[2] == target:
-            return [entry]
-    if max_combo < 2:
-        return None
-
-    n = len(avail)
-    for i in range(n):
-        a = avail[i][2]
-        for j in range(i + 1, n):
-            if round(a + avail[j][2], 2) == target:
-                return [avail[i], avail[j]]
-    if max_combo < 3:
-        return None
-
-    for size in range(3, min(max_combo, len(avail)) + 1):
-        for combo in combinations(avail, size):
-            if round(sum(c[2] for c in combo), 2) == target:
-                return list(combo)
-    return None
-
-
-def safe_json(resp):
-    try:
-        return resp.json()
-    except Exception:
-        return None
+def find_cn_combo(index, used, target, max_combo=6, tolerance=0.0, vendor=None, date=None):
+    """Smallest set of unused CNs covering |target|, searched only in the
+    vendor/date partition of the payment (integer-cents engine, see cn_matching.py)."""
+    return index.find(target, used, max_combo=max_combo, tolerance=tolerance,
+                      vendor=vendor, date=date)
 
 
-def _body_no_total(rows):
-    """Return rows without any TOTAL line, with clean numeric Invoice Value."""
-    body = rows[rows["Alt. Document"].astype(str) != "TOTAL"].copy()
-    body["Alt. Document"] = body["Alt. Document"].fillna("").astype(str)
-    body["Invoice Value"] = pd.to_numeric(body["Invoice Value"], errors="coerce").fillna(0.0)
-    return body.reset_index(drop=True)
+# per-code pieces are cached on (code, vendor, date, edited rows): editing one
+# table re-renders that code only
+CODE_CACHE_ENTRIES = 2000
 
 
-def build_combined_html(export_data):
-    """Rebuild the HTML summary from (possibly edited) export_data. Totals recomputed."""
-    html = ""
-    for code, info in export_data.items():
-        body = _body_no_total(info["rows"])
-        total_value = body["Invoice Value"].sum()
+@st.cache_data(max_entries=CODE_CACHE_ENTRIES, show_spinner=False)
+def _code_html(code, vendor, pay_date, rows):
+    body = body_no_total(rows)
+    total_value = body["Invoice Value"].sum()
 
-        full = body.copy()
-        full.loc[len(full)] = ["TOTAL", total_value]
+    full = body.copy()
+    full.loc[len(full)] = ["TOTAL", total_value]
 
-        disp = full.copy()
-        disp["Invoice Value (€)"] = disp["Invoice Value"].apply(lambda v: f"€{v:,.2f}")
-        disp = disp[["Alt. Document", "Invoice Value (€)"]]
+    disp = full.copy()
+    disp["Invoice Value (€)"] = disp["Invoice Value"].apply(lambda v: f"€{v:,.2f}")
+    disp = disp[["Alt. Document", "Invoice Value (€)"]]
 
-        pay_date_line = f"<b>Payment Date:</b> {info.get('pay_date','')}<br>" if info.get("pay_date") else ""
-        html += f"""
+    pay_date_line = f"<b>Payment Date:</b> {pay_date}<br>" if pay_date else ""
+    return f"""
 <b>Payment Code:</b> {code}<br>
-<b>Vendor:</b> {info['vendor']}<br>
+<b>Vendor:</b> {vendor}<br>
 {pay_date_line}<b>Total Amount:</b> €{total_value:,.2f}<br><br>
 {disp.to_html(index=False, border=0)}
 <br><hr><br>
 """
+
+
+def build_combined_html(export_data):
+    """Rebuild the HTML summary from (possibly edited) export_data. Totals recomputed."""
+    html = "".join(_code_html(code, info["vendor"], info.get("pay_date", ""), info["rows"])
+                   for code, info in export_data.items())
     if html.endswith("<br><hr><br>"):
         html = html[:-12]
     return html
 
 
-def build_excel_export(export_data):
-    """One sheet per payment code + a combined Summary sheet. Totals recomputed."""
-    buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-        summary_rows = []
-        for code, info in export_data.items():
-            body = _body_no_total(info["rows"])
-            total = body["Invoice Value"].sum()
-            summary_rows.append({
-                "Payment Code": code,
-                "Payment Date": info.get("pay_date", ""),
-                "Vendor": info["vendor"],
-                "Total (€)": total,
-            })
-        if summary_rows:
-            pd.DataFrame(summary_rows).to_excel(writer, sheet_name="Summary", index=False)
-
-        used = set()
-        for code, info in export_data.items():
-            base = re.sub(r'[\\/*?:\[\]]', '_', str(code))[:28] or "Sheet"
-            name, n = base, 1
-            while name in used:
-                n += 1
-                name = f"{base[:25]}_{n}"
-            used.add(name)
-
-            body = _body_no_total(info["rows"])
-            total = body["Invoice Value"].sum()
-            out = body.copy()
-            out.loc[len(out)] = ["TOTAL", total]
-            out.insert(0, "Vendor", info["vendor"])
-            out.insert(0, "Payment Date", info.get("pay_date", ""))
-            out.insert(0, "Payment Code", code)
-            out.to_excel(writer, sheet_name=name, index=False)
-    return buf.getvalue()
+# per-code sheet arrays, written out by payment_export's streaming writer
+_code_sheet = st.cache_data(max_entries=CODE_CACHE_ENTRIES, show_spinner=False)(code_sheet)
 
 
-# ----------------------------------------------------------
-# GLPI FUNCTIONS — HARDENED
-# ----------------------------------------------------------
-def glpi_login():
-    if not GLPI_URL or not APP_TOKEN or not USER_TOKEN:
-        return None, (
-            "Missing GLPI credentials. Check your Streamlit secrets / .env:\n"
-            f"- GLPI_URL set:   {bool(GLPI_URL)}\n"
-            f"- APP_TOKEN set:  {bool(APP_TOKEN)}\n"
-            f"- USER_TOKEN set: {bool(USER_TOKEN)}"
-        )
-    try:
-        r = requests.get(
-            f"{GLPI_URL}/initSession",
-            headers={
-                "Authorization": f"user_token {USER_TOKEN}",
-                "App-Token": APP_TOKEN,
-                "Content-Type": "application/json",
-            },
-            timeout=20,
-        )
-    except requests.RequestException as e:
-        return None, f"Network error contacting GLPI: {e}"
-    data = safe_json(r)
-    if isinstance(data, list):
-        return None, f"GLPI rejected login: {data}"
-    if not isinstance(data, dict):
-        return None, f"Unexpected GLPI response (status {r.status_code}). Body: {r.text[:300]}"
-    token = data.get("session_token")
-    if not token:
-        return None, f"GLPI response had no session_token. Body: {data}"
-    return token, None
-
-
-def glpi_update_ticket(token, ticket_id, status=5, category_id=None):
-    payload = {"input": {"id": int(ticket_id), "status": int(status),
-                         "users_id_lastupdater": DEFAULT_USER_ID,
-                         "users_id_recipient": DEFAULT_USER_ID}}
-    if category_id:
-        payload["input"]["itilcategories_id"] = int(category_id)
-    return requests.put(f"{GLPI_URL}/Ticket/{ticket_id}", json=payload,
-                        headers={"Session-Token": token, "App-Token": APP_TOKEN}, timeout=20)
-
-
-def glpi_assign_ticket(token, ticket_id, user_id=DEFAULT_USER_ID):
-    """Add the user as the 'Assigned to' technician WITHOUT touching the existing
-    requester / observer actors.
-
-    Uses ONLY Ticket_User type=2 (POST /Ticket_User) — this INSERTS one assignee
-    row and leaves every other actor alone. We deliberately do NOT use the GLPI 10
-    `_actors` PUT: that replaces the whole actor set and wipes requester/observers.
-
-    Returns True if the assignee was added (or already existed)."""
-    try:
-        r = requests.post(
-            f"{GLPI_URL}/Ticket_User",
-            json={"input": {"tickets_id": int(ticket_id), "users_id": int(user_id), "type": 2}},
-            headers={"Session-Token": token, "App-Token": APP_TOKEN}, timeout=20,
-        )
-        # 'already exists' (400) still means the user is assigned — treat as success.
-        return (r.status_code < 400) or ("already" in (r.text or "").lower())
-    except Exception:
-        return False
-
-
-def glpi_add_solution(token, ticket_id, html):
-    payload = {"input": {"itemtype": "Ticket", "items_id": int(ticket_id),
-                         "users_id": DEFAULT_USER_ID, "users_id_recipient": DEFAULT_USER_ID,
-                         "content": html, "solutiontypes_id": 10, "status": 5}}
-    return requests.post(f"{GLPI_URL}/ITILSolution", json=payload,
-                         headers={"Session-Token": token, "App-Token": APP_TOKEN}, timeout=20)
-
-
-def glpi_add_followup(token, ticket_id, html):
-    payload = {"input": {"itemtype": "Ticket", "items_id": int(ticket_id),
-                         "users_id": DEFAULT_USER_ID, "users_id_recipient": DEFAULT_USER_ID,
-                         "content": html}}
-    return requests.post(f"{GLPI_URL}/Ticket/{ticket_id}/ITILFollowup", json=payload,
-                         headers={"Session-Token": token, "App-Token": APP_TOKEN}, timeout=20)
-
-
-def glpi_kill_session(token):
-    try:
-        requests.get(f"{GLPI_URL}/killSession",
-                     headers={"Session-Token": token, "App-Token": APP_TOKEN}, timeout=10)
-    except Exception:
-        pass
-
-
-def glpi_send_one(token, ticket_id, html_message, category_id):
-    """Update one ticket + assign to Angelos + post the solution
-    (falls back to follow-up if already solved). Returns a short result string."""
-    try:
-        upd = glpi_update_ticket(token, ticket_id, 5, category_id)
-        upd_warn = "" if upd.status_code < 400 else f" (update {upd.status_code})"
-
-        # always assign the ticket to Angelos — robust across GLPI 9.x / 10.x
-        assigned = glpi_assign_ticket(token, ticket_id, DEFAULT_USER_ID)
-        assign_note = "" if assigned else " (assign?)"
-
-        resp = glpi_add_solution(token, ticket_id, html_message)
-        if resp.status_code == 400 or "already solved" in (resp.text or "").lower():
-            fu = glpi_add_followup(token, ticket_id, html_message)
-            if fu.status_code >= 400:
-                return f"❌ Follow-up failed ({fu.status_code})" + upd_warn + assign_note
-            return "⚠️ Already solved — follow-up posted" + upd_warn + assign_note
-        if resp.status_code >= 400:
-            return f"❌ Solution failed ({resp.status_code})" + upd_warn + assign_note
-        return "✅ Solution added" + upd_warn + assign_note
-    except Exception as e:
-        return f"❌ Error: {e}"
+def build_excel_export(export_data):
+    """One sheet per payment code + a combined Summary sheet. Totals recomputed."""
+    return write_excel_export([
+        (code, _code_sheet(code, info["vendor"], info.get("pay_date", ""), info["rows"]))
+        for code, info in export_data.items()
+    ])
 
 
 # ----------------------------------------------------------
@@ -345,7 +153,9 @@ with st.sidebar:
     st.write(f"**USER_TOKEN:** {_mask(USER_TOKEN)}")
 
     if st.button("Test GLPI login"):
-        tok, err = glpi_login()
+        # reuses the process-wide session while it is alive — no initSession per click
+        cached = glpi_session_info()
+        tok, err = glpi_session()
         if err:
             st.error(err)
             st.info(
@@ -356,12 +166,172 @@ with st.sidebar:
                 "`USER_TOKEN = \"...\"` (no trailing spaces).\n"
                 "4. Save → app reboots → press Test again."
             )
+        elif cached:
+            st.success(f"✅ Login OK — reusing the GLPI session opened {cached['age_s'] / 60:.0f} min ago.")
         else:
             st.success("✅ Login OK — tokens are valid.")
-            glpi_kill_session(tok)
 
     st.caption("Tokens come from Streamlit **Secrets** / .env — never stored in the code.")
 
+    with st.expander("⚙️ Bulk send speed"):
+        # per-session: passed to each send, never written back into glpi_client
+        glpi_workers = st.slider("Tickets in parallel", 1, 16, glpi_client.MAX_WORKERS)
+        glpi_rate = st.number_input(
+            "Max GLPI calls per second (0 = unlimited)",
+            min_value=0.0, max_value=100.0, value=float(glpi_client.RATE_LIMIT), step=1.0,
+        )
+        glpi_retries = st.number_input("Retries per call on 5xx / timeouts", 0, 10, glpi_client.RETRIES)
+        glpi_batch = st.checkbox(
+            "Batch API calls (one request per step for many tickets)", value=True,
+            help="Status, assignment, solution and follow-up are each sent as one "
+                 "array call per batch instead of one call per ticket.",
+        )
+        glpi_batch_size = st.slider("Tickets per batch", 5, 200, glpi_client.BATCH_SIZE, step=5,
+                                    disabled=not glpi_batch)
+        glpi_preflight = st.checkbox(
+            "Check ticket states first", value=True,
+            help="Two search calls per 100 tickets fetch their status and whether you are already "
+                 "assigned: solved ones go straight to a follow-up, closed and unknown ones are skipped.",
+        )
+        glpi_resend_done = st.checkbox(
+            "Send again to tickets that already got this message", value=False,
+            help="Normally a ticket that already got the exact same message (in any earlier send) "
+                 "is left out, so a refresh or double click never posts it twice. Tick this for a "
+                 "deliberate re-send, e.g. after a ticket was reopened.",
+        )
+
+
+def run_bulk_send(ticket_ids, html_message, category_id, batch_id=None, resend_interrupted=False,
+                  attachment=None):
+    """Post html_message to every ticket (several in parallel) with a live
+    progress bar + results table, then the summary and CSV download.
+
+    Every ticket goes through the send journal: tickets that already got this
+    message are not sent again (unless the sidebar asks for a re-send), and
+    `batch_id` resumes a stopped batch.
+
+    attachment=(filename, bytes, mime) is kept with the batch in the journal,
+    uploaded to GLPI once and linked to every ticket of the batch that got
+    the message — a resumed batch attaches the file it was started with."""
+    _, err = glpi_session()
+    if err:
+        st.error(err)
+        st.stop()
+
+    batch = send_journal.journal.open_batch(ticket_ids, html_message, category_id, batch_id,
+                                            resend_done=glpi_resend_done and batch_id is None,
+                                            attachment=attachment)
+    attachment = batch.attachment
+    if resend_interrupted:
+        batch.retry_interrupted()
+    results = [{"Ticket": t, "Result": f"{r} (earlier run)"} for t, r in batch.done.items()]
+    results += [{"Ticket": t, "Result": "⏭️ Outcome unknown in an earlier run — not re-sent"}
+                for t in batch.interrupted]
+    if batch.done:
+        st.info(f"{len(batch.done)} ticket(s) already got this message in an earlier run, or GLPI refused it "
+                "for good — not sent again (tick *Send again to tickets that already got this message* "
+                "in the sidebar to re-send).")
+    if batch.interrupted:
+        st.warning(
+            f"{len(batch.interrupted)} ticket(s) were being sent when a run stopped or got no clear answer "
+            f"from GLPI ({', '.join(batch.interrupted)}). GLPI may already have them, so they are not "
+            "re-sent — use **Resume last batch** with *re-send in-flight tickets* to include them."
+        )
+    to_send = batch.todo
+
+    plan = None
+    if glpi_preflight and to_send:
+        with st.spinner("Checking ticket states in GLPI …"):
+            plan, perr = glpi_plan(None, to_send)
+        if perr:
+            st.warning(f"Pre-flight check failed — sending without it. {perr}")
+        else:
+            actions = [plan[t]["action"] for t in to_send]
+            st.info(
+                f"Plan — 🟢 {actions.count('solve')} solve · 🟡 {actions.count('followup')} follow-up · "
+                f"⏭️ {actions.count('skip')} skip (closed) · ❌ {actions.count('not found')} not found"
+            )
+            with st.expander("Plan per ticket"):
+                st.dataframe(pd.DataFrame([{
+                    "Ticket": t,
+                    "Status": glpi_client.TICKET_STATUS.get(plan[t]["status"], plan[t]["status"] or ""),
+                    "Already assigned": plan[t]["assigned"],
+                    "Plan": plan[t]["action"],
+                } for t in to_send]), use_container_width=True)
+
+    total = len(ticket_ids)
+    progress = st.progress(len(results) / total)
+    status_box = st.empty()
+    table_box = st.empty()
+    # token=None → cached process-wide session (re-login on 401 is automatic);
+    # the journal is updated from the worker threads as each ticket finishes
+    speed = dict(workers=glpi_workers, rate_limit=glpi_rate, retries=glpi_retries)
+    if glpi_batch:
+        sender = glpi_send_batched(None, to_send, html_message, category_id,
+                                   batch_size=glpi_batch_size, plan=plan, journal=batch, **speed)
+    else:
+        sender = glpi_send_many(None, to_send, html_message, category_id, plan=plan, journal=batch, **speed)
+    for tid, res in sender:
+        results.append({"Ticket": tid, "Result": res})
+        progress.progress(len(results) / total)
+        status_box.write(f"Processed ticket {tid}  ({len(results)}/{total}) …")
+        table_box.dataframe(pd.DataFrame(results), use_container_width=True)
+
+    # every ticket of the batch that got the message — earlier runs of a resumed batch too
+    posted = batch.sent() if attachment else []
+    if posted:
+        filename, data, mime = attachment
+        doc_id, derr = batch.document, None
+        if doc_id is None:
+            status_box.write(f"Uploading {filename} ({len(data) / 1024:.0f} KB) once …")
+            doc_id, derr = glpi_upload_document(None, filename, data, mime)
+            if not derr:
+                batch.set_document(doc_id)
+        if derr:
+            st.warning(f"Attachment not added: {derr}")
+        else:
+            linked = {}
+            progress.progress(0.0)
+            for tid, ok_link in glpi_link_document_many(None, doc_id, posted, **speed):
+                linked[tid] = ok_link
+                progress.progress(len(linked) / len(posted))
+                status_box.write(f"Attaching {filename} to ticket {tid}  ({len(linked)}/{len(posted)}) …")
+            for r in results:
+                if r["Ticket"] in linked:
+                    r["Attachment"] = "📎 linked" if linked[r["Ticket"]] else "❌ link failed"
+            n_bad = sum(1 for v in linked.values() if not v)
+            (st.warning if n_bad else st.info)(
+                f"📎 {filename} in GLPI once (document {doc_id}) and linked to "
+                f"{len(linked) - n_bad}/{len(linked)} ticket(s)."
+            )
+        progress.progress(1.0)
+
+    status_box.empty()
+    # back to the order the tickets were pasted in
+    order = {tid: n for n, tid in enumerate(ticket_ids)}
+    res_df = pd.DataFrame(sorted(results, key=lambda r: order[r["Ticket"]]))
+    table_box.dataframe(res_df, use_container_width=True)
+
+    ok   = sum(1 for r in results if r["Result"].startswith("✅"))
+    unk  = sum(1 for r in results if r["Result"].startswith(OUTCOME_UNKNOWN))
+    warn = sum(1 for r in results if r["Result"].startswith("⚠️")) - unk
+    skip = sum(1 for r in results if r["Result"].startswith("⏭️"))
+    bad  = sum(1 for r in results if r["Result"].startswith("❌"))
+    line = f"Done — ✅ {ok} solved · ⚠️ {warn} follow-up · ⏭️ {skip} skipped · ❌ {bad} failed  (of {total})."
+    if unk:
+        line += f" ⚠️ {unk} with unknown outcome (GLPI may have stored them) — check those tickets before re-sending."
+    if bad == 0 and unk == 0:
+        st.success(line)
+    else:
+        st.warning(line + " See table above.")
+
+    st.download_button(
+        "⬇️ Download results CSV",
+        res_df.to_csv(index=False).encode("utf-8"),
+        file_name="glpi_bulk_results.csv",
+        mime="text/csv",
+    )
+
 
 # ----------------------------------------------------------
 # MODE SELECTOR
@@ -372,6 +342,29 @@ app_mode = st.radio(
     horizontal=True,
 )
 
+# ---- resume a bulk send that stopped half-way (refresh, dropped session) ----
+last_batch = send_journal.journal.last_unfinished()
+if last_batch:
+    counts = last_batch["counts"]
+    started = time.strftime("%d/%m %H:%M", time.localtime(last_batch["created"]))
+    with st.expander(f"⏯️ Unfinished bulk send from {started} — "
+                     f"{counts.get('done', 0)}/{len(last_batch['tickets'])} tickets done"):
+        st.write(
+            f"Not sent yet: **{counts.get('pending', 0)}** · failed: **{counts.get('failed', 0)}** · "
+            f"skipped: **{counts.get('skipped', 0)}** · rejected: **{counts.get('rejected', 0)}** · "
+            f"in flight / outcome unknown: **{counts.get('sending', 0) + counts.get('unknown', 0)}**"
+        )
+        st.markdown(last_batch["html"], unsafe_allow_html=True)
+        if last_batch["attachment"]:
+            st.caption(f"📎 {last_batch['attachment']} is attached to every ticket the batch reaches.")
+        resend_inflight = st.checkbox(
+            "Re-send in-flight tickets too (GLPI may already have them)", value=False,
+            disabled=not (counts.get("sending") or counts.get("unknown")),
+        )
+        if st.button("⏯️ Resume last batch"):
+            run_bulk_send(last_batch["tickets"], last_batch["html"], last_batch["category"] or None,
+                          batch_id=last_batch["batch_id"], resend_interrupted=resend_inflight)
+
 # ==========================================================
 # MODE 1: BULK EMAIL — write your own message, post to many tickets
 #         (no Excel required — this is the standalone bulk sender)
@@ -434,46 +427,88 @@ if app_mode.startswith("✉️"):
     )
 
     if st.button("🚀 Send to GLPI", disabled=not (ticket_ids and has_body and confirm)):
-        token, err = glpi_login()
-        if err:
-            st.error(err)
-            st.stop()
-
-        results = []
-        total = len(ticket_ids)
-        progress = st.progress(0.0)
-        status_box = st.empty()
-        try:
-            for i, tid in enumerate(ticket_ids):
-                status_box.write(f"Processing ticket {tid}  ({i + 1}/{total}) …")
-                res = glpi_send_one(token, tid, html_message, category_id)
-                results.append({"Ticket": tid, "Result": res})
-                progress.progress((i + 1) / total)
-        finally:
-            glpi_kill_session(token)
-
-        status_box.empty()
-        res_df = pd.DataFrame(results)
-        st.dataframe(res_df, use_container_width=True)
-
-        ok   = sum(1 for r in results if r["Result"].startswith("✅"))
-        warn = sum(1 for r in results if r["Result"].startswith("⚠️"))
-        bad  = sum(1 for r in results if r["Result"].startswith("❌"))
-        line = f"Done — ✅ {ok} solved · ⚠️ {warn} follow-up · ❌ {bad} failed  (of {total})."
-        (st.success if bad == 0 else st.warning)(line)
-
-        st.download_button(
-            "⬇️ Download results CSV",
-            res_df.to_csv(index=False).encode("utf-8"),
-            file_name="glpi_bulk_results.csv",
-            mime="text/csv",
-        )
+        run_bulk_send(ticket_ids, html_message, category_id)
 
     st.stop()  # bulk-email mode ends here — payment flow below does not run
 
 # ==========================================================
 # MODE 2: PAYMENT ANALYSIS  (original flow)
 # ==========================================================
+# ----------------------------------------------------------
+# CACHED LOADERS — keyed by the upload's content hash (+ the column choices),
+# so widget reruns reuse the parsed data instead of re-reading the Excel.
+# Arguments starting with "_" are not hashed by Streamlit: the digest stands
+# in for them.
+# ----------------------------------------------------------
+UPLOAD_CACHE_ENTRIES = 8
+
+
+def file_digest(uploaded):
+    return hashlib.sha1(uploaded.getvalue()).hexdigest()
+
+
+@st.cache_data(max_entries=UPLOAD_CACHE_ENTRIES, show_spinner="Reading Excel …")
+def read_upload(digest, _data):
+    """Excel bytes → DataFrame with stripped, de-duplicated headers."""
+    frame = pd.read_excel(io.BytesIO(_data))
+    frame.columns = [c.strip() for c in frame.columns]
+    return frame.loc[:, ~frame.columns.duplicated()]
+
+
+@st.cache_data(max_entries=UPLOAD_CACHE_ENTRIES, show_spinner=False)
+def build_payment_index(digest, _df, pay_doc_col, inv_col, payv_col, alt_col, vendor_col, paydate_col):
+    """Group rows by payment code and parse amounts ONCE per file + columns."""
+    groups = _df.groupby(_df[pay_doc_col].astype(str), sort=False).indices   # code -> row positions
+    return (
+        groups,
+        parse_amounts(_df[inv_col]).to_numpy(),
+        parse_amounts(_df[payv_col]).to_numpy(),
+        _df[alt_col].astype(str).to_numpy(),
+        _df[vendor_col] if vendor_col else None,
+        _df[paydate_col] if paydate_col else None,
+    )
+
+
+CN_KEYWORDS = (
+    "credit note", "credit", "nota credito", "nota de credito",
+    "nota crédito", "nota de crédito", "abono", "ncr", "n/c", "cn"
+)
+
+
+@st.cache_data(max_entries=UPLOAD_CACHE_ENTRIES, show_spinner="Building the CN pool …")
+def build_cn_pool(digest, _cn_df, cn_alt, cn_credit, cn_charge, cn_reason, cn_vendor, cn_date):
+    """→ (cn_pool, cn_vendors, cn_dates, skipped_no_reason) for these column choices."""
+    credit = parse_amounts(_cn_df[cn_credit]) if cn_credit else None
+    charge = parse_amounts(_cn_df[cn_charge]) if cn_charge else None
+
+    cn_pool = []
+    cn_vendors, cn_dates = [], []
+    skipped_no_reason = 0
+    for i in _cn_df.index:
+        if cn_reason:
+            reason = str(_cn_df.at[i, cn_reason] or "").lower()
+            if not any(k in reason for k in CN_KEYWORDS):
+                skipped_no_reason += 1
+                continue
+
+        val = 0.0
+        if cn_credit:
+            val = float(credit.at[i])
+        if val == 0 and cn_charge:
+            val = float(charge.at[i])
+        if val == 0:
+            continue
+
+        doc = str(_cn_df.at[i, cn_alt])
+        cn_pool.append((int(i), doc, round(abs(val), 2)))
+        if cn_vendor:
+            cn_vendors.append(_cn_df.at[i, cn_vendor])
+        if cn_date:
+            ts = pd.to_datetime(_cn_df.at[i, cn_date], dayfirst=True, errors="coerce")
+            cn_dates.append(None if pd.isna(ts) else ts)
+    return cn_pool, cn_vendors, cn_dates, skipped_no_reason
+
+
 # ----------------------------------------------------------
 # INPUT FILES
 # ----------------------------------------------------------
@@ -484,9 +519,8 @@ if not pay_file:
     st.info("Upload Payment Excel to start.")
     st.stop()
 
-df = pd.read_excel(pay_file)
-df.columns = [c.strip() for c in df.columns]
-df = df.loc[:, ~df.columns.duplicated()]
+pay_digest = file_digest(pay_file)
+df = read_upload(pay_digest, pay_file.getvalue())
 
 pay_input = st.text_input("Enter Payment Document Codes (comma separated):")
 if not pay_input.strip():
@@ -515,16 +549,29 @@ paydate_col = find_col(df, [
     "Fecha", "Date",
 ])
 
+# ----------------------------------------------------------
+# PAYMENT INDEX — group rows by code and parse amounts ONCE
+# ----------------------------------------------------------
+(pay_groups, pay_inv_vals, pay_pay_vals, pay_alt_docs,
+ pay_vendors, pay_dates) = build_payment_index(pay_digest, df, pay_doc_col, inv_col, payv_col,
+                                               alt_col, vendor_col, paydate_col)
+
 # ----------------------------------------------------------
 # CREDIT NOTES — load and pre-build pool ONCE
 # ----------------------------------------------------------
 cn_df = None
 cn_pool = None
-cn_alt = cn_credit = cn_charge = cn_reason = None
+cn_index = None
+MAX_COMBO = 6          # combine up to 6 CNs to cover a single invoice diff
+cn_tolerance = 0.0     # € slack accepted when summing CNs
+cn_global_assign = True   # assign CNs across all invoices, not first-fit per row
+cn_assign_budget = 3.0    # seconds for the global assignment before falling back
+cn_by_vendor = True       # only match CNs of the payment's own vendor
+cn_window_days = 365      # CN document date within ± this many days of the payment (0 = off)
+cn_alt = cn_credit = cn_charge = cn_reason = cn_vendor = cn_date = None
 if cn_file:
-    cn_df = pd.read_excel(cn_file)
-    cn_df.columns = [c.strip() for c in cn_df.columns]
-    cn_df = cn_df.loc[:, ~cn_df.columns.duplicated()]
+    cn_digest = file_digest(cn_file)
+    cn_df = read_upload(cn_digest, cn_file.getvalue())
 
     cn_alt = find_col(cn_df, [
         "AltDocument", "Alt.Document", "Alt. Document",
@@ -539,13 +586,19 @@ if cn_file:
         "Description", "Descripcion", "Descripción",
         "Concept", "Concepto"
     ])
+    cn_vendor = find_col(cn_df, ["Vendor", "SupplierName", "Supplier", "Proveedor"])
+    cn_date = find_col(cn_df, [
+        "DocumentDate", "Document Date", "DocDate", "InvoiceDate",
+        "FechaDocumento", "Fecha Documento", "Fecha Factura", "Fecha", "Date",
+    ])
 
     with st.expander("🔧 Credit Notes — column override",
                      expanded=(cn_alt is None or (cn_credit is None and cn_charge is None))):
         st.write("**Columns in CN file:**", list(cn_df.columns))
         st.write(
             f"Auto-detected — document: `{cn_alt}` | "
-            f"credit: `{cn_credit}` | charge: `{cn_charge}` | reason: `{cn_reason}`"
+            f"credit: `{cn_credit}` | charge: `{cn_charge}` | reason: `{cn_reason}` | "
+            f"vendor: `{cn_vendor}` | date: `{cn_date}`"
         )
 
         c1, c2 = st.columns(2)
@@ -555,6 +608,11 @@ if cn_file:
         with c2:
             letter_charge = st.text_input("Charge column (letter)", "E")
             letter_reason = st.text_input("Reason column (letter)", "G")
+        c3, c4 = st.columns(2)
+        with c3:
+            letter_vendor = st.text_input("Vendor column (letter)", "")
+        with c4:
+            letter_date   = st.text_input("Document date column (letter)", "")
 
         if letter_alt:
             r = col_by_letter(cn_df, letter_alt)
@@ -572,128 +630,225 @@ if cn_file:
             r = col_by_letter(cn_df, letter_reason)
             if r: cn_reason = r
             else: st.error(f"Letter '{letter_reason}' out of range for reason.")
+        if letter_vendor:
+            r = col_by_letter(cn_df, letter_vendor)
+            if r: cn_vendor = r
+            else: st.error(f"Letter '{letter_vendor}' out of range for vendor.")
+        if letter_date:
+            r = col_by_letter(cn_df, letter_date)
+            if r: cn_date = r
+            else: st.error(f"Letter '{letter_date}' out of range for date.")
 
     if cn_alt and (cn_credit or cn_charge):
-        if cn_credit: cn_df[cn_credit] = cn_df[cn_credit].apply(parse_amount)
-        if cn_charge: cn_df[cn_charge] = cn_df[cn_charge].apply(parse_amount)
-
-        CN_KEYWORDS = (
-            "credit note", "credit", "nota credito", "nota de credito",
-            "nota crédito", "nota de crédito", "abono", "ncr", "n/c", "cn"
-        )
-
-        cn_pool = []
-        skipped_no_reason = 0
-        for i in cn_df.index:
-            if cn_reason:
-                reason = str(cn_df.at[i, cn_reason] or "").lower()
-                if not any(k in reason for k in CN_KEYWORDS):
-                    skipped_no_reason += 1
-                    continue
-
-            val = 0.0
-            if cn_credit:
-                val = parse_amount(cn_df.at[i, cn_credit])
-            if val == 0 and cn_charge:
-                val = parse_amount(cn_df.at[i, cn_charge])
-            if val == 0:
-                continue
-
-            doc = str(cn_df.at[i, cn_alt])
-            cn_pool.append((int(i), doc, round(abs(val), 2)))
+        cn_pool, cn_vendors, cn_dates, skipped_no_reason = build_cn_pool(
+            cn_digest, cn_df, cn_alt, cn_credit, cn_charge, cn_reason, cn_vendor, cn_date)
 
         msg = (
             f"CN matching enabled — {len(cn_pool)} CNs loaded "
             f"(document=`{cn_alt}`, credit=`{cn_credit}`, "
-            f"charge=`{cn_charge}`, reason=`{cn_reason}`)."
+            f"charge=`{cn_charge}`, reason=`{cn_reason}`, "
+            f"vendor=`{cn_vendor}`, date=`{cn_date}`)."
         )
         if cn_reason and skipped_no_reason:
             msg += f" Skipped {skipped_no_reason} non-CN rows by Reason."
         st.success(msg)
+
+        with st.expander("⚙️ CN matching settings"):
+            MAX_COMBO = st.slider("Max CNs combined per invoice difference", 1, 8, MAX_COMBO)
+            cn_tolerance = st.number_input(
+                "Tolerance (€) — accept CN combinations within ± this amount",
+                min_value=0.0, max_value=5.0, value=0.0, step=0.01, format="%.2f",
+            )
+            cn_global_assign = st.checkbox(
+                "Optimise CN assignment across all invoices (instead of first-fit per row)",
+                value=cn_global_assign,
+            )
+            cn_assign_budget = st.number_input(
+                "Time budget for the optimisation (s) — remaining rows fall back to first-fit",
+                min_value=0.5, max_value=30.0, value=cn_assign_budget, step=0.5,
+            )
+            if cn_vendor and vendor_col:
+                cn_by_vendor = st.checkbox("Only match CNs of the payment's vendor", value=cn_by_vendor)
+            else:
+                cn_by_vendor = False
+                st.caption("Vendor partitioning off — no vendor column in "
+                           + ("the CN file." if vendor_col else "the payment file."))
+            if cn_date and paydate_col:
+                cn_window_days = st.number_input(
+                    "CN date window (± days around the payment date, 0 = off)",
+                    min_value=0, max_value=3650, value=cn_window_days, step=30,
+                )
+            else:
+                cn_window_days = 0
+
+        cn_index = PartitionedCNIndex(
+            cn_pool,
+            vendors=cn_vendors if cn_by_vendor else None,
+            dates=cn_dates if cn_date else None,
+            window_days=cn_window_days or None,
+        )
     else:
         st.warning("CN matching disabled — set the document and at least one of credit/charge columns above.")
         cn_df = None
 
-cn_used_global = set()
-export_data = {}
-debug_rows_all = []
-
 # ----------------------------------------------------------
-# PROCESS EACH PAYMENT CODE  (builds base rows, NO total yet)
+# MATCHING — memoised on everything it reads: the payment file + columns,
+# the selected codes, the CN pool + columns + partitioning and the matching
+# settings. Editing a table, switching language or typing a message reruns
+# the script but not this (the CN assignment is global across codes, so the
+# selected codes are one key rather than one entry per code). It also keeps
+# a time-budgeted assignment stable across reruns, so edits always apply to
+# the same matched rows.
 # ----------------------------------------------------------
-MAX_COMBO = 3  # combine up to 3 CNs to cover a single invoice diff
-
-for pay_code in selected_codes:
-    subset = df[df[pay_doc_col].astype(str) == str(pay_code)].copy()
-    if subset.empty:
-        continue
-
-    subset[inv_col]  = subset[inv_col].apply(parse_amount)
-    subset[payv_col] = subset[payv_col].apply(parse_amount)
-
-    vendor = subset[vendor_col].iloc[0] if vendor_col else "Unknown Vendor"
-    pay_date = fmt_date(subset[paydate_col].iloc[0]) if paydate_col else ""
-
-    summary_rows = []
-    cn_rows = []
-    unmatched = []
-
-    for _, row in subset.iterrows():
-        inv     = str(row[alt_col])
-        inv_val = float(row[inv_col])
-        pay_val = float(row[payv_col])
-        diff    = round(pay_val - inv_val, 2)
-
-        summary_rows.append({"Alt. Document": inv, "Invoice Value": inv_val})
-
-        dbg = {
-            "Payment Code": str(pay_code),
-            "Payment Date": pay_date,
-            "Vendor": str(vendor),
-            "Alt. Document": inv,
-            "Invoice Value": inv_val,
-            "Payment Value": pay_val,
-            "Difference": diff,
-            "Matched CN(s)": "",
-            "CN Value(s)": "",
-            "CN Count": 0,
-            "Status": "",
-        }
-
-        if abs(diff) < 0.01:
-            dbg["Status"] = "✓ Exact"
-            debug_rows_all.append(dbg)
+@st.cache_data(max_entries=UPLOAD_CACHE_ENTRIES, show_spinner="Matching payments and credit notes …")
+def match_payments(pay_key, codes, cn_key, settings, _pay_index, _cn_index):
+    """→ (export_data, debug_rows_all, cn_assign_stats, cn_partitions) for `codes`.
+    pay_key / cn_key identify _pay_index / _cn_index (None = no CN matching).
+    cn_partitions maps each partition searched to (CNs in it, differences):
+    _cn_index is not part of the cache key, so a cache hit must not read the
+    partitions it builds lazily."""
+    pay_groups, pay_inv_vals, pay_pay_vals, pay_alt_docs, pay_vendors, pay_dates = _pay_index
+    max_combo, cn_tolerance, cn_global_assign, cn_assign_budget = settings
+    cn_index = _cn_index
+    cn_used_global = set()
+    export_data = {}
+    debug_rows_all = []
+    cn_assign_stats = None
+
+    # ----------------------------------------------------------
+    # PROCESS EACH PAYMENT CODE  (builds base rows, NO total yet)
+    # pass 1: collect every invoice difference across all codes
+    # ----------------------------------------------------------
+    code_rows = {}
+    open_diffs = []          # (pay_code, inv, dbg) for every non-zero difference
+    for pay_code in codes:
+        pos = pay_groups.get(str(pay_code))
+        if pos is None:
             continue
 
-        combo = None
-        if cn_pool is not None:
-            combo = find_cn_combo(cn_pool, cn_used_global, diff, max_combo=MAX_COMBO)
+        vendor = pay_vendors.iat[pos[0]] if pay_vendors is not None else "Unknown Vendor"
+        pay_date = fmt_date(pay_dates.iat[pos[0]]) if pay_dates is not None else ""
+        pay_ts = None
+        if pay_dates is not None:
+            pay_ts = pd.to_datetime(pay_dates.iat[pos[0]], dayfirst=True, errors="coerce")
+            pay_ts = None if pd.isna(pay_ts) else pay_ts
+
+        invs     = pay_alt_docs[pos].tolist()
+        inv_vals = pay_inv_vals[pos]
+        pay_vals = pay_pay_vals[pos]
+        diffs    = pay_vals - inv_vals
+        summary_rows = {"Alt. Document": invs, "Invoice Value": inv_vals}
+
+        for inv, inv_val, pay_val, diff in zip(invs, inv_vals.tolist(), pay_vals.tolist(), diffs.tolist()):
+            diff = round(diff, 2)
+            dbg = {
+                "Payment Code": str(pay_code),
+                "Payment Date": pay_date,
+                "Vendor": str(vendor),
+                "Alt. Document": inv,
+                "Invoice Value": inv_val,
+                "Payment Value": pay_val,
+                "Difference": diff,
+                "Matched CN(s)": "",
+                "CN Value(s)": "",
+                "CN Count": 0,
+                "Status": "",
+            }
+            debug_rows_all.append(dbg)
 
+            if abs(diff) < 0.01:
+                dbg["Status"] = "✓ Exact"
+            else:
+                open_diffs.append((pay_code, inv, dbg))
+
+        code_rows[pay_code] = {"vendor": vendor, "pay_date": pay_date, "pay_ts": pay_ts,
+                               "summary": summary_rows, "cn": [], "unmatched": []}
+
+    # ----------------------------------------------------------
+    # pass 2: assign CNs to all differences at once (or first-fit in row order)
+    # ----------------------------------------------------------
+    combos = [None] * len(open_diffs)
+    cn_partitions = {}       # partition key -> positions in open_diffs
+    if cn_index is not None and open_diffs:
+        for n, (pay_code, _, _) in enumerate(open_diffs):
+            rows = code_rows[pay_code]
+            cn_partitions.setdefault(cn_index.key(rows["vendor"], rows["pay_ts"]), []).append(n)
+
+        if cn_global_assign:
+            deadline = time.perf_counter() + cn_assign_budget
+            cn_assign_stats = {"differences": 0, "matched": 0, "solver_matched": 0,
+                               "seconds": 0.0, "timed_out": False}
+            for (v, d), members in cn_partitions.items():
+                part_combos, part_stats = assign_globally(
+                    cn_index.partition(v, d), [open_diffs[n][2]["Difference"] for n in members],
+                    max_combo=max_combo, tolerance=cn_tolerance, used=cn_used_global,
+                    time_budget=max(0.0, deadline - time.perf_counter()),
+                )
+                for n, combo in zip(members, part_combos):
+                    combos[n] = combo
+                    if combo:
+                        cn_used_global.update(idx for idx, _, _ in combo)
+                for k in ("differences", "matched", "solver_matched", "seconds"):
+                    cn_assign_stats[k] += part_stats[k]
+                cn_assign_stats["timed_out"] |= part_stats["timed_out"]
+        else:
+            for n, (pay_code, _, dbg) in enumerate(open_diffs):
+                rows = code_rows[pay_code]
+                combo = find_cn_combo(cn_index, cn_used_global, dbg["Difference"],
+                                      max_combo=max_combo, tolerance=cn_tolerance,
+                                      vendor=rows["vendor"], date=rows["pay_ts"])
+                if combo:
+                    cn_used_global.update(idx for idx, _, _ in combo)
+                combos[n] = combo
+
+    # ----------------------------------------------------------
+    # pass 3: book the matched CNs / adjustments per code
+    # ----------------------------------------------------------
+    for (pay_code, inv, dbg), combo in zip(open_diffs, combos):
+        rows = code_rows[pay_code]
+        diff = dbg["Difference"]
         if combo:
             sign = -1 if diff < 0 else 1
             docs, vals = [], []
-            for idx, doc, amt in combo:
+            for _, doc, amt in combo:
                 signed = sign * amt
-                cn_rows.append({"Alt. Document": f"{doc} (CN)", "Invoice Value": signed})
-                cn_used_global.add(idx)
+                rows["cn"].append({"Alt. Document": f"{doc} (CN)", "Invoice Value": signed})
                 docs.append(doc)
                 vals.append(f"{signed:.2f}")
             dbg["Status"]        = "✓ CN matched" if len(combo) == 1 else f"✓ {len(combo)} CNs combined"
             dbg["Matched CN(s)"] = ", ".join(docs)
             dbg["CN Value(s)"]   = ", ".join(vals)
             dbg["CN Count"]      = len(combo)
+            # within-tolerance match: book the leftover cents so the total still ties out
+            residual = round(abs(diff) - sum(amt for _, _, amt in combo), 2)
+            if abs(residual) >= 0.01:
+                rows["unmatched"].append({"Alt. Document": f"{inv} (Adj. Diff)", "Invoice Value": sign * residual})
+                dbg["Status"] += f" (±{abs(residual):.2f})"
         else:
-            unmatched.append({"Alt. Document": f"{inv} (Adj. Diff)", "Invoice Value": diff})
+            rows["unmatched"].append({"Alt. Document": f"{inv} (Adj. Diff)", "Invoice Value": diff})
             dbg["Status"] = "✗ No CN — adjustment"
 
-        debug_rows_all.append(dbg)
-
-    body = pd.concat(
-        [pd.DataFrame(summary_rows), pd.DataFrame(cn_rows), pd.DataFrame(unmatched)],
-        ignore_index=True,
-    )
-    # store base rows WITHOUT the TOTAL line — totals are recomputed on render/export
-    export_data[pay_code] = {"vendor": vendor, "pay_date": pay_date, "rows": body.copy()}
+    for pay_code, rows in code_rows.items():
+        body = pd.concat(
+            [pd.DataFrame(rows["summary"]), pd.DataFrame(rows["cn"]), pd.DataFrame(rows["unmatched"])],
+            ignore_index=True,
+        )
+        # store base rows WITHOUT the TOTAL line — totals are recomputed on render/export
+        export_data[pay_code] = {"vendor": rows["vendor"], "pay_date": rows["pay_date"], "rows": body.copy()}
+    cn_partitions = {(v, d): (len(cn_index.partition(v, d)), len(members))
+                     for (v, d), members in cn_partitions.items()}
+    return export_data, debug_rows_all, cn_assign_stats, cn_partitions
+
+
+export_data, debug_rows_all, cn_assign_stats, cn_partitions = match_payments(
+    (pay_digest, pay_doc_col, inv_col, payv_col, alt_col, vendor_col, paydate_col),
+    tuple(selected_codes),
+    None if cn_index is None else (cn_digest, cn_alt, cn_credit, cn_charge, cn_reason,
+                                   cn_vendor, cn_date, cn_by_vendor, cn_window_days),
+    (MAX_COMBO, cn_tolerance, cn_global_assign, cn_assign_budget),
+    (pay_groups, pay_inv_vals, pay_pay_vals, pay_alt_docs, pay_vendors, pay_dates),
+    cn_index,
+)
 
 # ----------------------------------------------------------
 # TABS
@@ -714,7 +869,7 @@ with tab1:
             label += f"  ·  {info['pay_date']}"
         st.markdown(label)
 
-        base = _body_no_total(info["rows"])
+        base = body_no_total(info["rows"])
         edited = st.data_editor(
             base,
             num_rows="dynamic",
@@ -743,14 +898,33 @@ with tab1:
         st.markdown(combined_html, unsafe_allow_html=True)
 
     if export_data:
+        # built only when the button is clicked (not on every rerun)
+        export_snapshot = dict(export_data)
         st.download_button(
             "⬇️ Download Payment Analysis (Excel)",
-            data=build_excel_export(export_data),
+            data=lambda: build_excel_export(export_snapshot),
             file_name="payment_analysis.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         )
 
 with tab2:
+    if cn_assign_stats:
+        cs = cn_assign_stats
+        st.caption(
+            f"CN assignment: {cs['matched']}/{cs['differences']} differences covered "
+            f"in {cs['seconds']:.2f}s ({cs['solver_matched']} by the global pass"
+            + (", time budget hit — rest first-fit" if cs["timed_out"] else "") + ")."
+        )
+    if cn_partitions:
+        with st.expander(f"CN partitions searched ({len(cn_partitions)} of "
+                         f"{len(cn_index)} CNs total)"):
+            st.dataframe(pd.DataFrame([
+                {"Vendor": v if v is not None else "(all vendors)",
+                 "Payment Date": d.strftime("%d/%m/%Y") if d is not None else "(any date)",
+                 "CNs in partition": n_cns,
+                 "Differences": n_diffs}
+                for (v, d), (n_cns, n_diffs) in cn_partitions.items()
+            ]), width="stretch")
     if debug_rows_all:
         dbg_df = pd.DataFrame(debug_rows_all)
         for c in ["Payment Code", "Payment Date", "Vendor", "Alt. Document",
@@ -825,40 +999,15 @@ with tab3:
         disabled=not ticket_ids,
     )
 
-    if st.button("🚀 Send to GLPI", disabled=not (ticket_ids and confirm)):
-        token, err = glpi_login()
-        if err:
-            st.error(err)
-            st.stop()
-
-        results = []
-        total = len(ticket_ids)
-        progress = st.progress(0.0)
-        status_box = st.empty()
-        try:
-            for i, tid in enumerate(ticket_ids):
-                status_box.write(f"Processing ticket {tid}  ({i + 1}/{total}) …")
-                res = glpi_send_one(token, tid, html_message, category_id)
-                results.append({"Ticket": tid, "Result": res})
-                progress.progress((i + 1) / total)
-        finally:
-            glpi_kill_session(token)
-
-        status_box.empty()
-        res_df = pd.DataFrame(results)
-        st.dataframe(res_df, use_container_width=True)
-
-        ok   = sum(1 for r in results if r["Result"].startswith("✅"))
-        warn = sum(1 for r in results if r["Result"].startswith("⚠️"))
-        bad  = sum(1 for r in results if r["Result"].startswith("❌"))
-        if bad == 0:
-            st.success(f"Done — ✅ {ok} solved · ⚠️ {warn} follow-up · ❌ {bad} failed  (of {total}).")
-        else:
-            st.warning(f"Done — ✅ {ok} solved · ⚠️ {warn} follow-up · ❌ {bad} failed  (of {total}). See table above.")
+    attach_excel = st.checkbox(
+        "📎 Attach the payment analysis Excel (uploaded once, linked to every ticket)",
+        value=not msg_mode.startswith("Custom"),
+        disabled=not export_data,
+    )
 
-        st.download_button(
-            "⬇️ Download results CSV",
-            res_df.to_csv(index=False).encode("utf-8"),
-            file_name="glpi_bulk_results.csv",
-            mime="text/csv",
-        )
+    if st.button("🚀 Send to GLPI", disabled=not (ticket_ids and confirm)):
+        attachment = None
+        if attach_excel and export_data:
+            attachment = ("payment_analysis.xlsx", build_excel_export(export_data),
+                          "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        run_bulk_send(ticket_ids, html_message, category_id, attachment=attachment)
@@ -11,6 +11,7 @@ from openpyxl.utils import get_column_letter
 from openpyxl.styles import PatternFill, Font, Alignment
 from difflib import SequenceMatcher
 import numpy as np
+from parsing import normalize_dates, normalize_numbers
 
 # ==================== PAGE CONFIG & CSS ======================
 st.set_page_config(page_title="ReconRaptor — Vendor Reconciliation", layout="wide")
@@ -59,47 +60,6 @@ st.markdown("<p style='text-align: center; font-size: 1.3rem; color: #555;'>Inte
 def fuzzy_ratio(a, b):
     return SequenceMatcher(None, str(a), str(b)).ratio()
 
-def normalize_number(v):
-    if pd.isna(v) or str(v).strip() == "":
-        return 0.0
-    s = re.sub(r"[^\d,.\-]", "", str(v).strip())
-    if s.count(",") == 1 and s.count(".") == 1:
-        if s.find(",") > s.find("."):
-            s = s.replace(".", "").replace(",", ".")
-        else:
-            s = s.replace(",", "")
-    elif s.count(",") == 1:
-        s = s.replace(",", ".")
-    elif s.count(".") > 1:
-        s = s.replace(".", "", s.count(".") - 1)
-    try:
-        return float(s)
-    except:
-        return 0.0
-
-def normalize_date(v):
-    if pd.isna(v) or str(v).strip() == "":
-        return ""
-    s = str(v).strip().replace(".", "/").replace("-", "/").replace(",", "/")
-    for fmt in [
-        "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y",
-        "%m/%d/%Y", "%m-%d-%Y",
-        "%Y/%m/%d", "%Y-%m-%d",
-        "%d/%m/%y", "%d-%m-%y", "%d.%m.%y",
-        "%m/%d/%y", "%m-%d-%y",
-        "%Y.%m.%d",
-    ]:
-        try:
-            d = pd.to_datetime(s, format=fmt, errors="coerce")
-            if not pd.isna(d):
-                return d.strftime("%Y-%m-%d")
-        except:
-            continue
-    d = pd.to_datetime(s, errors="coerce")
-    if pd.isna(d):
-        d = pd.to_datetime(s, errors="coerce")
-    return d.strftime("%Y-%m-%d") if not pd.isna(d) else ""
-
 def clean_invoice_code(v):
     if not v:
         return ""
@@ -147,7 +107,7 @@ def normalize_columns(df, tag):
 
     # Normalize date column
     if f"date_{tag}" in out.columns:
-        out[f"date_{tag}"] = out[f"date_{tag}"].apply(normalize_date)
+        out[f"date_{tag}"] = normalize_dates(out[f"date_{tag}"])
 
     st.write(f"✅ Normalized {tag.upper()} columns:", list(out.columns))
     return out
@@ -158,10 +118,8 @@ def style(df, css):
 # ==================== MATCHING CORE ==========================
 def match_invoices(erp_df, ven_df):
     # ---- classify invoice type: INV / CN / IGNORE ----
-    def doc_type(row, tag):
+    def doc_type(row, tag, debit, credit):
         txt = (str(row.get(f"reason_{tag}", "")) + " " + str(row.get(f"invoice_{tag}", ""))).lower()
-        debit  = normalize_number(row.get(f"debit_{tag}", 0))
-        credit = normalize_number(row.get(f"credit_{tag}", 0))
         pay_kw = [
             "πληρωμ", "payment", "remittance", "bank transfer",
             "transferencia", "trf", "remesa", "pago", "deposit",
@@ -175,8 +133,14 @@ def match_invoices(erp_df, ven_df):
             return "INV"
         return "UNKNOWN"
 
-    erp_df["__type"] = erp_df.apply(lambda r: doc_type(r, "erp"), axis=1)
-    ven_df["__type"] = ven_df.apply(lambda r: doc_type(r, "ven"), axis=1)
+    # debit/credit parsed once per column; every step below reuses them
+    for df, tag in ((erp_df, "erp"), (ven_df, "ven")):
+        df["__debit"] = normalize_numbers(df[f"debit_{tag}"])
+        df["__credit"] = normalize_numbers(df[f"credit_{tag}"])
+        df["__type"] = [
+            doc_type(r, tag, d, c)
+            for r, d, c in zip(df.to_dict("records"), df["__debit"], df["__credit"])
+        ]
 
     # 🚫 Exclude payments before consolidation
     erp_df = erp_df[erp_df["__type"].isin(["INV", "CN"])].copy()
@@ -192,14 +156,11 @@ def match_invoices(erp_df, ven_df):
                 continue
 
             total = 0.0
-            for _, r in g.iterrows():
-                d = normalize_number(r.get(f"debit_{tag}", 0))
-                c = normalize_number(r.get(f"credit_{tag}", 0))
-
+            for d, c, typ in zip(g["__debit"], g["__credit"], g["__type"]):
                 # Raw amount from ERP/Vendor: debit positive, credit negative
                 raw = d - c
 
-                if r.get("__type") == "CN":
+                if typ == "CN":
                     # Credit notes must ALWAYS reduce the invoice
                     raw = -abs(raw)   # ensure negative
                 else:
@@ -227,19 +188,19 @@ def match_invoices(erp_df, ven_df):
     # --- Ensure __amt always exists ---
     if "__amt" not in erp_df.columns:
         erp_df["__amt"] = (
-            erp_df.get("debit_erp", 0).apply(normalize_number)
-            - erp_df.get("credit_erp", 0).apply(normalize_number)
+            normalize_numbers(erp_df.get("debit_erp", 0))
+            - normalize_numbers(erp_df.get("credit_erp", 0))
         ).abs().round(2)
 
     if "__amt" not in ven_df.columns:
         ven_df["__amt"] = (
-            ven_df.get("debit_ven", 0).apply(normalize_number)
-            - ven_df.get("credit_ven", 0).apply(normalize_number)
+            normalize_numbers(ven_df.get("debit_ven", 0))
+            - normalize_numbers(ven_df.get("credit_ven", 0))
         ).abs().round(2)
 
     # Normalize __amt (final cleanup)
-    erp_df["__amt"] = erp_df["__amt"].apply(lambda x: round(normalize_number(x), 2))
-    ven_df["__amt"] = ven_df["__amt"].apply(lambda x: round(normalize_number(x), 2))
+    erp_df["__amt"] = normalize_numbers(erp_df["__amt"]).map(lambda x: round(x, 2))
+    ven_df["__amt"] = normalize_numbers(ven_df["__amt"]).map(lambda x: round(x, 2))
 
     # 🔹 Exclude payments entirely (keep only invoices & credit notes)
     erp_use = erp_df[erp_df["__type"].isin(["INV", "CN"])].copy()
@@ -345,23 +306,25 @@ def tier3_match(erp_miss, ven_miss):
     e = erp_miss.copy()
     v = ven_miss.copy()
 
+    # dates normalised once per column, not once per (ERP, vendor) pair
+    e_dates = normalize_dates(e["Date"]).tolist() if "Date" in e.columns else [""] * len(e)
+    v_dates = normalize_dates(v["Date"]).tolist() if "Date" in v.columns else [""] * len(v)
+
     matches, used_e, used_v = [], set(), set()
-    for ei, er in e.iterrows():
+    for (ei, er), e_date in zip(e.iterrows(), e_dates):
         if ei in used_e:
             continue
         e_inv = str(er.get("Invoice", ""))
         e_amt = round(float(er.get("Amount", 0.0)), 2)
-        e_date = normalize_date(er.get("Date", "")) if "Date" in er else ""
         e_code = clean_invoice_code(e_inv)
         if not e_date:
             continue
 
-        for vi, vr in v.iterrows():
+        for (vi, vr), v_date in zip(v.iterrows(), v_dates):
             if vi in used_v:
                 continue
             v_inv = str(vr.get("Invoice", ""))
             v_amt = round(float(vr.get("Amount", 0.0)), 2)
-            v_date = normalize_date(vr.get("Date", "")) if "Date" in vr else ""
             v_code = clean_invoice_code(v_inv)
             if not v_date:
                 continue
@@ -419,8 +382,8 @@ def extract_payments(erp_df, ven_df):
         if f"credit_{tag}" not in df.columns:
             df[f"credit_{tag}"] = 0
 
-        df["Debit"]  = df[f"debit_{tag}"].apply(normalize_number)
-        df["Credit"] = df[f"credit_{tag}"].apply(normalize_number)
+        df["Debit"]  = normalize_numbers(df[f"debit_{tag}"])
+        df["Credit"] = normalize_numbers(df[f"credit_{tag}"])
 
         # Base rule: absolute difference
         base_amount = (df["Debit"] - df["Credit"]).abs().round(2)
@@ -444,7 +407,7 @@ def extract_payments(erp_df, ven_df):
 
         fallback_vals = pd.Series(0.0, index=df.index)
         for c in amount_like_cols:
-            vals = df[c].apply(normalize_number).abs()
+            vals = normalize_numbers(df[c]).abs()
             fallback_vals = pd.concat([fallback_vals, vals], axis=1).max(axis=1)
 
         # Pick, in order:
@@ -0,0 +1,458 @@
+# ==========================================================
+# CREDIT-NOTE MATCHING ENGINE (used by The Remitator)
+# Finds the CN(s) whose amounts add up to an invoice difference.
+# Everything runs in integer cents:
+#   1 CN  -> hash lookup by amount           O(1)
+#   2 CNs -> hash two-sum                    O(n)
+#   (with a tolerance, the amounts within ±tol come from two bisects on
+#    the sorted distinct amounts — not one probe per cent of tolerance)
+#   3..k  -> branch-and-bound search with a node budget, then (if the
+#            budget runs out) bounded subset-sum DP on bitsets,
+#            O(n * k * target / 64)
+# PartitionedCNIndex keeps one CNIndex per vendor / date window, so n
+# above is one vendor's CN count, not the whole file's.
+# ==========================================================
+
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+
+DEFAULT_MAX_COMBO = 6
+# DP bitsets are target_cents wide; above this target only the search runs.
+DP_MAX_CENTS = 1_000_000          # 10,000.00 €
+SEARCH_MAX_NODES = 20_000
+DP_BLOCK = 64                     # CNs between DP snapshots
+
+
+def to_cents(v):
+    return int(round(abs(float(v)) * 100))
+
+
+class CNIndex:
+    """Credit-note pool indexed by amount in cents.
+
+    `pool` is the list of (row_index, document, amount) tuples built from the
+    CN file. Matching never mutates the index — pass the set of row indexes
+    already consumed as `used`."""
+
+    def __init__(self, pool):
+        self.entries = list(pool)
+        self.cents = [to_cents(e[2]) for e in self.entries]
+        self.by_cents = defaultdict(list)        # cents -> positions, in pool order
+        for pos, c in enumerate(self.cents):
+            if c > 0:
+                self.by_cents[c].append(pos)
+        self.amounts = sorted(self.by_cents)     # distinct amounts, for range lookups
+
+    def __len__(self):
+        return len(self.entries)
+
+    # ------------------------------------------------------
+    def find(self, target, used=(), max_combo=DEFAULT_MAX_COMBO, tolerance=0.0):
+        """Return the smallest combination of unused CNs summing to |target|
+        (within ±tolerance €), as a list of pool entries, or None.
+
+        Fewer CNs always win; for one and two CNs the earliest match in pool
+        order is returned, like the original pairwise scan."""
+        t_cents = to_cents(target)
+        tol = to_cents(tolerance)
+        if t_cents <= 0 or not self.entries:
+            return None
+        hi = t_cents + tol
+
+        pos = self._single(t_cents, tol, used)
+        if pos is not None:
+            return [self.entries[pos]]
+        if max_combo < 2:
+            return None
+
+        avail = [p for p, c in enumerate(self.cents)
+                 if 0 < c <= hi and self.entries[p][0] not in used]
+        if len(avail) < 2:
+            return None
+
+        pair = self._pair(avail, t_cents, tol, used)
+        if pair:
+            return [self.entries[p] for p in pair]
+        if max_combo < 3 or len(avail) < 3:
+            return None
+
+        k = min(max_combo, len(avail))
+        # a bounded search settles most targets quickly; the DP is the
+        # exhaustive fallback when the search runs out of budget
+        combo, complete = self._search(avail, t_cents, tol, k)
+        if combo is None and not complete and hi <= DP_MAX_CENTS:
+            combo = self._dp(avail, t_cents, tol, k)
+        return [self.entries[p] for p in combo] if combo else None
+
+    # ------------------------------------------------------
+    def _first_unused(self, cents, used, after=-1):
+        for p in self.by_cents.get(cents, ()):
+            if p > after and self.entries[p][0] not in used:
+                return p
+        return None
+
+    def _single(self, t_cents, tol, used):
+        for c in _near(self.amounts, t_cents, tol):
+            p = self._first_unused(c, used)
+            if p is not None:
+                return p
+        return None
+
+    def _pair(self, avail, t_cents, tol, used):
+        """Hash two-sum: first (i, j) in pool order with i < j."""
+        for i in avail:
+            for c in _near(self.amounts, t_cents - self.cents[i], tol):
+                j = self._first_unused(c, used, after=i)
+                if j is not None:
+                    return [i, j]
+        return None
+
+    def _dp(self, avail, t_cents, tol, k):
+        """Bounded subset-sum on bitsets: bit s of reach[j] = s is a sum of
+        exactly j CNs. Python ints serve as the bitsets (shift/or run in C).
+
+        Snapshots every DP_BLOCK CNs let us walk back and recover which CNs
+        form the sum without keeping a state per CN."""
+        hi = t_cents + tol
+        lo = max(0, t_cents - tol)
+        mask = (1 << (hi + 1)) - 1
+        reach = [1] + [0] * k
+        checkpoints = []
+        for idx, p in enumerate(avail):
+            if idx % DP_BLOCK == 0:
+                checkpoints.append(list(reach))
+            shifted_by = self.cents[p]
+            for j in range(min(k, idx + 1), 0, -1):
+                reach[j] |= (reach[j - 1] << shifted_by) & mask
+
+        offsets = sorted(range(lo - t_cents, hi - t_cents + 1), key=abs)
+        for j in range(3, k + 1):
+            if not reach[j] >> lo:
+                continue
+            for d in offsets:
+                if (reach[j] >> (t_cents + d)) & 1:
+                    return self._dp_walk_back(avail, checkpoints, j, t_cents + d, mask)
+        return None
+
+    def _dp_walk_back(self, avail, checkpoints, j, s, mask):
+        combo = []
+        for b in range(len(checkpoints) - 1, -1, -1):
+            start = b * DP_BLOCK
+            end = min(start + DP_BLOCK, len(avail))
+            # states[i] = reach before CN start+i, for levels 0..j
+            states = [checkpoints[b][:j + 1]]
+            for idx in range(start, end - 1):
+                prev, c = states[-1], self.cents[avail[idx]]
+                nxt = list(prev)
+                for level in range(j, 0, -1):
+                    nxt[level] |= (prev[level - 1] << c) & mask
+                states.append(nxt)
+            for idx in range(end - 1, start - 1, -1):
+                if (states[idx - start][j] >> s) & 1:
+                    continue          # reachable without this CN
+                combo.append(avail[idx])
+                s -= self.cents[avail[idx]]
+                j -= 1
+                if j == 0:
+                    return combo[::-1]
+        return None
+
+    def _search(self, avail, t_cents, tol, k):
+        """Branch-and-bound over 3..k CNs: amounts sorted descending, pruned
+        with the sums of the largest / smallest remaining CNs.
+
+        Returns (combo, complete). `complete` is False when the node budget
+        ran out, i.e. a None result does not prove there is no combination."""
+        order = sorted(avail, key=lambda p: -self.cents[p])
+        vals = [self.cents[p] for p in order]
+        neg = [-v for v in vals]                      # ascending, for bisect
+        prefix = [0]
+        for v in vals:
+            prefix.append(prefix[-1] + v)
+        n = len(vals)
+        lo, hi = t_cents - tol, t_cents + tol
+        nodes = 0
+
+        class _Budget(Exception):
+            pass
+
+        def dfs(start, size, total, picked):
+            nonlocal nodes
+            nodes += 1
+            if nodes > SEARCH_MAX_NODES:
+                raise _Budget()
+            if len(picked) == size:
+                return list(picked) if lo <= total <= hi else None
+            need = size - len(picked)
+            # skip CNs too large to leave room for the `need - 1` smallest
+            smallest_rest = prefix[n] - prefix[n - need + 1]
+            first = max(start, bisect_left(neg, total + smallest_rest - hi))
+            for i in range(first, n - need + 1):
+                # largest possible completion from here is vals[i:i+need]
+                if total + prefix[i + need] - prefix[i] < lo:
+                    break
+                picked.append(i)
+                found = dfs(i + 1, size, total + vals[i], picked)
+                picked.pop()
+                if found:
+                    return found
+            return None
+
+        try:
+            for size in range(3, k + 1):
+                found = dfs(0, size, 0, [])
+                if found:
+                    return [order[i] for i in found], True
+        except _Budget:
+            return None, False
+        return None, True
+
+
+def _near(amounts, center, tol):
+    """Amounts of the sorted list `amounts` within ±tol of center, closest
+    first (below before above on a tie). Two bisects, not one probe per cent."""
+    if not tol:
+        i = bisect_left(amounts, center)
+        return amounts[i:i + 1] if i < len(amounts) and amounts[i] == center else []
+    hits = amounts[bisect_left(amounts, center - tol):bisect_right(amounts, center + tol)]
+    return sorted(hits, key=lambda c: (abs(c - center), c))
+
+
+def vendor_key(v):
+    """Normalised vendor name used to partition CNs ('' = unknown)."""
+    if v is None or v != v:        # None / NaN
+        return ""
+    return " ".join(str(v).split()).casefold()
+
+
+class PartitionedCNIndex:
+    """CN pool split by vendor and narrowed to a document-date window.
+
+    `vendors` and `dates` run parallel to `pool` (either may be None when the
+    CN file has no such column). A payment only searches the CNs of its own
+    vendor dated within ±`window_days` of the payment date; CNs without a date
+    stay in every window. Each (vendor, date) partition is built once and
+    reused, so lookup cost follows one vendor's CN count, not the file's."""
+
+    def __init__(self, pool, vendors=None, dates=None, window_days=None):
+        self.entries = list(pool)
+        self.vendors = [vendor_key(v) for v in vendors] if vendors is not None else None
+        self.dates = list(dates) if dates is not None else None
+        self.window_days = window_days
+        self.by_vendor = defaultdict(list)       # vendor -> positions, in pool order
+        for pos in range(len(self.entries)):
+            self.by_vendor[self.vendors[pos] if self.vendors else ""].append(pos)
+        self._parts = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, vendor=None, date=None):
+        v = vendor_key(vendor) if self.vendors and vendor_key(vendor) else None
+        d = date if self.dates and self.window_days and date is not None else None
+        return v, d
+
+    def partition(self, vendor=None, date=None):
+        """CNIndex over the CNs relevant to a payment of `vendor` on `date`."""
+        key = self.key(vendor, date)
+        part = self._parts.get(key)
+        if part is None:
+            v, d = key
+            positions = self.by_vendor.get(v, []) if v is not None else range(len(self.entries))
+            if d is not None:
+                positions = [p for p in positions
+                             if self.dates[p] is None
+                             or abs((self.dates[p] - d).days) <= self.window_days]
+            part = self._parts[key] = CNIndex([self.entries[p] for p in positions])
+        return part
+
+    def find(self, target, used=(), max_combo=DEFAULT_MAX_COMBO, tolerance=0.0,
+             vendor=None, date=None):
+        return self.partition(vendor, date).find(
+            target, used, max_combo=max_combo, tolerance=tolerance)
+
+
+# ==========================================================
+# GLOBAL ASSIGNMENT — CNs across all invoice differences
+# ==========================================================
+def _candidates(target, max_combo, tolerance, caps, amounts, limit):
+    """Up to `limit` single/pair CN amount-multisets (sorted tuples of cents)
+    covering target.
+
+    CNs with the same amount are interchangeable, so candidates are built on
+    amounts; concrete CNs are handed out only after the assignment."""
+    t_cents, tol = to_cents(target), to_cents(tolerance)
+    if t_cents <= 0:
+        return []
+    found = [(c,) for c in _near(amounts, t_cents, tol)]
+    if max_combo >= 2:
+        for a in amounts:
+            if len(found) >= limit or 2 * a > t_cents + tol:
+                break
+            for b in _near(amounts, t_cents - a, tol):
+                if b > a or b == a and caps[a] > 1:
+                    found.append((a, b))
+                    break
+    return found[:limit]
+
+
+def assign_globally(index, targets, max_combo=DEFAULT_MAX_COMBO, tolerance=0.0,
+                    used=(), time_budget=3.0, max_candidates=8):
+    """Assign CNs to every invoice difference in `targets` at once, maximising
+    the number of differences covered exactly (or within tolerance).
+
+    Greedy first-fit in row order lets an early invoice take the CN a later
+    one needed; here candidates are collected for every difference first, the
+    most constrained differences choose first and a swap pass frees CNs for
+    those left uncovered. Most-constrained-first has no full repair step, so
+    the plain first-fit pass runs first (its time counts against
+    `time_budget`) and the assignment covering more differences wins.
+    Whatever is still open when the solver finishes takes its first-fit
+    combination if those CNs are still free, else a fresh first-fit search —
+    skipped once the budget is spent, so first-fit never runs twice.
+    Returns (combos aligned with targets, stats)."""
+    t0 = time.perf_counter()
+    deadline = t0 + time_budget
+    stats = {"differences": len(targets), "timed_out": False}
+    greedy = first_fit(index, targets, max_combo, tolerance, used)
+    used = set(used)
+
+    caps = Counter(c for pos, c in enumerate(index.cents)
+                   if c > 0 and index.entries[pos][0] not in used)
+    amounts = sorted(caps)
+    cands = [None] * len(targets)       # None = not examined (time budget)
+    for i, t in enumerate(targets):
+        if time.perf_counter() > deadline:
+            stats["timed_out"] = True
+            break
+        cands[i] = _candidates(t, max_combo, tolerance, caps, amounts, max_candidates)
+    # larger combinations cost a search each, so they come second
+    if max_combo >= 3:
+        for i, t in enumerate(targets):
+            if cands[i] != []:
+                continue
+            if time.perf_counter() > deadline:
+                stats["timed_out"] = True
+                cands[i] = None
+                continue
+            combo = index.find(t, used, max_combo=max_combo, tolerance=tolerance)
+            if combo:
+                cands[i] = [tuple(sorted(to_cents(e[2]) for e in combo))]
+
+    demand = Counter(c for cs in cands if cs for cand in cs for c in set(cand))
+
+    def slack(cand):
+        return min(caps[c] - demand[c] for c in cand)
+
+    for cs in cands:
+        if cs:
+            cs.sort(key=lambda cand: (len(cand), -slack(cand)))
+
+    remaining = Counter(caps)
+    chosen = [None] * len(targets)
+
+    def fits(cand):
+        return all(remaining[c] >= k for c, k in Counter(cand).items())
+
+    def take(i, cand):
+        chosen[i] = cand
+        remaining.subtract(cand)
+
+    def release(i):
+        remaining.update(chosen[i])
+        chosen[i] = None
+
+    order = sorted((i for i, cs in enumerate(cands) if cs),
+                   key=lambda i: (len(cands[i]), len(cands[i][0]), i))
+    for i in order:
+        for cand in cands[i]:
+            if fits(cand):
+                take(i, cand)
+                break
+
+    # swap pass: free a CN amount held by a difference that has another option
+    holders = defaultdict(set)
+    for i, cand in enumerate(chosen):
+        for c in cand or ():
+            holders[c].add(i)
+    improved = True
+    while improved and not stats["timed_out"]:
+        improved = False
+        for i in order:
+            if chosen[i]:
+                continue
+            if time.perf_counter() > deadline:
+                stats["timed_out"] = True
+                break
+            for cand in cands[i]:
+                short = [c for c, k in Counter(cand).items() if remaining[c] < k]
+                if len(short) != 1:
+                    continue
+                for j in list(holders[short[0]]):
+                    old = chosen[j]
+                    release(j)
+                    if fits(cand):
+                        take(i, cand)
+                        alt = next((a for a in cands[j] if fits(a)), None)
+                        if alt is not None:
+                            take(j, alt)
+                            for c in old:
+                                holders[c].discard(j)
+                            for c in alt:
+                                holders[c].add(j)
+                            for c in cand:
+                                holders[c].add(i)
+                            improved = True
+                            break
+                        release(i)
+                    take(j, old)
+                if chosen[i]:
+                    break
+
+    # hand out concrete CNs per amount, in pool order, to differences in row order
+    queues = defaultdict(list)
+    for pos, c in enumerate(index.cents):
+        if c > 0 and index.entries[pos][0] not in used:
+            queues[c].append(pos)
+    for q in queues.values():
+        q.reverse()
+    result = [None] * len(targets)
+    for i, cand in enumerate(chosen):
+        if cand:
+            result[i] = [index.entries[queues[c].pop()] for c in cand]
+            used.update(e[0] for e in result[i])
+    stats["solver_matched"] = sum(1 for c in result if c)
+
+    # first-fit fallback: unexamined differences, and those whose candidates
+    # were all taken (a different combination may still be free)
+    for i, t in enumerate(targets):
+        if result[i] is None and cands[i] != []:
+            combo = greedy[i]
+            if not combo or any(e[0] in used for e in combo):
+                combo = None if stats["timed_out"] or time.perf_counter() > deadline else \
+                    index.find(t, used, max_combo=max_combo, tolerance=tolerance)
+            if combo:
+                used.update(e[0] for e in combo)
+                result[i] = combo
+
+    stats["matched"] = sum(1 for c in result if c)
+    stats["greedy_kept"] = sum(1 for c in greedy if c) > stats["matched"]
+    if stats["greedy_kept"]:
+        result = greedy
+        stats["matched"] = sum(1 for c in result if c)
+        stats["solver_matched"] = 0
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
+    return result, stats
+
+
+def first_fit(index, targets, max_combo=DEFAULT_MAX_COMBO, tolerance=0.0, used=()):
+    """Row-order greedy: each difference takes the first combination still free."""
+    used = set(used)
+    result = []
+    for t in targets:
+        combo = index.find(t, used, max_combo=max_combo, tolerance=tolerance)
+        if combo:
+            used.update(e[0] for e in combo)
+        result.append(combo)
+    return result
@@ -0,0 +1,108 @@
+# ==========================================================
+# payment_export.py — equivalence check & speed benchmark
+# Builds random payment analyses (edited-table shaped export_data: awkward
+# codes that need sheet-name cleaning / de-duplication, missing dates,
+# negative CN lines, non-string vendors) and checks that the streaming
+# xlsxwriter export holds exactly what the pandas/openpyxl reference
+# holds: sheet names, every cell value and the header style. Then times
+# both (and their peak Python memory) for each --codes size.
+#
+#   python export_benchmark.py                      # 10 / 100 / 1000 codes
+#   python export_benchmark.py --codes 500,2000 --rows 40 --seed 7
+# ==========================================================
+
+import argparse
+import io
+import random
+import time
+import tracemalloc
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import payment_export
+
+
+def random_export_data(rng, n_codes, max_rows):
+    data = {}
+    for c in range(n_codes):
+        k = rng.randint(1, max_rows)
+        docs = [f"F{c}-{i}" for i in range(k)] + [f"CN{c}-{i} (CN)" for i in range(rng.randint(0, 3))]
+        vals = [round(rng.uniform(-500, 8000), 2) for _ in docs]
+        if rng.random() < 0.1:
+            docs.append(f"F{c}-x (Adj. Diff)")
+            vals.append(round(rng.uniform(-50, 50), 2))
+        code = rng.choice([f"P{c:06d}", f"PAY/{c}*?", f"{'LONGCODE' * 5}{c % 3}", f"P{c:06d}"])
+        if code in data:
+            code = f"{code}-{c}"
+        data[code] = {
+            "vendor": rng.choice([f"Vendor {c % 17}", np.int64(4000 + c % 5), float("nan")]),
+            "pay_date": rng.choice(["", f"{rng.randint(1, 28):02d}/03/2024"]),
+            "rows": pd.DataFrame({"Alt. Document": docs, "Invoice Value": vals}),
+        }
+    return data
+
+
+def _style(cell):
+    return (bool(cell.font.b), cell.border.left.style, cell.border.top.style,
+            cell.alignment.horizontal, cell.alignment.vertical)
+
+
+def workbook_diff(ref_bytes, new_bytes):
+    """First difference between two workbooks as text, or None."""
+    a = openpyxl.load_workbook(io.BytesIO(ref_bytes))
+    b = openpyxl.load_workbook(io.BytesIO(new_bytes))
+    if a.sheetnames != b.sheetnames:
+        return f"sheet names {a.sheetnames[:5]} vs {b.sheetnames[:5]}"
+    for name in a.sheetnames:
+        wa, wb = a[name], b[name]
+        if (wa.max_row, wa.max_column) != (wb.max_row, wb.max_column):
+            return f"{name}: size {(wa.max_row, wa.max_column)} vs {(wb.max_row, wb.max_column)}"
+        for ra, rb in zip(wa.iter_rows(), wb.iter_rows()):
+            for ca, cb in zip(ra, rb):
+                if (ca.value or None) != (cb.value or None):
+                    return f"{name}!{ca.coordinate}: {ca.value!r} vs {cb.value!r}"
+                if ca.row == 1 and _style(ca) != _style(cb):
+                    return f"{name}!{ca.coordinate} header style: {_style(ca)} vs {_style(cb)}"
+    return None
+
+
+def timed(fn, data):
+    """(result, seconds, peak traced MB). The peak comes from a second,
+    traced call — tracemalloc slows pandas down far too much to time under."""
+    t0 = time.perf_counter()
+    out = fn(data)
+    seconds = time.perf_counter() - t0
+    tracemalloc.start()
+    fn(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, seconds, peak / 2**20
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Equivalence + speed of the streaming Excel export")
+    ap.add_argument("--codes", default="10,100,1000", help="comma-separated payment-code counts")
+    ap.add_argument("--rows", type=int, default=25, help="max invoice rows per code")
+    ap.add_argument("--seed", type=int, default=1234)
+    args = ap.parse_args()
+    rng = random.Random(args.seed)
+
+    failures = 0
+    print(f"{'codes':>6} {'pandas s':>9} {'stream s':>9} {'speed-up':>9} "
+          f"{'pandas MB':>10} {'stream MB':>10} {'xlsx KB':>8}  check")
+    for n in (int(x) for x in args.codes.split(",")):
+        data = random_export_data(rng, n, args.rows)
+        ref, t_ref, m_ref = timed(payment_export.build_excel_export_pandas, data)
+        new, t_new, m_new = timed(payment_export.build_excel_export, data)
+        diff = workbook_diff(ref, new)
+        failures += diff is not None
+        print(f"{n:>6} {t_ref:>9.3f} {t_new:>9.3f} {t_ref / t_new:>8.1f}× "
+              f"{m_ref:>10.1f} {m_new:>10.1f} {len(new) / 1024:>8.0f}  "
+              + ("same" if diff is None else f"MISMATCH {diff}"))
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# ==========================================================
+# GLPI bulk-send benchmark — The Remitator's send path against glpi_mock
+# Starts an in-process MockGLPI, points glpi_client at it and runs the
+# bulk send exactly as run_bulk_send does (pre-flight plan → per-ticket or
+# batched sender) for every mode × worker count. The mock is reset
+# between runs. Reports:
+#   - tickets/minute and wall time
+#   - HTTP calls per ticket (logins excluded), injected 503s
+#   - the outcome mix (✅ / ⚠️ / ⏭️ / ❌)
+#   - a state check on the mock: duplicate solutions/follow-ups, open
+#     tickets left unsolved
+#   - with --attach-kb: one document upload + a Document_Item link per
+#     posted ticket (as the payment-analysis send does), checked for
+#     exactly one upload and one link per ticket
+#
+#   python glpi_benchmark.py                                # 300 tickets, 50 ms latency
+#   python glpi_benchmark.py --tickets 1000 --latency-ms 120 --error-rate 0.03 --workers 1,4,8,16
+#   python glpi_benchmark.py --modes batched+plan --out glpi_bench.json
+#   python glpi_benchmark.py --attach-kb 250 --workers 8
+# ==========================================================
+
+import argparse
+import json
+import random
+import time
+from collections import Counter
+
+import glpi_client
+from glpi_mock import CLOSED, SOLVED, MockGLPI
+
+MODES = ("per-ticket", "per-ticket+plan", "batched", "batched+plan")
+
+
+def run_once(mock, mode, workers, ticket_ids, batch_size, message, category_id, attachment=None):
+    mock.reset()
+    glpi_client.configure(max_workers=workers)
+    glpi_client.glpi_session(refresh=True)
+    t0 = time.perf_counter()
+    plan = None
+    if mode.endswith("+plan"):
+        plan, err = glpi_client.glpi_plan(None, ticket_ids)
+        if err:
+            raise SystemExit(f"pre-flight failed: {err}")
+    if mode.startswith("batched"):
+        sender = glpi_client.glpi_send_batched(None, ticket_ids, message, category_id,
+                                               batch_size=batch_size, plan=plan)
+    else:
+        sender = glpi_client.glpi_send_many(None, ticket_ids, message, category_id, plan=plan)
+    results = dict(sender)
+    seconds = time.perf_counter() - t0
+
+    attach = {}
+    if attachment:
+        posted = [t for t, r in results.items() if r.startswith(("✅", "⚠️"))]
+        t1 = time.perf_counter()
+        doc_id, err = glpi_client.glpi_upload_document(None, *attachment)
+        if err:
+            raise SystemExit(f"upload failed: {err}")
+        t2 = time.perf_counter()
+        linked = dict(glpi_client.glpi_link_document_many(None, doc_id, posted))
+        t3 = time.perf_counter()
+        seconds = t3 - t0
+        bad_links = sum(1 for t in posted if mock.ticket(t)["documents"] != {doc_id})
+        attach = {"upload_s": round(t2 - t1, 3), "link_s": round(t3 - t2, 3),
+                  "linked": sum(linked.values()), "documents_uploaded": mock.stats()["documents"],
+                  "bad_links": bad_links}
+
+    stats = mock.stats()
+    calls = stats["calls_total"] - stats["calls"].get("GET /initSession", 0)
+    outcome = Counter(r.split(" ", 1)[0] for r in results.values())
+    duplicates = unsolved = 0
+    for tid in ticket_ids:
+        t = mock.ticket(tid)
+        if t is None:
+            continue
+        if t["solutions"] + t["followups"] > 1:
+            duplicates += 1
+        if t["initial_status"] not in (SOLVED, CLOSED) and not t["solutions"]:
+            unsolved += 1
+    return {
+        "mode": mode,
+        "workers": workers,
+        "tickets": len(ticket_ids),
+        "seconds": round(seconds, 3),
+        "tickets_per_min": round(len(ticket_ids) / seconds * 60, 1),
+        "calls": calls,
+        "calls_per_ticket": round(calls / len(ticket_ids), 2),
+        "injected_errors": stats["injected_errors"],
+        "logins": stats["logins"],
+        "ok": outcome.get("✅", 0),
+        "followup": outcome.get("⚠️", 0),
+        "skipped": outcome.get("⏭️", 0),
+        "failed": outcome.get("❌", 0),
+        "duplicates": duplicates,
+        "open_left_unsolved": unsolved,
+        **attach,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Bulk GLPI send throughput against the local mock")
+    ap.add_argument("--tickets", type=int, default=300, help="tickets sent per run")
+    ap.add_argument("--missing", type=int, default=5, help="extra ticket IDs that do not exist")
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--item-ms", type=float, default=1.0)
+    ap.add_argument("--error-rate", type=float, default=0.02, help="share of calls answered 503")
+    ap.add_argument("--solved-rate", type=float, default=0.2)
+    ap.add_argument("--closed-rate", type=float, default=0.05)
+    ap.add_argument("--workers", default="1,4,8", help="comma-separated worker counts")
+    ap.add_argument("--modes", default=",".join(MODES), help=f"comma-separated, of {', '.join(MODES)}")
+    ap.add_argument("--batch-size", type=int, default=glpi_client.BATCH_SIZE)
+    ap.add_argument("--rate-limit", type=float, default=0.0, help="glpi_client calls/s (0 = unlimited)")
+    ap.add_argument("--backoff", type=float, default=0.1, help="glpi_client first retry wait, s")
+    ap.add_argument("--category", default="", help="category id sent with every ticket")
+    ap.add_argument("--attach-kb", type=int, default=0, help="also upload + link a document this big")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="write the results as JSON here")
+    args = ap.parse_args()
+
+    mock = MockGLPI(tickets=args.tickets, latency_ms=args.latency_ms, item_ms=args.item_ms,
+                    error_rate=args.error_rate, solved_rate=args.solved_rate,
+                    closed_rate=args.closed_rate, seed=args.seed).start()
+    glpi_client.configure(url=mock.url, app_token="bench-app", user_token="bench-user",
+                          rate_limit=args.rate_limit)
+    glpi_client.BACKOFF_S = args.backoff
+    ticket_ids = [str(t) for t in range(1, args.tickets + 1)] + \
+                 [str(10**7 + t) for t in range(args.missing)]
+    message = "<p>Benchmark payment analysis</p>"
+    attachment = None
+    if args.attach_kb:
+        attachment = ("payment_analysis.xlsx", random.Random(args.seed).randbytes(args.attach_kb * 1024),
+                      "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+    print(f"mock {mock.url}: {args.tickets} tickets (+{args.missing} missing), "
+          f"{args.latency_ms:.0f} ms/call, {args.error_rate:.0%} 503s")
+    print(f"\n{'mode':<16} {'workers':>7} {'seconds':>8} {'tickets/min':>11} {'calls/tkt':>9} "
+          f"{'503s':>5} {'✅':>4} {'⚠️':>4} {'⏭️':>4} {'❌':>4} {'dupes':>5} {'unsolved':>8}")
+    rows = []
+    for mode in args.modes.split(","):
+        for workers in (int(w) for w in args.workers.split(",")):
+            r = run_once(mock, mode.strip(), workers, ticket_ids, args.batch_size, message,
+                         args.category or None, attachment)
+            rows.append(r)
+            print(f"{r['mode']:<16} {r['workers']:>7} {r['seconds']:>8.2f} {r['tickets_per_min']:>11.0f} "
+                  f"{r['calls_per_ticket']:>9.2f} {r['injected_errors']:>5} {r['ok']:>4} {r['followup']:>4} "
+                  f"{r['skipped']:>4} {r['failed']:>4} {r['duplicates']:>5} {r['open_left_unsolved']:>8}"
+                  + (f"   📎 upload {r['upload_s']:.2f}s · {r['linked']} links {r['link_s']:.2f}s"
+                     if attachment else ""))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+        print(f"\nwritten to {args.out}")
+    mock.stop()
+    bad = sum(r["duplicates"] + r["open_left_unsolved"] + r.get("bad_links", 0)
+              + max(0, r.get("documents_uploaded", 1) - 1) for r in rows)
+    raise SystemExit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,810 @@
+# ==========================================================
+# GLPI REST CLIENT (used by The Remitator)
+# One pooled requests.Session for every call (keep-alive instead of a new
+# TCP/TLS handshake per request), per-call retries with jittered backoff,
+# a process-wide rate limit, and a bulk sender that works several tickets
+# at once while the caller keeps updating its progress bar.
+#
+# Session tokens are cached process-wide (shared by every Streamlit
+# session): pass token=None to any call to use the cached session, which is
+# re-created after SESSION_TTL_S idle or when GLPI answers 401.
+#
+# app.py calls configure() with the URL / tokens from secrets; nothing
+# here touches Streamlit.
+# ==========================================================
+
+import atexit
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+GLPI_URL = ""
+APP_TOKEN = ""
+USER_TOKEN = ""
+DEFAULT_USER_ID = 22487
+
+MAX_WORKERS = 4          # tickets in flight at once
+RATE_LIMIT = 10.0        # HTTP calls per second across all workers (0 = unlimited)
+RETRIES = 3              # extra attempts per call on 5xx / 429 / network errors
+BACKOFF_S = 0.5          # first retry waits ~0.5 s, then ~1 s, ~2 s (± jitter)
+TIMEOUT_S = 20
+SESSION_TTL_S = 600      # reuse a cached session token this long after its last use
+BATCH_SIZE = 50          # tickets per array-input call in batch mode
+SEARCH_PAGE = 100        # ticket IDs per pre-flight search call (criteria travel in the URL)
+
+# POST creates something — only retry it when the server surely did not act on
+# it (a 502/504 may come back after GLPI already created the followup); other
+# POST failures are left to the send journal's explicit resume
+_RETRY_ANY = {429, 500, 502, 503, 504}
+_RETRY_POST = {429, 503}
+
+
+class GLPIAuthError(Exception):
+    """The cached session could not be (re-)established."""
+
+
+def configure(url=None, app_token=None, user_token=None, user_id=None,
+              max_workers=None, rate_limit=None, retries=None):
+    global GLPI_URL, APP_TOKEN, USER_TOKEN, DEFAULT_USER_ID, MAX_WORKERS, RATE_LIMIT, RETRIES
+    creds = (GLPI_URL, APP_TOKEN, USER_TOKEN)
+    if url is not None:
+        GLPI_URL = url.strip().rstrip("/")
+    if app_token is not None:
+        APP_TOKEN = app_token.strip()
+    if user_token is not None:
+        USER_TOKEN = user_token.strip()
+    if (GLPI_URL, APP_TOKEN, USER_TOKEN) != creds:
+        _sessions.drop()
+    if user_id is not None:
+        DEFAULT_USER_ID = int(user_id)
+    if max_workers is not None:
+        MAX_WORKERS = max(1, int(max_workers))
+    if rate_limit is not None and max(0.0, float(rate_limit)) != RATE_LIMIT:
+        RATE_LIMIT = max(0.0, float(rate_limit))
+        _limiter.reset()
+    if retries is not None:
+        RETRIES = max(0, int(retries))
+    _pool_size(MAX_WORKERS)
+
+
+def safe_json(resp):
+    try:
+        return resp.json()
+    except Exception:
+        return None
+
+
+# ----------------------------------------------------------
+# TRANSPORT — pooled session, rate limit, retries
+# ----------------------------------------------------------
+_session = requests.Session()
+_session_lock = threading.Lock()
+_mounted_size = 0
+
+
+def _pool_size(n):
+    """Keep enough pooled connections for n concurrent workers."""
+    global _mounted_size
+    with _session_lock:
+        if n <= _mounted_size:
+            return
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(n, 10))
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+        _mounted_size = max(n, 10)
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate s apart across all threads using it
+    (rate=None follows RATE_LIMIT)."""
+
+    def __init__(self, rate=None):
+        self._lock = threading.Lock()
+        self._next = 0.0
+        self.rate = rate
+
+    def reset(self):
+        with self._lock:
+            self._next = 0.0
+
+    def wait(self):
+        rate = RATE_LIMIT if self.rate is None else self.rate
+        if rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1.0 / rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_limiter = _RateLimiter()
+
+# Per-send settings: the bulk senders take rate_limit / retries per call (one
+# Streamlit session's sliders must not change another session's send) and
+# install them on their worker threads; glpi_request reads them from here.
+_call = threading.local()
+
+
+def _send_settings(rate_limit=None, retries=None):
+    """(limiter, retries) for one bulk send; None keeps the module default."""
+    return (None if rate_limit is None else _RateLimiter(max(0.0, float(rate_limit))),
+            None if retries is None else max(0, int(retries)))
+
+
+def _run_with(settings, fn, *args):
+    _call.limiter, _call.retries = settings
+    try:
+        return fn(*args)
+    finally:
+        _call.limiter = _call.retries = None
+
+
+def _backoff(attempt, resp=None):
+    retry_after = resp is not None and resp.headers.get("Retry-After")
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return BACKOFF_S * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def _never_sent(exc):
+    """True when a network error happened before the request left this host
+    (connect timeout, refused connection, DNS failure)."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(exc, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def glpi_request(method, path, token=None, headers=None, timeout=TIMEOUT_S, **kwargs):
+    """One GLPI call through the shared session. Retries 5xx / 429 / network
+    errors with jittered exponential backoff — POST only on 429 / 503 and on
+    connect-phase failures. The last response (or exception) is returned /
+    raised as-is so callers keep their own error handling.
+
+    token=None uses the cached session and re-authenticates once on 401."""
+    cached = token is None and headers is None
+    if cached:
+        token = _sessions.token()
+    retry_codes = _RETRY_POST if method.upper() == "POST" else _RETRY_ANY
+    limiter = getattr(_call, "limiter", None) or _limiter
+    retries = getattr(_call, "retries", None)
+    retries = RETRIES if retries is None else retries
+    reauthed = False
+    attempt = 0
+    while True:
+        limiter.wait()
+        try:
+            resp = _session.request(method, f"{GLPI_URL}{path}",
+                                    headers=headers or {"Session-Token": token, "App-Token": APP_TOKEN},
+                                    timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # a POST that reached the server (read timeout, reset mid-response)
+            # may still have been applied there
+            if attempt == retries or (method.upper() == "POST" and not _never_sent(e)):
+                raise
+            time.sleep(_backoff(attempt))
+            attempt += 1
+            continue
+        if cached and resp.status_code == 401 and not reauthed:
+            # expired / killed server-side: log in again and repeat this call once
+            _sessions.invalidate(token)
+            token = _sessions.token()
+            reauthed = True
+            continue
+        if resp.status_code not in retry_codes or attempt == retries:
+            return resp
+        time.sleep(_backoff(attempt, resp))
+        attempt += 1
+
+
+# ----------------------------------------------------------
+# GLPI FUNCTIONS — HARDENED
+# ----------------------------------------------------------
+def glpi_login():
+    if not GLPI_URL or not APP_TOKEN or not USER_TOKEN:
+        return None, (
+            "Missing GLPI credentials. Check your Streamlit secrets / .env:\n"
+            f"- GLPI_URL set:   {bool(GLPI_URL)}\n"
+            f"- APP_TOKEN set:  {bool(APP_TOKEN)}\n"
+            f"- USER_TOKEN set: {bool(USER_TOKEN)}"
+        )
+    try:
+        r = glpi_request(
+            "GET", "/initSession",
+            headers={
+                "Authorization": f"user_token {USER_TOKEN}",
+                "App-Token": APP_TOKEN,
+                "Content-Type": "application/json",
+            },
+        )
+    except requests.RequestException as e:
+        return None, f"Network error contacting GLPI: {e}"
+    data = safe_json(r)
+    if isinstance(data, list):
+        return None, f"GLPI rejected login: {data}"
+    if not isinstance(data, dict):
+        return None, f"Unexpected GLPI response (status {r.status_code}). Body: {r.text[:300]}"
+    token = data.get("session_token")
+    if not token:
+        return None, f"GLPI response had no session_token. Body: {data}"
+    return token, None
+
+
+class _SessionCache:
+    """One GLPI session token per process, shared by all threads and Streamlit
+    sessions. Validity is checked lazily: the token is reused until it has
+    been idle SESSION_TTL_S or a call comes back 401."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._token = None
+        self._created = 0.0
+        self._last_used = 0.0
+
+    def get(self, refresh=False):
+        """(token, error) — logs in only when there is no live cached token."""
+        stale = None
+        with self._lock:
+            now = time.monotonic()
+            if self._token and not refresh and now - self._last_used < SESSION_TTL_S:
+                self._last_used = now
+                return self._token, None
+            token, err = glpi_login()
+            if err:
+                return None, err
+            stale, self._token = self._token, token
+            self._created = self._last_used = now
+        if stale:
+            glpi_kill_session(stale)
+        return token, None
+
+    def token(self):
+        token, err = self.get()
+        if err:
+            raise GLPIAuthError(err)
+        return token
+
+    def invalidate(self, token):
+        """Forget `token` if it is still the cached one (another thread may
+        already have replaced it)."""
+        with self._lock:
+            if self._token == token:
+                self._token = None
+
+    def drop(self):
+        with self._lock:
+            stale, self._token = self._token, None
+        if stale:
+            glpi_kill_session(stale)
+
+    def info(self):
+        with self._lock:
+            if not self._token:
+                return None
+            now = time.monotonic()
+            return {"age_s": now - self._created, "idle_s": now - self._last_used}
+
+
+_sessions = _SessionCache()
+atexit.register(_sessions.drop)
+
+
+def glpi_session(refresh=False):
+    """Cached session token for this process → (token, error)."""
+    return _sessions.get(refresh)
+
+
+def glpi_session_info():
+    """{'age_s', 'idle_s'} of the cached session, or None."""
+    return _sessions.info()
+
+
+def glpi_update_ticket(token, ticket_id, status=5, category_id=None):
+    payload = {"input": {"id": int(ticket_id), "status": int(status),
+                         "users_id_lastupdater": DEFAULT_USER_ID,
+                         "users_id_recipient": DEFAULT_USER_ID}}
+    if category_id:
+        payload["input"]["itilcategories_id"] = int(category_id)
+    return glpi_request("PUT", f"/Ticket/{ticket_id}", token, json=payload)
+
+
+def glpi_assign_ticket(token, ticket_id, user_id=None):
+    """Add the user as the 'Assigned to' technician WITHOUT touching the existing
+    requester / observer actors.
+
+    Uses ONLY Ticket_User type=2 (POST /Ticket_User) — this INSERTS one assignee
+    row and leaves every other actor alone. We deliberately do NOT use the GLPI 10
+    `_actors` PUT: that replaces the whole actor set and wipes requester/observers.
+
+    Returns True if the assignee was added (or already existed)."""
+    user_id = DEFAULT_USER_ID if user_id is None else user_id
+    try:
+        r = glpi_request(
+            "POST", "/Ticket_User", token,
+            json={"input": {"tickets_id": int(ticket_id), "users_id": int(user_id), "type": 2}},
+        )
+        # 'already exists' (400) still means the user is assigned — treat as success.
+        return (r.status_code < 400) or ("already" in (r.text or "").lower())
+    except Exception:
+        return False
+
+
+def glpi_add_solution(token, ticket_id, html):
+    payload = {"input": {"itemtype": "Ticket", "items_id": int(ticket_id),
+                         "users_id": DEFAULT_USER_ID, "users_id_recipient": DEFAULT_USER_ID,
+                         "content": html, "solutiontypes_id": 10, "status": 5}}
+    return glpi_request("POST", "/ITILSolution", token, json=payload)
+
+
+def glpi_add_followup(token, ticket_id, html):
+    payload = {"input": {"itemtype": "Ticket", "items_id": int(ticket_id),
+                         "users_id": DEFAULT_USER_ID, "users_id_recipient": DEFAULT_USER_ID,
+                         "content": html}}
+    return glpi_request("POST", f"/Ticket/{ticket_id}/ITILFollowup", token, json=payload)
+
+
+def glpi_kill_session(token):
+    try:
+        _session.get(f"{GLPI_URL}/killSession",
+                     headers={"Session-Token": token, "App-Token": APP_TOKEN}, timeout=10)
+    except Exception:
+        pass
+
+
+def glpi_send_one(token, ticket_id, html_message, category_id, plan=None):
+    """Update one ticket + assign to Angelos + post the solution
+    (falls back to follow-up if already solved). Returns a short result string.
+
+    `plan` is this ticket's glpi_plan() entry: calls it shows are not needed
+    (assignment already there, solution on a solved ticket) are skipped."""
+    done = _planned_result(plan)
+    if done:
+        return done
+    followup_only = plan is not None and plan["action"] == "followup"
+    try:
+        upd_warn = ""
+        if not followup_only or category_id:
+            upd = glpi_update_ticket(token, ticket_id, 5, category_id)
+            upd_warn = "" if upd.status_code < 400 else f" (update {upd.status_code})"
+
+        # always assign the ticket to Angelos — robust across GLPI 9.x / 10.x
+        assigned = (plan is not None and plan["assigned"]) or \
+            glpi_assign_ticket(token, ticket_id, DEFAULT_USER_ID)
+        assign_note = "" if assigned else " (assign?)"
+
+        resp = None if followup_only else glpi_add_solution(token, ticket_id, html_message)
+        if resp is None or (resp.status_code >= 400 and _already_solved(resp.text)):
+            fu = glpi_add_followup(token, ticket_id, html_message)
+            if fu.status_code >= 400:
+                return f"❌ Follow-up failed ({fu.status_code})" + upd_warn + assign_note
+            return "⚠️ Already solved — follow-up posted" + upd_warn + assign_note
+        if resp.status_code >= 400:
+            return f"❌ Solution failed ({resp.status_code})" + upd_warn + assign_note
+        return "✅ Solution added" + upd_warn + assign_note
+    except Exception as e:
+        return f"❌ Error: {e}"
+
+
+_NOT_CLAIMED = "⏭️ Already being sent by another run — skipped"
+# prefix of results where GLPI may or may not have stored the write
+OUTCOME_UNKNOWN = "⚠️ Outcome unknown"
+
+
+def _send_one_journaled(token, ticket_id, html_message, category_id, step, journal):
+    if journal is not None and not journal.begin([ticket_id]):
+        return _NOT_CLAIMED
+    result = glpi_send_one(token, ticket_id, html_message, category_id, step)
+    if journal is not None:
+        journal.finish(ticket_id, result)
+    return result
+
+
+def glpi_send_many(token, ticket_ids, html_message, category_id, workers=None, plan=None, journal=None,
+                   rate_limit=None, retries=None):
+    """Run glpi_send_one over many tickets, `workers` at a time.
+
+    Yields (ticket_id, result) as each ticket finishes — iterate it on the
+    caller's thread to update progress live. Calls from all workers share
+    the pooled session and this send's rate limit (`rate_limit` calls/s,
+    `retries` per call; None = RATE_LIMIT / RETRIES). `plan` comes from
+    glpi_plan().
+
+    `journal` (a send_journal.JournalBatch) is told begin([ticket]) before and
+    finish(ticket, result) after each ticket, on the worker thread — so the
+    outcome is recorded even if the caller stops iterating."""
+    workers = max(1, min(workers or MAX_WORKERS, len(ticket_ids) or 1))
+    _pool_size(workers)
+    plan = plan or {}
+    settings = _send_settings(rate_limit, retries)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="glpi") as pool:
+        futures = {pool.submit(_run_with, settings, _send_one_journaled, token, tid, html_message,
+                               category_id, plan.get(tid), journal): tid
+                   for tid in ticket_ids}
+        try:
+            for fut in as_completed(futures):
+                yield futures[fut], fut.result()
+        finally:
+            # caller stopped early (rerun / exception): drop what has not started
+            for fut in futures:
+                fut.cancel()
+
+
+
+# ----------------------------------------------------------
+# PRE-FLIGHT — search the state of every pasted ticket before any write
+# ----------------------------------------------------------
+TICKET_STATUS = {1: "New", 2: "Assigned", 3: "Planned", 4: "Pending", 5: "Solved", 6: "Closed"}
+
+# search option ids of the Ticket itemtype
+_F_ID, _F_STATUS, _F_TECH = 2, 12, 5
+
+
+def glpi_ticket_states(token, ticket_ids, page_size=None, user_id=None):
+    """Status of many tickets, and whether `user_id` (DEFAULT_USER_ID) is one
+    of their technicians, via GET /search/Ticket: SEARCH_PAGE IDs per call,
+    following `range` pages until totalcount.
+
+    The technician column (field 5) displays user names, not IDs, so
+    assignment is decided by GLPI itself: a second search with the same
+    tickets AND field 5 equals the user ID.
+
+    Returns ({ticket_id: {"status": int, "assigned": bool}}, error).
+    Tickets GLPI does not return (wrong ID, deleted, no rights) are absent."""
+    size = max(1, page_size or SEARCH_PAGE)
+    user_id = DEFAULT_USER_ID if user_id is None else user_id
+    ids = [str(t) for t in ticket_ids]
+    states = {}
+    try:
+        for i in range(0, len(ids), size):
+            # the page's IDs as one OR group, so further criteria AND onto all of them
+            group = [("criteria[0][link]", "AND")]
+            for n, tid in enumerate(ids[i:i + size]):
+                c = f"criteria[0][criteria][{n}]"
+                group += [(f"{c}[link]", "OR"), (f"{c}[field]", _F_ID),
+                          (f"{c}[searchtype]", "equals"), (f"{c}[value]", tid)]
+            rows, err = _search_tickets(token, group, (_F_ID, _F_STATUS), size)
+            if err:
+                return None, err
+            for tid, row in rows:
+                cur = states.setdefault(tid, {"status": None, "assigned": False})
+                try:
+                    cur["status"] = int(row.get(str(_F_STATUS)))
+                except (TypeError, ValueError):
+                    pass
+            mine = group + [("criteria[1][link]", "AND"), ("criteria[1][field]", _F_TECH),
+                            ("criteria[1][searchtype]", "equals"), ("criteria[1][value]", str(user_id))]
+            rows, err = _search_tickets(token, mine, (_F_ID,), size)
+            if err:
+                return None, err
+            for tid, _ in rows:
+                if tid in states:
+                    states[tid]["assigned"] = True
+    except (requests.RequestException, GLPIAuthError) as e:
+        return None, f"Network error contacting GLPI: {e}"
+    return states, None
+
+
+def _search_tickets(token, criteria, fields, size):
+    """All rows of one /search/Ticket query as [(ticket_id, row)], or (None, error)."""
+    params = criteria + [(f"forcedisplay[{n}]", f) for n, f in enumerate(fields)]
+    out = []
+    start = 0
+    while True:
+        r = glpi_request("GET", "/search/Ticket", token,
+                         params=params + [("range", f"{start}-{start + size - 1}")])
+        data = safe_json(r)
+        if r.status_code >= 400 or not isinstance(data, dict):
+            return None, f"Ticket search failed ({r.status_code}): {r.text[:300]}"
+        rows = data.get("data") or []
+        for row in rows:
+            tid = str(row.get(str(_F_ID), "")).strip()
+            if tid:
+                out.append((tid, row))
+        start += size
+        if not rows or start >= int(data.get("totalcount") or 0):
+            return out, None
+
+
+def glpi_plan(token, ticket_ids):
+    """What each ticket needs, decided before any write:
+      solve      — open ticket: status, assign, solution
+      followup   — already solved: straight to the follow-up (no failing solution call)
+      skip       — closed: nothing is sent
+      not found  — the search does not return it: nothing is sent
+    `assigned` is True when DEFAULT_USER_ID is already a technician (exact
+    user ID, matched by GLPI), so the Ticket_User call is skipped too.
+
+    Returns ({ticket_id: {"action", "status", "assigned"}}, error)."""
+    states, err = glpi_ticket_states(token, ticket_ids)
+    if err:
+        return None, err
+    plan = {}
+    for tid in ticket_ids:
+        s = states.get(str(tid))
+        if s is None:
+            plan[tid] = {"action": "not found", "status": None, "assigned": False}
+            continue
+        action = {5: "followup", 6: "skip"}.get(s["status"], "solve")
+        plan[tid] = {"action": action, "status": s["status"], "assigned": s["assigned"]}
+    return plan, None
+
+
+def _planned_result(step):
+    """Result string for tickets the plan sends nothing to, else None."""
+    if step is None:
+        return None
+    if step["action"] == "skip":
+        return "⏭️ Closed — skipped"
+    if step["action"] == "not found":
+        return "❌ Ticket not found"
+    return None
+
+
+
+# ----------------------------------------------------------
+# DOCUMENTS — upload a file once, link it to many tickets
+# ----------------------------------------------------------
+def glpi_upload_document(token, filename, data, mime="application/octet-stream", name=None):
+    """Upload `data` (bytes, straight from memory — no temp file) as one GLPI
+    Document via the multipart POST /Document. Returns (document_id, error).
+
+    The bytes (not a file object) go into the request, so a retried call
+    sends the whole file again instead of an exhausted stream."""
+    manifest = {"input": {"name": name or filename, "_filename": [filename]}}
+    try:
+        r = glpi_request("POST", "/Document", token,
+                         data={"uploadManifest": json.dumps(manifest)},
+                         files={"filename[0]": (filename, data, mime)},
+                         timeout=max(TIMEOUT_S, 60))
+    except (requests.RequestException, GLPIAuthError) as e:
+        return None, f"Network error uploading the document: {e}"
+    body = safe_json(r)
+    if r.status_code >= 400 or not isinstance(body, dict) or not body.get("id"):
+        return None, f"Document upload failed ({r.status_code}): {r.text[:300]}"
+    return int(body["id"]), None
+
+
+def glpi_link_document(token, document_id, ticket_id):
+    """Attach an uploaded Document to a ticket (POST /Document_Item).
+    True if linked — or already linked."""
+    try:
+        r = glpi_request("POST", "/Document_Item", token, json={"input": {
+            "documents_id": int(document_id), "itemtype": "Ticket", "items_id": int(ticket_id)}})
+        return (r.status_code < 400) or ("already" in (r.text or "").lower()) \
+            or ("duplicate" in (r.text or "").lower())
+    except Exception:
+        return False
+
+
+def glpi_link_document_many(token, document_id, ticket_ids, workers=None, rate_limit=None, retries=None):
+    """glpi_link_document over many tickets, `workers` at a time (rate_limit /
+    retries as for glpi_send_many). Yields (ticket_id, linked) as each link
+    call finishes."""
+    workers = max(1, min(workers or MAX_WORKERS, len(ticket_ids) or 1))
+    _pool_size(workers)
+    settings = _send_settings(rate_limit, retries)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="glpi") as pool:
+        futures = {pool.submit(_run_with, settings, glpi_link_document, token, document_id, tid): tid
+                   for tid in ticket_ids}
+        try:
+            for fut in as_completed(futures):
+                yield futures[fut], fut.result()
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+
+# ----------------------------------------------------------
+# BATCH MODE — array inputs: one call per step for a whole chunk
+# ----------------------------------------------------------
+def _items(resp, n):
+    """Per-item results of an array-input call, or None when the body is not
+    one entry per input (GLPI answers a plain error for whole-call failures)."""
+    data = safe_json(resp)
+    if isinstance(data, list) and len(data) == n and all(isinstance(x, dict) for x in data):
+        return data
+    return None
+
+
+def _item_message(item):
+    return str(item.get("message") or "").lower()
+
+
+def _already_solved(message):
+    """GLPI's refusal of a solution on a ticket that is solved / closed."""
+    message = (message or "").lower()
+    return "already solved" in message or "closed" in message
+
+
+def _rejected(resp):
+    """A whole-call 4xx: GLPI refused the array before storing any item, so
+    the per-ticket calls are safe. After a 5xx / proxy error it may already
+    have stored it, and re-posting would duplicate solutions / follow-ups."""
+    return 400 <= resp.status_code < 500
+
+
+def _item_status(resp):
+    """Status to report for one failed item (a 200/207 multi-status call still
+    means that item failed)."""
+    return resp.status_code if resp.status_code >= 400 else 400
+
+
+def glpi_send_chunk(token, ticket_ids, html_message, category_id, plan=None):
+    """Same outcome as glpi_send_one for every ticket in the chunk, with one
+    PUT /Ticket, one POST /Ticket_User, one POST /ITILSolution and (only for
+    tickets already solved) one POST /ITILFollowup. Steps whose response cannot
+    be mapped back per item fall back to the per-ticket call — for the solution
+    and follow-up POSTs only after a whole-call 4xx; after a 5xx or an error
+    mid-POST those tickets are reported OUTCOME_UNKNOWN and not re-sent. With a
+    glpi_plan() `plan`, each step only carries the tickets that need it.
+
+    Returns {ticket_id: result string}."""
+    plan = plan or {}
+    out = {}
+    for tid in ticket_ids:
+        done = _planned_result(plan.get(tid))
+        if done:
+            out[tid] = done
+    ids = [tid for tid in ticket_ids if tid not in out]
+    if not ids:
+        return out
+    followup_only = [tid for tid in ids if plan.get(tid, {}).get("action") == "followup"]
+    upd_warn = dict.fromkeys(ids, "")
+    assign_note = dict.fromkeys(ids, "")
+    solved, needs_followup, failed, followed, unknown = [], list(followup_only), {}, {}, {}
+    inflight, error = [], None    # tickets of the POST running when an exception hits
+    try:
+        # 1) status / category (a solved ticket only needs it for the category)
+        to_update = [tid for tid in ids if category_id or tid not in followup_only]
+        rows = []
+        for tid in to_update:
+            row = {"id": int(tid), "status": 5,
+                   "users_id_lastupdater": DEFAULT_USER_ID, "users_id_recipient": DEFAULT_USER_ID}
+            if category_id:
+                row["itilcategories_id"] = int(category_id)
+            rows.append(row)
+        if to_update:
+            upd = glpi_request("PUT", "/Ticket", token, json={"input": rows})
+            items = _items(upd, len(to_update))
+            if items is not None:
+                upd_warn.update({tid: "" if it.get(str(tid)) else f" (update {_item_status(upd)})"
+                                 for tid, it in zip(to_update, items)})
+            else:
+                for tid in to_update:
+                    r = glpi_update_ticket(token, tid, 5, category_id)
+                    upd_warn[tid] = "" if r.status_code < 400 else f" (update {r.status_code})"
+
+        # 2) assignee (Ticket_User type=2 — never touches requester / observers)
+        to_assign = [tid for tid in ids if not plan.get(tid, {}).get("assigned")]
+        if to_assign:
+            asg = glpi_request("POST", "/Ticket_User", token, json={"input": [
+                {"tickets_id": int(tid), "users_id": DEFAULT_USER_ID, "type": 2} for tid in to_assign
+            ]})
+            items = _items(asg, len(to_assign))
+            if items is not None:
+                assign_note.update({tid: "" if it.get("id") or "already" in _item_message(it) else " (assign?)"
+                                    for tid, it in zip(to_assign, items)})
+            else:
+                assign_note.update({tid: "" if glpi_assign_ticket(token, tid) else " (assign?)"
+                                    for tid in to_assign})
+
+        # 3) solutions — tickets that refuse one get a follow-up instead
+        to_solve = [tid for tid in ids if tid not in followup_only]
+        if to_solve:
+            inflight = to_solve
+            sol = glpi_request("POST", "/ITILSolution", token, json={"input": [
+                {"itemtype": "Ticket", "items_id": int(tid),
+                 "users_id": DEFAULT_USER_ID, "users_id_recipient": DEFAULT_USER_ID,
+                 "content": html_message, "solutiontypes_id": 10, "status": 5} for tid in to_solve
+            ]})
+            inflight = []
+            items = _items(sol, len(to_solve))
+            if items is not None:
+                for tid, it in zip(to_solve, items):
+                    if it.get("id"):
+                        solved.append(tid)
+                    elif _already_solved(_item_message(it)):
+                        # GLPI refuses a solution on solved/closed tickets
+                        needs_followup.append(tid)
+                    else:
+                        # permissions, validation, deleted ticket — a real failure
+                        failed[tid] = _item_status(sol)
+            elif _rejected(sol):
+                for tid in to_solve:
+                    inflight = [tid]
+                    r = glpi_add_solution(token, tid, html_message)
+                    inflight = []
+                    if r.status_code >= 400 and _already_solved(r.text):
+                        needs_followup.append(tid)
+                    elif r.status_code >= 400:
+                        failed[tid] = r.status_code
+                    else:
+                        solved.append(tid)
+            else:
+                unknown.update(dict.fromkeys(to_solve, f"solution {sol.status_code}"))
+
+        # 4) follow-ups for the already-solved ones
+        if needs_followup:
+            inflight = needs_followup
+            fu = glpi_request("POST", "/ITILFollowup", token, json={"input": [
+                {"itemtype": "Ticket", "items_id": int(tid),
+                 "users_id": DEFAULT_USER_ID, "users_id_recipient": DEFAULT_USER_ID,
+                 "content": html_message} for tid in needs_followup
+            ]})
+            inflight = []
+            items = _items(fu, len(needs_followup))
+            if items is not None:
+                followed = {tid: None if it.get("id") else _item_status(fu)
+                            for tid, it in zip(needs_followup, items)}
+            elif _rejected(fu):
+                for tid in needs_followup:
+                    inflight = [tid]
+                    r = glpi_add_followup(token, tid, html_message)
+                    inflight = []
+                    followed[tid] = None if r.status_code < 400 else r.status_code
+            else:
+                unknown.update(dict.fromkeys(needs_followup, f"follow-up {fu.status_code}"))
+    except Exception as e:
+        error = e
+        unknown.update(dict.fromkeys(inflight, f"{type(e).__name__}"))
+
+    for tid in ids:
+        tail = upd_warn[tid] + assign_note[tid]
+        if tid in solved:
+            out[tid] = "✅ Solution added" + tail
+        elif tid in failed:
+            out[tid] = f"❌ Solution failed ({failed[tid]})" + tail
+        elif tid in unknown:
+            out[tid] = f"{OUTCOME_UNKNOWN} ({unknown[tid]}) — not retried" + tail
+        elif tid in followed:
+            out[tid] = ("⚠️ Already solved — follow-up posted" if followed[tid] is None
+                        else f"❌ Follow-up failed ({followed[tid]})") + tail
+        else:
+            # the exception came before this ticket's solution / follow-up was sent
+            out[tid] = f"❌ Error: {error}"
+    return out
+
+
+def _send_chunk_journaled(token, ticket_ids, html_message, category_id, plan, journal):
+    ids = ticket_ids if journal is None else journal.begin(ticket_ids)
+    out = {tid: _NOT_CLAIMED for tid in ticket_ids if tid not in ids}
+    if ids:
+        sent = glpi_send_chunk(token, ids, html_message, category_id, plan)
+        if journal is not None:
+            for tid, result in sent.items():
+                journal.finish(tid, result)
+        out.update(sent)
+    return out
+
+
+def glpi_send_batched(token, ticket_ids, html_message, category_id, batch_size=None, workers=None,
+                      plan=None, journal=None, rate_limit=None, retries=None):
+    """Like glpi_send_many, but BATCH_SIZE tickets share each API call; chunks
+    run `workers` at a time. Yields (ticket_id, result) as chunks finish;
+    `journal` is told about a whole chunk at a time."""
+    size = max(1, batch_size or BATCH_SIZE)
+    chunks = [ticket_ids[i:i + size] for i in range(0, len(ticket_ids), size)]
+    workers = max(1, min(workers or MAX_WORKERS, len(chunks) or 1))
+    _pool_size(workers)
+    settings = _send_settings(rate_limit, retries)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="glpi") as pool:
+        futures = [pool.submit(_run_with, settings, _send_chunk_journaled, token, chunk, html_message,
+                               category_id, plan, journal)
+                   for chunk in chunks]
+        try:
+            for fut in as_completed(futures):
+                yield from fut.result().items()
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+
+_pool_size(MAX_WORKERS)
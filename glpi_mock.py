@@ -0,0 +1,445 @@
+# ==========================================================
+# GLPI MOCK — local stand-in for the GLPI REST API used by The Remitator
+# Implements the endpoints glpi_client.py calls, with GLPI's response
+# shapes (single and array inputs, per-item results, 401 on bad sessions):
+#
+#   GET  /initSession, /killSession, /search/Ticket  (fields 2 / 5 / 12; 5
+#        displays technician names, matched by user ID in criteria)
+#   PUT  /Ticket/{id}, /Ticket                    (status / category)
+#   POST /Ticket_User                              (assign technician)
+#   POST /ITILSolution                             (refused on solved/closed)
+#   POST /Ticket/{id}/ITILFollowup, /ITILFollowup  (refused on closed)
+#   POST /Document                                 (multipart upload)
+#   POST /Document_Item                            (link a document to a ticket)
+#   GET  /_stats                                   (mock only: counters as JSON)
+#
+# Tickets 1..--tickets exist; a share of them start solved / closed /
+# already assigned. Every call waits --latency-ms (± jitter, + --item-ms
+# per array item) and fails with 503 at --error-rate before doing anything,
+# so retries never double-apply. Nothing is persisted.
+#
+#   python glpi_mock.py --port 8765 --latency-ms 80 --error-rate 0.02
+#   → set GLPI_URL=http://127.0.0.1:8765 (any APP_TOKEN / USER_TOKEN)
+#
+# glpi_benchmark.py starts one in-process (MockGLPI(...).start()).
+# ==========================================================
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+NEW, ASSIGNED, SOLVED, CLOSED = 1, 2, 5, 6
+
+
+class MockGLPI:
+    """In-memory GLPI with configurable latency / errors. start() serves it
+    on a background thread; reset() restores the initial tickets."""
+
+    def __init__(self, tickets=500, latency_ms=50.0, jitter_ms=None, item_ms=1.0, error_rate=0.0,
+                 solved_rate=0.2, closed_rate=0.05, assigned_rate=0.3, tech_id=22487,
+                 session_ttl_s=None, seed=0, host="127.0.0.1", port=0):
+        self.n_tickets = tickets
+        self.latency_ms = latency_ms
+        self.jitter_ms = latency_ms / 4 if jitter_ms is None else jitter_ms
+        self.item_ms = item_ms
+        self.error_rate = error_rate
+        self.solved_rate = solved_rate
+        self.closed_rate = closed_rate
+        self.assigned_rate = assigned_rate
+        self.tech_id = tech_id
+        self.session_ttl_s = session_ttl_s
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+        self.reset()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="glpi-mock")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ------------------------------------------------------
+    # state
+    # ------------------------------------------------------
+    def reset(self):
+        rng = random.Random(self.seed)
+        with self._lock:
+            self.tickets = {}
+            for tid in range(1, self.n_tickets + 1):
+                r = rng.random()
+                status = CLOSED if r < self.closed_rate else SOLVED if r < self.closed_rate + self.solved_rate \
+                    else rng.choice([NEW, ASSIGNED])
+                techs = {self.tech_id} if rng.random() < self.assigned_rate else set()
+                if rng.random() < self.assigned_rate:
+                    # a colleague whose ID contains ours, like 224871 vs 22487
+                    techs.add(self.tech_id * 10 + rng.randint(0, 9))
+                self.tickets[tid] = {"status": status, "initial_status": status, "techs": techs,
+                                     "category": 0, "solutions": 0, "followups": 0, "documents": set()}
+            self.documents = {}
+            self.sessions = {}
+            self.calls = Counter()
+            self.items = Counter()
+            self.injected_errors = 0
+            self.logins = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "calls_total": sum(self.calls.values()),
+                "items": dict(self.items),
+                "injected_errors": self.injected_errors,
+                "logins": self.logins,
+                "open_sessions": len(self.sessions),
+                "documents": len(self.documents),
+                "uploaded_bytes": sum(d["size"] for d in self.documents.values()),
+            }
+
+    def ticket(self, tid):
+        with self._lock:
+            t = self.tickets.get(int(tid))
+            return {**t, "documents": set(t["documents"])} if t else None
+
+    # ------------------------------------------------------
+    # request handling
+    # ------------------------------------------------------
+    def _delay(self, n_items=1):
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+            fail = self._rng.random() < self.error_rate
+        time.sleep(max(0.0, self.latency_ms + jitter + self.item_ms * max(0, n_items - 1)) / 1000)
+        return fail
+
+    def _session_ok(self, headers):
+        token = headers.get("Session-Token")
+        with self._lock:
+            seen = self.sessions.get(token)
+            if seen is None:
+                return False
+            now = time.monotonic()
+            if self.session_ttl_s is not None and now - seen > self.session_ttl_s:
+                del self.sessions[token]
+                return False
+            self.sessions[token] = now
+            return True
+
+    def handle(self, method, raw_path, headers, body):
+        """→ (status, json-able body). Called from the HTTP handler threads."""
+        url = urlparse(raw_path)
+        path = url.path.rstrip("/")
+        endpoint = re.sub(r"/\d+", "/{id}", path)
+        data = body.get("input") if isinstance(body, dict) else None
+        n_items = len(data) if isinstance(data, list) else 1
+        with self._lock:
+            self.calls[f"{method} {endpoint}"] += 1
+            self.items[f"{method} {endpoint}"] += n_items
+        fail = self._delay(n_items)
+
+        if path == "/_stats":
+            return 200, self.stats()
+        if fail:
+            with self._lock:
+                self.injected_errors += 1
+            return 503, ["ERROR", "Service temporarily unavailable (mock)"]
+
+        if path == "/initSession":
+            if not headers.get("Authorization", "").startswith("user_token ") or not headers.get("App-Token"):
+                return 400, ["ERROR_LOGIN_PARAMETERS_MISSING", "parameter(s) login, password or user_token are missing"]
+            token = uuid.uuid4().hex
+            with self._lock:
+                self.sessions[token] = time.monotonic()
+                self.logins += 1
+            return 200, {"session_token": token}
+        if not self._session_ok(headers):
+            return 401, ["ERROR_SESSION_TOKEN_INVALID", "session_token seems invalid"]
+        if path == "/killSession":
+            with self._lock:
+                self.sessions.pop(headers.get("Session-Token"), None)
+            return 200, True
+
+        if method == "GET" and path == "/search/Ticket":
+            return self._search(parse_qsl(url.query))
+        if method == "POST" and path == "/Document":
+            return self._upload(body)
+
+        route = {
+            ("PUT", "/Ticket"): self._update,
+            ("PUT", "/Ticket/{id}"): self._update,
+            ("POST", "/Ticket_User"): self._assign,
+            ("POST", "/ITILSolution"): self._solution,
+            ("POST", "/ITILFollowup"): self._followup,
+            ("POST", "/Ticket/{id}/ITILFollowup"): self._followup,
+            ("POST", "/Document_Item"): self._link,
+        }.get((method, endpoint))
+        if route is None:
+            return 400, ["ERROR_RESOURCE_NOT_FOUND_NOR_COMMONDBTM", "resource not found (mock)"]
+        if isinstance(data, list):
+            results = [route(item) for item in data]
+            out = [{str(item.get("id")): ok, "message": msg} if method == "PUT" else
+                   {"id": new_id if ok else False, "message": msg}
+                   for item, (ok, msg, new_id) in zip(data, results)]
+            return (200 if all(r[0] for r in results) else 207), out
+        if not isinstance(data, dict):
+            return 400, ["ERROR_BAD_ARRAY", "input parameter must be an array of objects"]
+        ok, msg, new_id = route(data)
+        if ok:
+            return (200, [{str(data.get("id")): True, "message": ""}]) if method == "PUT" \
+                else (201, {"id": new_id, "message": ""})
+        code = 404 if msg.startswith("Item not found") else 400
+        return code, ["ERROR_ITEM_NOT_FOUND" if code == 404 else "ERROR_GLPI_ADD", msg]
+
+    # each route → (ok, message, new id)
+    def _new_id(self):
+        return self._rng.randint(10**5, 10**7)
+
+    def _update(self, item):
+        with self._lock:
+            t = self.tickets.get(int(item.get("id", 0)))
+            if t is None:
+                return False, "Item not found", None
+            if "status" in item and t["status"] != CLOSED:
+                t["status"] = int(item["status"])
+            if item.get("itilcategories_id"):
+                t["category"] = int(item["itilcategories_id"])
+            return True, "", None
+
+    def _assign(self, item):
+        with self._lock:
+            t = self.tickets.get(int(item.get("tickets_id", 0)))
+            if t is None:
+                return False, "Item not found", None
+            uid = int(item.get("users_id", 0))
+            if uid in t["techs"]:
+                return False, "This user is already assigned to this ticket", None
+            t["techs"].add(uid)
+            return True, "", self._new_id()
+
+    def _solution(self, item):
+        with self._lock:
+            t = self.tickets.get(int(item.get("items_id", 0)))
+            if t is None:
+                return False, "Item not found", None
+            # the status PUT alone does not count — GLPI refuses a second
+            # solution once one has been approved / the ticket was solved by it
+            if t["initial_status"] in (SOLVED, CLOSED) or t["solutions"]:
+                return False, "The item is already solved", None
+            t["solutions"] += 1
+            t["status"] = SOLVED
+            return True, "", self._new_id()
+
+    def _followup(self, item):
+        with self._lock:
+            t = self.tickets.get(int(item.get("items_id", 0)))
+            if t is None:
+                return False, "Item not found", None
+            if t["status"] == CLOSED:
+                return False, "You don't have permission to add a followup on a closed ticket", None
+            t["followups"] += 1
+            return True, "", self._new_id()
+
+    def _upload(self, body):
+        """multipart: an 'uploadManifest' JSON part + the file part(s)."""
+        parts = body.get("_multipart") if isinstance(body, dict) else None
+        if not parts or "uploadManifest" not in parts:
+            return 400, ["ERROR_UPLOAD_FILE_TOO_BIG_POST_MAX_SIZE", "uploadManifest missing (mock)"]
+        try:
+            manifest = json.loads(parts["uploadManifest"])["input"]
+        except (ValueError, KeyError, TypeError):
+            return 400, ["ERROR_JSON_PAYLOAD_INVALID", "uploadManifest is not valid JSON"]
+        files = {k: v for k, v in parts.items() if k.startswith("filename")}
+        if not files:
+            return 400, ["ERROR_GLPI_ADD", "no file part (mock)"]
+        data = next(iter(files.values()))
+        with self._lock:
+            doc_id = self._new_id()
+            self.documents[doc_id] = {"name": manifest.get("name"), "size": len(data),
+                                      "sha1": hashlib.sha1(data).hexdigest()}
+        return 201, {"id": doc_id, "message": f"Document {manifest.get('name')} added",
+                     "upload_result": {"filename": [{"name": manifest.get("name"), "size": len(data)}]}}
+
+    def _link(self, item):
+        with self._lock:
+            doc = int(item.get("documents_id", 0))
+            t = self.tickets.get(int(item.get("items_id", 0)))
+            if doc not in self.documents:
+                return False, "Item not found: document", None
+            if t is None or item.get("itemtype") != "Ticket":
+                return False, "Item not found", None
+            if doc in t["documents"]:
+                return False, "Duplicate entry: document already linked", None
+            t["documents"].add(doc)
+            return True, "", self._new_id()
+
+    def _search(self, params):
+        """GET /search/Ticket: criteria (nested groups too) on fields 2 (id),
+        5 (technician user ID) and 12 (status), `forcedisplay` columns, `range`.
+        Like GLPI, field 5 displays technician names joined with '$#$'."""
+        criteria = _criteria_tree(params)
+        shown = {str(v) for k, v in params if k.startswith("forcedisplay")} or {"2", "5", "12"}
+        rng = dict(params).get("range", "0-49")
+        start, end = (int(x) for x in rng.split("-"))
+        # every query glpi_client makes names its tickets — don't scan the rest
+        named = [int(c["value"]) for c in _leaves(criteria) if str(c.get("field")) == "2"
+                 and str(c.get("value", "")).isdigit()]
+        with self._lock:
+            rows = []
+            for tid in dict.fromkeys(named) if named else self.tickets:
+                t = self.tickets.get(tid)
+                if t is None or not _matches(tid, t, criteria):
+                    continue
+                row = {"2": tid, "12": t["status"],
+                       "5": "$#$".join(self.user_name(u) for u in sorted(t["techs"])) or None}
+                rows.append({k: v for k, v in row.items() if k in shown | {"2"}})
+        page = rows[start:end + 1]
+        return (206 if len(page) < len(rows) else 200), \
+            {"totalcount": len(rows), "count": len(page), "sort": 1, "order": "ASC", "data": page}
+
+    @staticmethod
+    def user_name(uid):
+        """Display name of a user, as the search engine shows it."""
+        return f"Tech {uid}"
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                ctype = self.headers.get("Content-Type", "")
+                if ctype.startswith("multipart/form-data"):
+                    body = {"_multipart": _multipart(ctype, raw)}
+                else:
+                    try:
+                        body = json.loads(raw) if raw else {}
+                    except ValueError:
+                        body = {}
+                code, payload = mock.handle(self.command, self.path, self.headers, body)
+                out = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            do_GET = do_PUT = do_POST = _serve
+
+        return Handler
+
+
+def _multipart(ctype, raw):
+    """{field name: bytes (files) / str (fields)} of a multipart/form-data body."""
+    msg = BytesParser(policy=default_policy).parsebytes(
+        f"Content-Type: {ctype}\r\n\r\n".encode() + raw)
+    out = {}
+    for part in msg.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        payload = part.get_payload(decode=True) or b""
+        out[name] = payload if part.get_filename() else payload.decode("utf-8", "replace")
+    return out
+
+
+def _criteria_tree(params):
+    """criteria[0][field]=…, criteria[0][criteria][3][value]=… → list of
+    criteria dicts; a group carries its own list under "criteria"."""
+    root = {}
+    for key, value in params:
+        if not key.startswith("criteria["):
+            continue
+        parts = re.findall(r"\[([^\]]*)\]", key)
+        node = root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return _criteria_list(root)
+
+
+def _criteria_list(node):
+    return [dict(node[k], criteria=_criteria_list(node[k]["criteria"])) if "criteria" in node[k]
+            else node[k] for k in sorted(node, key=int)]
+
+
+def _leaves(criteria):
+    for c in criteria:
+        if "criteria" in c:
+            yield from _leaves(c["criteria"])
+        else:
+            yield c
+
+
+def _matches(tid, t, criteria):
+    """Criteria applied left to right with their AND / OR (/ AND NOT) links."""
+    result = None
+    for c in criteria:
+        if "criteria" in c:
+            hit = _matches(tid, t, c["criteria"])
+        else:
+            field, value = str(c.get("field")), str(c.get("value", ""))
+            actual = {"2": {str(tid)}, "12": {str(t["status"])},
+                      "5": {str(u) for u in t["techs"]}}.get(field, set())
+            hit = value in actual
+        link = str(c.get("link", "AND")).upper()
+        if result is None:
+            result = not hit if link.endswith("NOT") else hit
+        elif link == "OR":
+            result = result or hit
+        elif link == "OR NOT":
+            result = result or not hit
+        elif link == "AND NOT":
+            result = result and not hit
+        else:
+            result = result and hit
+    return True if result is None else result
+
+def main():
+    ap = argparse.ArgumentParser(description="Local GLPI REST stand-in for The Remitator")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--tickets", type=int, default=500, help="tickets 1..N exist")
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="per call")
+    ap.add_argument("--item-ms", type=float, default=1.0, help="extra per array-input item")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered 503")
+    ap.add_argument("--solved-rate", type=float, default=0.2, help="share of tickets already solved")
+    ap.add_argument("--closed-rate", type=float, default=0.05, help="share of tickets closed")
+    ap.add_argument("--session-ttl", type=float, default=None, help="idle seconds before a session 401s")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    mock = MockGLPI(tickets=args.tickets, latency_ms=args.latency_ms, item_ms=args.item_ms,
+                    error_rate=args.error_rate, solved_rate=args.solved_rate, closed_rate=args.closed_rate,
+                    session_ttl_s=args.session_ttl, seed=args.seed, port=args.port)
+    print(f"GLPI mock on {mock.url} — tickets 1..{args.tickets} (Ctrl+C to stop)")
+    try:
+        mock._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
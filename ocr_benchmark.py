@@ -0,0 +1,300 @@
+# ==========================================================
+# 🦅 DataFalcon OCR — benchmark & regression suite
+# Generates synthetic invoices (Spanish / Greek / English; clean, skewed,
+# rotated 90°, noisy), scans them into image-only PDFs and runs them
+# through the worker's OCR path (text-layer check → rasterize at OCR_DPI →
+# cascade / tiling). Reports pages/sec, per-page latency, peak RSS and
+# character error rate (CER) against the generated ground truth.
+#
+# Results are written as JSON so runs can be compared over time:
+#   python ocr_benchmark.py --pages 6 --out ocr_bench_results/today.json
+#   python ocr_benchmark.py --compare ocr_bench_results/last_week.json
+#
+# Worker settings (OCR_DPI, OCR_CASCADE, OCR_MODEL_MODE, ...) are read from
+# the environment exactly as in production. The page cache is bypassed.
+# ==========================================================
+
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import time
+
+import numpy as np
+import fitz  # PyMuPDF
+from PIL import Image
+
+import ocr_worker
+from ocr_quant_compare import cer
+
+LANGS = ("es", "el", "en")
+VARIANTS = ("clean", "skew", "rot90", "noise")
+A4 = fitz.paper_rect("a4")
+
+VOCAB = {
+    "es": {
+        "title": "FACTURA Nº {n}",
+        "vendor": "Proveedor: {v} S.L.",
+        "tax": "CIF: B{d8}",
+        "date": "Fecha: {date}",
+        "items": ["Servicio de limpieza", "Suministro de material de oficina",
+                  "Mantenimiento de piscina", "Lavandería de habitaciones", "Transporte de mercancías"],
+        "subtotal": "Base imponible", "vat": "IVA 21%", "total": "TOTAL FACTURA",
+        "vendors": ["Limpiezas Costa", "Suministros Muñoz", "Transportes Peña", "Hostelería Andaluza"],
+    },
+    "el": {
+        "title": "ΤΙΜΟΛΟΓΙΟ ΠΑΡΟΧΗΣ ΥΠΗΡΕΣΙΩΝ Αρ. {n}",
+        "vendor": "Προμηθευτής: {v} Α.Ε.",
+        "tax": "ΑΦΜ: {d9}",
+        "date": "Ημερομηνία: {date}",
+        "items": ["Υπηρεσίες καθαρισμού", "Προμήθεια γραφικής ύλης",
+                  "Συντήρηση πισίνας", "Πλυντήριο δωματίων", "Μεταφορά εμπορευμάτων"],
+        "subtotal": "Καθαρή αξία", "vat": "ΦΠΑ 24%", "total": "ΣΥΝΟΛΟ ΤΙΜΟΛΟΓΙΟΥ",
+        "vendors": ["Καθαριότητα Αιγαίου", "Εμπορική Κρήτης", "Μεταφορές Παπαδόπουλος"],
+    },
+    "en": {
+        "title": "INVOICE No. {n}",
+        "vendor": "Supplier: {v} Ltd",
+        "tax": "VAT number: GB{d9}",
+        "date": "Date: {date}",
+        "items": ["Cleaning services", "Office supplies", "Pool maintenance",
+                  "Room laundry", "Freight transport"],
+        "subtotal": "Subtotal", "vat": "VAT 20%", "total": "INVOICE TOTAL",
+        "vendors": ["Harbour Cleaning", "Northwind Supplies", "Atlas Freight"],
+    },
+}
+VAT_RATE = {"es": 0.21, "el": 0.24, "en": 0.20}
+
+
+def fmt_amount(v, lang):
+    s = f"{v:,.2f}"
+    if lang in ("es", "el"):
+        s = s.replace(",", "_").replace(".", ",").replace("_", ".")
+    return s + (" €" if lang != "en" else " EUR")
+
+
+def invoice_lines(rng, lang):
+    voc = VOCAB[lang]
+    lines = [
+        voc["title"].format(n=f"{rng.randint(2020, 2026)}-{rng.randint(1, 99999):05d}"),
+        voc["vendor"].format(v=rng.choice(voc["vendors"])),
+        voc["tax"].format(d8=rng.randint(10**7, 10**8 - 1), d9=rng.randint(10**8, 10**9 - 1)),
+        voc["date"].format(date=f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2020, 2026)}"),
+        "",
+    ]
+    subtotal = 0.0
+    for item in rng.sample(voc["items"], rng.randint(2, len(voc["items"]))):
+        qty = rng.randint(1, 20)
+        price = round(rng.uniform(5, 900), 2)
+        subtotal += qty * price
+        lines.append(f"{item}   {qty} x {fmt_amount(price, lang)}   {fmt_amount(qty * price, lang)}")
+    vat = round(subtotal * VAT_RATE[lang], 2)
+    lines += [
+        "",
+        f"{voc['subtotal']}: {fmt_amount(subtotal, lang)}",
+        f"{voc['vat']}: {fmt_amount(vat, lang)}",
+        f"{voc['total']}: {fmt_amount(subtotal + vat, lang)}",
+    ]
+    return lines
+
+
+def render_invoice(lines, scan_dpi):
+    """Typeset the invoice as a vector PDF page and 'scan' it to an image.
+
+    Returns (PIL image, ground-truth text as extracted from the vector page)."""
+    doc = fitz.open()
+    try:
+        page = doc.new_page(width=A4.width, height=A4.height)
+        html = "".join(f"<p>{l or '&nbsp;'}</p>" for l in lines)
+        page.insert_htmlbox(fitz.Rect(56, 56, A4.width - 56, A4.height - 56), html,
+                            css="p {font-family: sans-serif; font-size: 12px; margin: 0 0 6px 0;}")
+        truth = page.get_text("text")
+        pix = page.get_pixmap(dpi=scan_dpi, colorspace=fitz.csRGB, alpha=False)
+        img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    finally:
+        doc.close()
+    return img, truth
+
+
+def degrade(img, variant, rng):
+    if variant == "skew":
+        return img.rotate(rng.uniform(-3, 3), resample=Image.BICUBIC, expand=True, fillcolor="white")
+    if variant == "rot90":
+        return img.rotate(90, expand=True)
+    if variant == "noise":
+        arr = np.asarray(img).astype(np.float32)
+        nrng = np.random.default_rng(rng.randint(0, 2**31))
+        arr += nrng.standard_normal(arr.shape, dtype=np.float32) * 18
+        speckle = nrng.random(arr.shape[:2])
+        arr[speckle < 0.005] = 0
+        arr[speckle > 0.995] = 255
+        return Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+    return img
+
+
+def image_pdf(img):
+    """Wrap a scan into a one-page, image-only PDF (no text layer)."""
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85)  # scanners deliver JPEG-compressed images
+    landscape = img.width > img.height
+    w, h = (A4.height, A4.width) if landscape else (A4.width, A4.height)
+    doc = fitz.open()
+    try:
+        page = doc.new_page(width=w, height=h)
+        page.insert_image(page.rect, stream=buf.getvalue())
+        return doc.tobytes()
+    finally:
+        doc.close()
+
+
+def build_dataset(pages_per_case, scan_dpi, seed):
+    """Yield cases one at a time so generation never dominates peak RSS."""
+    rng = random.Random(seed)
+    for lang in LANGS:
+        for variant in VARIANTS:
+            for k in range(pages_per_case):
+                img, truth = render_invoice(invoice_lines(rng, lang), scan_dpi)
+                yield {"lang": lang, "variant": variant, "id": f"{lang}-{variant}-{k}",
+                       "pdf": image_pdf(degrade(img, variant, rng)), "truth": truth}
+
+
+def ocr_document(pdf_bytes):
+    """The /ocr page loop without HTTP or the page cache."""
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        texts = []
+        for page in doc:
+            text = ocr_worker.embedded_text(page)
+            if text is None:
+                text = ocr_worker.run_tiled(ocr_worker.rasterize(page)).text
+            texts.append(text)
+        return "\n\n".join(texts), doc.page_count
+    finally:
+        doc.close()
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _summary(rows):
+    lat = [r["seconds"] for r in rows]
+    total = sum(lat)
+    return {
+        "pages": sum(r["pages"] for r in rows),
+        "pages_per_sec": round(sum(r["pages"] for r in rows) / total, 4) if total else None,
+        "latency_p50_s": round(statistics.median(lat), 4) if lat else None,
+        "latency_p95_s": round(sorted(lat)[max(0, int(len(lat) * 0.95) - 1)], 4) if lat else None,
+        "cer_mean": round(statistics.mean(r["cer"] for r in rows), 4) if rows else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    t0 = time.perf_counter()
+    ocr_worker.load_models()
+    load_s = time.perf_counter() - t0
+    rss_after_load = peak_rss_mb()
+
+    print(f"Running {len(LANGS) * len(VARIANTS) * args.pages} synthetic pages "
+          f"({', '.join(LANGS)} × {', '.join(VARIANTS)} × {args.pages})")
+
+    rows = []
+    ocr_s = 0.0
+    wall0 = time.perf_counter()
+    for case in build_dataset(args.pages, args.scan_dpi, args.seed):
+        t = time.perf_counter()
+        text, pages = ocr_document(case["pdf"])
+        rows.append({"id": case["id"], "lang": case["lang"], "variant": case["variant"],
+                     "pages": pages, "seconds": round(time.perf_counter() - t, 4),
+                     "cer": round(cer(text, case["truth"]), 4)})
+        ocr_s += rows[-1]["seconds"]
+    wall = time.perf_counter() - wall0
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {
+            "ocr_dpi": ocr_worker.OCR_DPI,
+            "scan_dpi": args.scan_dpi,
+            "cascade": ocr_worker.cascade_signature(),
+            "model_mode": ocr_worker.OCR_MODEL_MODE,
+            "script_routing": ocr_worker.SCRIPT_ROUTING,
+            "seed": args.seed,
+            "pages_per_case": args.pages,
+        },
+        "model_load_s": round(load_s, 3),
+        "wall_s": round(wall, 3),
+        "ocr_s": round(ocr_s, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rss_after_load_mb": round(rss_after_load, 1),
+        "overall": _summary(rows),
+        "by_lang": {l: _summary([r for r in rows if r["lang"] == l]) for l in LANGS},
+        "by_variant": {v: _summary([r for r in rows if r["variant"] == v]) for v in VARIANTS},
+        "pages": rows,
+    }
+    return report
+
+
+def print_report(report, previous=None):
+    def line(name, cur, prev):
+        delta = ""
+        if prev and prev.get("pages_per_sec") and cur.get("pages_per_sec"):
+            delta = (f"   Δ pages/s {cur['pages_per_sec'] - prev['pages_per_sec']:+.3f}"
+                     f"  Δ CER {cur['cer_mean'] - prev['cer_mean']:+.4f}")
+        print(f"{name:<10} {cur['pages']:>5} {cur['pages_per_sec'] or 0:>9.3f} "
+              f"{cur['latency_p50_s'] or 0:>8.3f} {cur['latency_p95_s'] or 0:>8.3f} "
+              f"{cur['cer_mean'] if cur['cer_mean'] is not None else 0:>7.4f}{delta}")
+
+    print(f"\n{'group':<10} {'pages':>5} {'pages/s':>9} {'p50 s':>8} {'p95 s':>8} {'CER':>7}")
+    line("overall", report["overall"], previous and previous.get("overall"))
+    for key in ("by_lang", "by_variant"):
+        for name, cur in report[key].items():
+            line(name, cur, previous and previous.get(key, {}).get(name))
+    print(f"\npeak RSS {report['peak_rss_mb']} MB (after model load {report['rss_after_load_mb']} MB) · "
+          f"model load {report['model_load_s']}s · OCR {report['ocr_s']}s · "
+          f"wall incl. generation {report['wall_s']}s")
+    if previous:
+        print(f"compared with {previous.get('timestamp')} (commit {previous.get('commit')}, "
+              f"cascade {previous.get('config', {}).get('cascade')})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OCR accuracy vs throughput benchmark for ocr_worker.py")
+    ap.add_argument("--pages", type=int, default=3, help="pages per language × variant")
+    ap.add_argument("--scan-dpi", type=int, default=300, help="resolution of the simulated scans")
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--out", help="JSON file for the results (default ocr_bench_results/<timestamp>.json)")
+    ap.add_argument("--compare", help="previous results JSON to diff against")
+    args = ap.parse_args()
+
+    report = run(args)
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+    print_report(report, previous)
+
+    out = args.out or os.path.join(
+        "ocr_bench_results", datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# ==========================================================
+# 🦅 DataFalcon OCR — int8 vs float32 comparison
+# Runs the same local test set through EasyOCR in both model modes
+# and reports per-page latency + character error rate (CER).
+# int8 is EasyOCR's default and what the worker has always run; float32 is
+# the full-precision baseline (readers built by ocr_worker.easyocr_reader,
+# so the CRAFT detector is unquantized too).
+#
+# Test set layout (one folder):
+#   invoice_01.png   + invoice_01.txt   (ground truth)
+#   statement_02.pdf + statement_02.txt (all pages, joined)
+# Files without a .txt are still timed, just not scored.
+#
+# Usage:
+#   python ocr_quant_compare.py ./ocr_testset --dpi 200 --json quant_report.json
+# ==========================================================
+
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+
+import fitz  # PyMuPDF
+import Levenshtein
+import numpy as np
+from PIL import Image
+
+from ocr_worker import easyocr_reader
+
+LANGUAGES = ['es', 'el', 'en']
+IMAGE_EXT = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+
+def load_pages(path, dpi):
+    """Return the file as a list of RGB numpy arrays (one per page)."""
+    if path.lower().endswith(".pdf"):
+        doc = fitz.open(path)
+        try:
+            pages = []
+            for page in doc:
+                pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+                pages.append(np.frombuffer(pix.samples, dtype=np.uint8)
+                             .reshape(pix.height, pix.width, pix.n).copy())
+            return pages
+        finally:
+            doc.close()
+    return [np.array(Image.open(path).convert("RGB"))]
+
+
+def load_testset(folder, dpi):
+    items = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if not name.lower().endswith(IMAGE_EXT + (".pdf",)):
+            continue
+        truth_path = os.path.splitext(path)[0] + ".txt"
+        truth = None
+        if os.path.exists(truth_path):
+            with open(truth_path, encoding="utf-8") as f:
+                truth = f.read()
+        items.append({"name": name, "pages": load_pages(path, dpi), "truth": truth})
+    return items
+
+
+def _norm(text):
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def cer(hyp, ref):
+    ref = _norm(ref)
+    if not ref:
+        return 0.0 if not _norm(hyp) else 1.0
+    return Levenshtein.distance(_norm(hyp), ref) / len(ref)
+
+
+def run_mode(mode, items, warmup=1):
+    reader = easyocr_reader(LANGUAGES, mode)
+    # first inference pays for lazy allocations — keep it out of the timings
+    if items and warmup:
+        reader.readtext(items[0]["pages"][0], detail=0, paragraph=True)
+
+    latencies, errors, files = [], [], []
+    for item in items:
+        texts = []
+        for img in item["pages"]:
+            t0 = time.perf_counter()
+            texts.append("\n".join(reader.readtext(img, detail=0, paragraph=True)))
+            latencies.append(time.perf_counter() - t0)
+        text = "\n\n".join(texts)
+        score = cer(text, item["truth"]) if item["truth"] is not None else None
+        if score is not None:
+            errors.append(score)
+        files.append({"file": item["name"], "pages": len(item["pages"]), "cer": score})
+
+    return {
+        "mode": mode,
+        "pages": len(latencies),
+        "sec_per_page_mean": statistics.mean(latencies) if latencies else None,
+        "sec_per_page_median": statistics.median(latencies) if latencies else None,
+        "cer_mean": statistics.mean(errors) if errors else None,
+        "files": files,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare int8 vs float32 EasyOCR on a local test set.")
+    ap.add_argument("folder", help="folder with images/PDFs and matching .txt ground truth")
+    ap.add_argument("--dpi", type=int, default=int(os.getenv("OCR_DPI", "200")))
+    ap.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = torch default)")
+    ap.add_argument("--json", help="write the full report to this file")
+    args = ap.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    items = load_testset(args.folder, args.dpi)
+    if not items:
+        raise SystemExit(f"No images or PDFs found in {args.folder}")
+    print(f"Loaded {len(items)} files / {sum(len(i['pages']) for i in items)} pages at {args.dpi} dpi")
+
+    report = {"dpi": args.dpi, "modes": [run_mode(m, items) for m in ("float32", "int8")]}
+    base, quant = report["modes"]
+    if base["sec_per_page_mean"] and quant["sec_per_page_mean"]:
+        report["speedup"] = base["sec_per_page_mean"] / quant["sec_per_page_mean"]
+    if base["cer_mean"] is not None and quant["cer_mean"] is not None:
+        report["cer_delta"] = quant["cer_mean"] - base["cer_mean"]
+
+    print(f"{'mode':<8} {'pages':>5} {'s/page':>8} {'median':>8} {'CER':>7}")
+    for m in report["modes"]:
+        cer_txt = f"{m['cer_mean']:.4f}" if m["cer_mean"] is not None else "    n/a"
+        print(f"{m['mode']:<8} {m['pages']:>5} {m['sec_per_page_mean']:>8.3f} "
+              f"{m['sec_per_page_median']:>8.3f} {cer_txt:>7}")
+    if "speedup" in report:
+        print(f"int8 speed-up: {report['speedup']:.2f}×")
+    if "cer_delta" in report:
+        print(f"CER change (int8 - float32): {report['cer_delta']:+.4f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,45 @@
-from fastapi import FastAPI, File, UploadFile
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import numpy as np
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+from fastapi import FastAPI, File, UploadFile, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pdf2image import convert_from_bytes
-import easyocr
+from fastapi.middleware.gzip import GZipMiddleware
+
+try:
+    import pytesseract
+except ImportError:  # Tesseract is optional — the cascade then runs EasyOCR only
+    pytesseract = None
 
 # ==========================================================
 # 🦅 DataFalcon OCR Worker
 # Cloud OCR service for Spanish, Greek, and English PDFs
 # ==========================================================
 
+@asynccontextmanager
+async def lifespan(app):
+    # models load in the background so uvicorn binds its port immediately;
+    # /ready turns 200 only once the warm-up inference has run
+    start_model_loading()
+    yield
+
+
 app = FastAPI(
     title="🦅 DataFalcon OCR Worker",
     description="Cloud OCR service for scanned PDFs (Spanish, Greek, English)",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan
 )
 
 # Allow access from Streamlit / other origins
@@ -22,45 +49,904 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"]
 )
+# layout responses are large but highly repetitive — compress for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+# A page counts as "already digital" when its embedded text layer has at least
+# this many letters/digits — below that it is treated as a scan and OCR'd.
+MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "25"))
+
+# Page-result cache: in-memory LRU in front of a SQLite file that survives restarts.
+CACHE_DIR = os.getenv("OCR_CACHE_DIR", ".ocr_cache")
+CACHE_MEM_ITEMS = int(os.getenv("OCR_CACHE_MEM_ITEMS", "512"))
+CACHE_DISK_ITEMS = int(os.getenv("OCR_CACHE_DISK_ITEMS", "20000"))
+LANGUAGES = ['es', 'el', 'en']
+
+# Cheap-first cascade: engines run in this order; a page (or a low-confidence
+# line of it) only moves to the next engine when it scores below the threshold.
+OCR_CASCADE = [e.strip() for e in os.getenv("OCR_CASCADE", "tesseract,easyocr").split(",") if e.strip()]
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "spa+ell+eng")
+TESSERACT_SCRIPT_LANG = {"latin": "spa+eng", "greek": "ell+eng"}
+TESSERACT_MIN_CONF = float(os.getenv("TESSERACT_MIN_CONF", "0.80"))
+EASYOCR_MIN_CONF = float(os.getenv("EASYOCR_MIN_CONF", "0.50"))
+# If more than this share of a page's lines is low-confidence, re-OCR the whole
+# page with the next engine instead of patching line by line.
+REGION_ESCALATION_MAX_SHARE = float(os.getenv("OCR_REGION_ESCALATION_MAX_SHARE", "0.30"))
+
+# Time budgets in seconds (0 = unlimited, the default — long documents are
+# OCR'd completely unless a deployment opts in). Work is checked between pages
+# and between OCR stages; when a budget runs out the partial result is
+# returned with "truncated": true. Both can be overridden per request.
+OCR_PAGE_BUDGET_S = float(os.getenv("OCR_PAGE_BUDGET_S", "0"))
+OCR_DOC_BUDGET_S = float(os.getenv("OCR_DOC_BUDGET_S", "0"))
+DISCONNECT_POLL_S = 0.5
+
+# Oversized pages (A3 ledgers, long statements scanned as one image) are split
+# into overlapping tiles OCR'd in parallel. Overlap must exceed a text line.
+TILE_MAX_SIDE = int(os.getenv("OCR_TILE_MAX_SIDE", "4000"))
+TILE_MAX_PIXELS = int(os.getenv("OCR_TILE_MAX_PIXELS", "16000000"))
+TILE_SIZE = int(os.getenv("OCR_TILE_SIZE", "2048"))
+TILE_OVERLAP = int(os.getenv("OCR_TILE_OVERLAP", "160"))
+TILE_WORKERS = int(os.getenv("OCR_TILE_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Script-aware routing: Latin pages skip the Greek recognizer and vice versa.
+# "mixed" (the full set) is used when the detector is unsure.
+SCRIPT_ROUTING = os.getenv("OCR_SCRIPT_ROUTING", "1") == "1"
+READER_LANGUAGES = {
+    "latin": ['es', 'en'],
+    "greek": ['el', 'en'],
+    "mixed": LANGUAGES,
+}
+SCRIPT_MIN_LETTERS = int(os.getenv("OCR_SCRIPT_MIN_LETTERS", "20"))
+SCRIPT_DOMINANCE = float(os.getenv("OCR_SCRIPT_DOMINANCE", "0.85"))
+
+# Model precision on CPU nodes. "int8" is EasyOCR's own default (quantize=True:
+# dynamically quantized LSTM/Linear layers) — what the worker always ran.
+# "float32" is the full-precision baseline: recognizer and detector both left
+# unquantized. Compare both on your own pages with ocr_quant_compare.py.
+OCR_MODEL_MODE = os.getenv("OCR_MODEL_MODE", "int8").strip().lower()
+if OCR_MODEL_MODE not in ("int8", "float32"):
+    raise ValueError(f"OCR_MODEL_MODE must be 'int8' or 'float32', got '{OCR_MODEL_MODE}'")
+
+
+def build_readers(mode=OCR_MODEL_MODE):
+    """Initialize the EasyOCR reader pool ONCE (called by load_models).
+
+    All readers share one text detector (CRAFT is language independent), so
+    the pool only adds recognizer weights and every reader stays warm."""
+    pool = {"mixed": easyocr_reader(READER_LANGUAGES["mixed"], mode)}
+    if SCRIPT_ROUTING:
+        for script in ("latin", "greek"):
+            r = easyocr_reader(READER_LANGUAGES[script], mode, detector=False)
+            share_detector(r, pool["mixed"])
+            pool[script] = r
+    return pool
+
+
+def easyocr_reader(languages, mode=OCR_MODEL_MODE, detector=True):
+    """One CPU easyocr.Reader in the given model mode.
+
+    EasyOCR 1.7 keeps `quantize` as a one-element tuple for the detector, so
+    CRAFT is quantized whatever is passed — float32 rebuilds it unquantized."""
+    import easyocr  # pulls in torch — kept out of module import on purpose
+    quantize = mode == "int8"
+    r = easyocr.Reader(languages, gpu=False, detector=detector, quantize=quantize)
+    if detector and not quantize:
+        r.quantize = False
+        r.setDetector(r.detect_network)
+    return r
+
+
+def share_detector(reader, source):
+    """Give a detector=False reader the detector of `source`.
+
+    EasyOCR binds the detection functions (get_textbox / get_detector) in
+    getDetectorPath, which only runs with detector=True — the model alone
+    is not enough for readtext()."""
+    for attr in ("detector", "detect_network", "get_textbox", "get_detector"):
+        setattr(reader, attr, getattr(source, attr))
+
+
+# filled in by load_models() — see MODEL LIFECYCLE below
+readers = {}
+reader = None
+
+
+# ----------------------------------------------------------
+# SCRIPT DETECTION
+# ----------------------------------------------------------
+def _is_greek(ch):
+    return "\u0370" <= ch <= "\u03ff" or "\u1f00" <= ch <= "\u1fff"
+
+
+def script_from_text(text):
+    """Classify text as 'latin' / 'greek' / 'mixed', or None if too few letters."""
+    greek = latin = 0
+    for ch in text or "":
+        if not ch.isalpha():
+            continue
+        if _is_greek(ch):
+            greek += 1
+        else:
+            latin += 1
+    letters = greek + latin
+    if letters < SCRIPT_MIN_LETTERS:
+        return None
+    if greek / letters >= SCRIPT_DOMINANCE:
+        return "greek"
+    if latin / letters >= SCRIPT_DOMINANCE:
+        return "latin"
+    return "mixed"
+
+
+def detect_script(img, hint_text=None):
+    """Cheap per-page/region script detector.
+
+    Uses text we already have (e.g. the Tesseract pass) when it has enough
+    letters, otherwise Tesseract's orientation-and-script detection."""
+    if not SCRIPT_ROUTING:
+        return "mixed"
+    script = script_from_text(hint_text)
+    if script:
+        return script
+    if pytesseract is not None:
+        try:
+            osd = pytesseract.image_to_osd(img, output_type=pytesseract.Output.DICT)
+            name = str(osd.get("script", "")).lower()
+            if name in ("latin", "greek") and float(osd.get("script_conf", 0)) >= 1.0:
+                return name
+        except Exception:
+            pass  # too little text for OSD, or no osd.traineddata
+    return "mixed"
+
+
+# ----------------------------------------------------------
+# OCR ENGINES
+# ----------------------------------------------------------
+class OCRResult:
+    """Text of one image with its confidence (0-1) and the lines it was built from.
+
+    `lines` holds (x, y, w, h, text, conf) tuples in reading order; the cascade
+    uses them to escalate single low-confidence regions. `words[i]` lists the
+    (x, y, w, h, text, conf) words of `lines[i]` for layout output."""
+
+    def __init__(self, text, confidence, engine, lines=None, words=None):
+        self.text = text
+        self.confidence = confidence
+        self.engine = engine
+        self.lines = lines or []
+        self.words = words if words is not None else [[l] for l in self.lines]
+        self.script = None
+        self.truncated = False
+        self.tiles = 1
+
+
+class OCRCancelled(Exception):
+    """Raised inside an engine when the caller's stop() check fires."""
+
+
+def _weighted_conf(lines):
+    chars = sum(len(t) for *_, t, _c in lines)
+    if not chars:
+        return 0.0
+    return sum(len(t) * c for *_, t, c in lines) / chars
+
+
+class OCREngine:
+    """Interface for a cascade stage: `read(img, script)` returns an OCRResult.
+
+    `script` is 'latin' / 'greek' / 'mixed' (or None if not detected yet);
+    engines may use it to narrow their language set. `stop` is an optional
+    callable; engines with several internal steps check it between them and
+    raise OCRCancelled."""
+
+    name = "base"
+    routes_by_script = False
+
+    def __init__(self, min_conf):
+        self.min_conf = min_conf
+
+    def read(self, img, script=None, stop=None):
+        raise NotImplementedError
+
+
+class TesseractEngine(OCREngine):
+    name = "tesseract"
+
+    def __init__(self, min_conf=TESSERACT_MIN_CONF, lang=TESSERACT_LANG):
+        super().__init__(min_conf)
+        self.lang = lang
+
+    def read(self, img, script=None, stop=None):
+        lang = TESSERACT_SCRIPT_LANG.get(script, self.lang) if SCRIPT_ROUTING else self.lang
+        data = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
+        grouped = OrderedDict()
+        for i, word in enumerate(data["text"]):
+            conf = float(data["conf"][i])
+            if conf < 0 or not word.strip():
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            grouped.setdefault(key, []).append(
+                (data["left"][i], data["top"][i], data["width"][i], data["height"][i], word, conf / 100)
+            )
+        lines = []
+        for words in grouped.values():
+            x0 = min(w[0] for w in words)
+            y0 = min(w[1] for w in words)
+            x1 = max(w[0] + w[2] for w in words)
+            y1 = max(w[1] + w[3] for w in words)
+            text = " ".join(w[4] for w in words)
+            lines.append((x0, y0, x1 - x0, y1 - y0, text, _weighted_conf(words)))
+        return OCRResult("\n".join(l[4] for l in lines), _weighted_conf(lines), self.name, lines,
+                         list(grouped.values()))
+
+
+class EasyOCREngine(OCREngine):
+    name = "easyocr"
+    routes_by_script = True
+
+    def __init__(self, min_conf=EASYOCR_MIN_CONF):
+        super().__init__(min_conf)
+        from easyocr.utils import get_paragraph, reformat_input
+        self._get_paragraph = get_paragraph
+        self._reformat_input = reformat_input
+
+    def read(self, img, script=None, stop=None):
+        r = readers.get(script or "mixed", reader)
+        # readtext() split in its two halves so a cancelled request can skip recognition
+        img_rgb, img_grey = self._reformat_input(img)
+        horizontal_list, free_list = r.detect(img_rgb)
+        if stop and stop():
+            raise OCRCancelled()
+        raw = r.recognize(img_grey, horizontal_list[0], free_list[0], detail=1)
+        lines = []
+        for box, text, conf in raw:
+            xs = [p[0] for p in box]
+            ys = [p[1] for p in box]
+            lines.append((int(min(xs)), int(min(ys)), int(max(xs) - min(xs)), int(max(ys) - min(ys)),
+                          text, float(conf)))
+        # same paragraph grouping as readtext(paragraph=True), but we keep the confidences
+        paragraphs = self._get_paragraph(raw) if raw else []
+        return OCRResult("\n".join(p[1] for p in paragraphs), _weighted_conf(lines), self.name, lines)
+
+
+ENGINES = {"tesseract": TesseractEngine, "easyocr": EasyOCREngine}
+
+
+def build_cascade(names=OCR_CASCADE):
+    cascade = []
+    for name in names:
+        if name == "tesseract":
+            if pytesseract is None:
+                print("[OCR] pytesseract not installed — skipping Tesseract stage")
+                continue
+            try:
+                pytesseract.get_tesseract_version()
+            except Exception as e:
+                print(f"[OCR] Tesseract binary unavailable ({e}) — skipping Tesseract stage")
+                continue
+        if name not in ENGINES:
+            raise ValueError(f"Unknown OCR engine '{name}'. Available: {', '.join(ENGINES)}")
+        cascade.append(ENGINES[name]())
+    return cascade or [EasyOCREngine()]
+
+
+cascade = []
+
+
+def _escalate_regions(img, result, engine, min_conf, script, stop=None):
+    """Re-read only the low-confidence lines of `result` with `engine`.
+
+    Each line is routed by its own script when its text is long enough to
+    tell, else by the page script. Returns a new OCRResult, or None when too
+    much of the page is bad and the whole page should go to `engine` instead."""
+    low = [i for i, l in enumerate(result.lines) if l[5] < min_conf]
+    if not result.lines or len(low) > REGION_ESCALATION_MAX_SHARE * len(result.lines):
+        return None
+    lines = list(result.lines)
+    words = list(result.words)
+    pad = 4
+    h_img, w_img = img.shape[:2]
+    truncated = False
+    for i in low:
+        if stop and stop():
+            truncated = True
+            break
+        x, y, w, h, text, conf = lines[i]
+        cx, cy = max(0, x - pad), max(0, y - pad)
+        crop = img[cy:min(h_img, y + h + pad), cx:min(w_img, x + w + pad)]
+        if crop.size == 0:
+            continue
+        try:
+            sub = engine.read(crop, script_from_text(text) or script, stop)
+        except OCRCancelled:
+            truncated = True
+            break
+        if sub.text and sub.confidence > conf:
+            lines[i] = (x, y, w, h, " ".join(sub.text.split("\n")), sub.confidence)
+            # crop-relative boxes back to page coordinates
+            words[i] = [(wx + cx, wy + cy, ww, wh, wt, wc)
+                        for line_words in sub.words for wx, wy, ww, wh, wt, wc in line_words]
+    patched = OCRResult("\n".join(l[4] for l in lines), _weighted_conf(lines),
+                        f"{result.engine}+{engine.name}", lines, words)
+    patched.truncated = truncated
+    return patched
+
+
+def run_cascade(img, stop=None):
+    """Cheapest engine first; escalate low-confidence regions or pages to the next.
+
+    When `stop()` turns true the best result so far is returned with
+    `truncated` set (an empty one if the first stage never finished)."""
+    result = None
+    script = None
+    truncated = False
+    for stage, engine in enumerate(cascade):
+        if stop and stop():
+            truncated = True
+            break
+        try:
+            if script is None and engine.routes_by_script:
+                script = detect_script(img, result.text if result else None)
+            if result is None:
+                result = engine.read(img, script, stop)
+            else:
+                prev = cascade[stage - 1]
+                patched = _escalate_regions(img, result, engine, prev.min_conf, script, stop)
+                if patched is not None:
+                    result = patched
+                    truncated = patched.truncated
+                else:
+                    full = engine.read(img, script, stop)
+                    if full.confidence >= result.confidence or not result.text:
+                        result = full
+        except OCRCancelled:
+            truncated = True
+        if truncated or (result.text and result.confidence >= engine.min_conf):
+            break
+    if result is None:
+        result = OCRResult("", 0.0, None)
+    result.truncated = truncated
+    result.script = script or script_from_text(result.text) or "mixed"
+    return result
+
+
+# ----------------------------------------------------------
+# TILING (oversized pages)
+# ----------------------------------------------------------
+_tile_pool = None
+
+
+def _tile_executor():
+    global _tile_pool
+    if _tile_pool is None:
+        _tile_pool = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="ocr-tile")
+    return _tile_pool
+
+
+def needs_tiling(img):
+    h, w = img.shape[:2]
+    return max(h, w) > TILE_MAX_SIDE or h * w > TILE_MAX_PIXELS
+
+
+def _tile_spans(length, size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Overlapping [start, end) spans covering `length`, each with its core
+    span — the part this tile owns, cut at the middle of every overlap."""
+    if length <= size:
+        return [(0, length, 0, length)]
+    step = max(1, size - overlap)
+    starts = list(range(0, length - size, step)) + [length - size]
+    spans = []
+    for k, start in enumerate(starts):
+        end = start + size
+        core_start = 0 if k == 0 else (start + spans[-1][1]) // 2
+        spans.append((start, end, core_start, None))
+    # each core ends where the next one starts
+    return [(s, e, cs, spans[k + 1][2] if k + 1 < len(spans) else length)
+            for k, (s, e, cs, _) in enumerate(spans)]
+
+
+def _overlap_ratio(a, b):
+    """Intersection area over the smaller box area, for (x, y, w, h, ...) boxes."""
+    ix = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    iy = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    smaller = min(a[2] * a[3], b[2] * b[3]) or 1
+    return ix * iy / smaller
+
+
+def _reading_order(items):
+    """Sort (line, words) items into rows top-to-bottom, left-to-right within a row."""
+    if not items:
+        return items
+    items = sorted(items, key=lambda it: it[0][1] + it[0][3] / 2)
+    tol = max(4, sorted(it[0][3] for it in items)[len(items) // 2] / 2)
+    rows, row, row_y = [], [], None
+    for it in items:
+        cy = it[0][1] + it[0][3] / 2
+        if row and abs(cy - row_y) > tol:
+            rows.append(row)
+            row = []
+        if not row:
+            row_y = cy
+        row.append(it)
+    rows.append(row)
+    return [it for r in rows for it in sorted(r, key=lambda it: it[0][0])]
+
+
+def _merge_tiles(tiles, results):
+    """Map tile results back to page coordinates and drop seam duplicates.
+
+    A line is kept only by the tile whose core holds its centre; lines that
+    still cross into a neighbouring tile are de-duplicated against each other
+    by box overlap, keeping the more confident reading."""
+    items, seam = [], []
+    rects = [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1, _core in tiles]
+    for (x0, y0, _x1, _y1, (cx0, cy0, cx1, cy1)), res in zip(tiles, results):
+        for (x, y, w, h, t, c), words in zip(res.lines, res.words):
+            gx, gy = x + x0, y + y0
+            mx, my = gx + w / 2, gy + h / 2
+            if not (cx0 <= mx < cx1 and cy0 <= my < cy1):
+                continue
+            item = ((gx, gy, w, h, t, c),
+                    [(wx + x0, wy + y0, ww, wh, wt, wc) for wx, wy, ww, wh, wt, wc in words])
+            crosses = sum(1 for r in rects if _overlap_ratio(item[0], r) > 0) > 1
+            (seam if crosses else items).append(item)
+    kept = []
+    for item in sorted(seam, key=lambda it: -it[0][5]):
+        if all(_overlap_ratio(item[0], k[0]) <= 0.5 for k in kept):
+            kept.append(item)
+    ordered = _reading_order(items + kept)
+    lines = [it[0] for it in ordered]
+    merged = OCRResult("\n".join(l[4] for l in lines), _weighted_conf(lines),
+                       ",".join(dict.fromkeys(r.engine for r in results if r.engine)) or None,
+                       lines, [it[1] for it in ordered])
+    scripts = Counter()
+    for r in results:
+        scripts[r.script] += len(r.text)
+    merged.script = scripts.most_common(1)[0][0] if scripts else "mixed"
+    merged.truncated = any(r.truncated for r in results)
+    merged.tiles = len(tiles)
+    return merged
+
+
+def run_tiled(img, stop=None):
+    """OCR a page, splitting it into parallel overlapping tiles if oversized.
+
+    Tiles are numpy views (no copy), so per-task memory is bounded by the tile
+    size; tiles not yet started when `stop()` fires are skipped."""
+    if not needs_tiling(img):
+        return run_cascade(img, stop)
+    h, w = img.shape[:2]
+    tiles = [(xs, ys, xe, ye, (cxs, cys, cxe, cye))
+             for ys, ye, cys, cye in _tile_spans(h)
+             for xs, xe, cxs, cxe in _tile_spans(w)]
+
+    def _one(tile):
+        if stop and stop():
+            res = OCRResult("", 0.0, None)
+            res.truncated = True
+            return res
+        xs, ys, xe, ye, _core = tile
+        return run_cascade(img[ys:ye, xs:xe], stop)
+
+    results = list(_tile_executor().map(_one, tiles))
+    return _merge_tiles(tiles, results)
+
+
+# ----------------------------------------------------------
+# PAGE RESULT CACHE
+# ----------------------------------------------------------
+class PageCache:
+    """Bounded LRU of OCR results keyed by a hash of the rendered page.
+
+    Hot entries live in memory; every entry is also written to SQLite so a
+    restarted worker keeps its history. The disk store is trimmed to
+    `disk_items` rows, oldest access first. Thread-safe."""
+
+    def __init__(self, path, mem_items=CACHE_MEM_ITEMS, disk_items=CACHE_DISK_ITEMS):
+        self.mem_items = mem_items
+        self.disk_items = disk_items
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = self.stores = 0
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, atime INTEGER NOT NULL)"
+            )
+            self._db.commit()
+        self._tick = self._max_atime()
+
+    def _max_atime(self):
+        if self._db is None:
+            return 0
+        row = self._db.execute("SELECT MAX(atime) FROM pages").fetchone()
+        return row[0] or 0
+
+    def _remember(self, key, value):
+        self._mem[key] = value
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_items:
+            self._mem.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            self._tick += 1
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                if self._db is not None:
+                    self._db.execute("UPDATE pages SET atime=? WHERE key=?", (self._tick, key))
+                    self._db.commit()
+                return self._mem[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM pages WHERE key=?", (key,)).fetchone()
+                if row:
+                    value = json.loads(row[0])
+                    self._db.execute("UPDATE pages SET atime=? WHERE key=?", (self._tick, key))
+                    self._db.commit()
+                    self._remember(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._tick += 1
+            self._remember(key, value)
+            self.stores += 1
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (key, value, atime) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), self._tick),
+            )
+            # trim the disk store back to its bound, least recently used first
+            (count,) = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()
+            if count > self.disk_items:
+                self._db.execute(
+                    "DELETE FROM pages WHERE key IN "
+                    "(SELECT key FROM pages ORDER BY atime ASC LIMIT ?)",
+                    (count - self.disk_items,),
+                )
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            disk_size = 0
+            if self._db is not None:
+                (disk_size,) = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._mem),
+                "memory_limit": self.mem_items,
+                "disk_items": disk_size,
+                "disk_limit": self.disk_items,
+            }
+
+
+page_cache = PageCache(os.path.join(CACHE_DIR, "pages.sqlite3") if CACHE_DIR else None)
+
+
+def cascade_signature():
+    routing = "routed" if SCRIPT_ROUTING else "mixed"
+    tiling = f"tiles{TILE_MAX_SIDE}/{TILE_MAX_PIXELS}/{TILE_SIZE}/{TILE_OVERLAP}"
+    return (",".join(f"{e.name}@{e.min_conf}" for e in cascade)
+            + f"|{routing}|{OCR_MODEL_MODE}|words|{tiling}")
+
+
+def page_key(img, dpi=OCR_DPI):
+    """Content hash of a rendered page + everything that changes the OCR output.
+
+    Hashing pixels (not the PDF bytes) means a re-sent scan wrapped in a new
+    PDF still hits the cache."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{'+'.join(LANGUAGES)}|{dpi}|{img.shape}|{cascade_signature()}".encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+# ----------------------------------------------------------
+# PAGE HELPERS
+# ----------------------------------------------------------
+def embedded_text(page):
+    """Return the page's text layer if it is usable, else None.
+
+    Hybrid PDFs mix real digital pages with scans. A usable layer has enough
+    alphanumeric characters and is not mostly U+FFFD (broken font encodings)."""
+    text = (page.get_text("text") or "").strip()
+    if not text:
+        return None
+    alnum = sum(ch.isalnum() for ch in text)
+    garbage = text.count("\ufffd")
+    if alnum < MIN_TEXT_CHARS or garbage > alnum:
+        return None
+    return text
+
+
+def embedded_words(page, dpi=OCR_DPI):
+    """Words of the text layer as (x, y, w, h, conf, text), in pixels at `dpi`
+    so they line up with OCR'd pages."""
+    k = dpi / 72.0
+    return [[round(x0 * k), round(y0 * k), round((x1 - x0) * k), round((y1 - y0) * k), 100, w]
+            for x0, y0, x1, y1, w, *_ in page.get_text("words")]
+
+
+def rasterize(page, dpi=OCR_DPI):
+    """Render one PDF page to an RGB numpy array for EasyOCR."""
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+
+def columnar_layout(pages):
+    """Encode per-page word lists as compact columns.
+
+    `pages` is [(page_no, width, height, words)] with words as
+    [x, y, w, h, conf, text]. Every page gets parallel int arrays
+    x/y/w/h/conf plus `s`, indexes into one document-wide string table —
+    repeated tokens (EUR, dates, column headers) are stored once, and the
+    int runs compress well under gzip."""
+    strings, index = [], {}
+    out_pages = []
+    for page_no, width, height, words in pages:
+        cols = {"x": [], "y": [], "w": [], "h": [], "conf": [], "s": []}
+        for x, y, w, h, conf, text in words:
+            if text not in index:
+                index[text] = len(strings)
+                strings.append(text)
+            cols["x"].append(x)
+            cols["y"].append(y)
+            cols["w"].append(w)
+            cols["h"].append(h)
+            cols["conf"].append(conf)
+            cols["s"].append(index[text])
+        out_pages.append({"page": page_no, "width": width, "height": height, **cols})
+    return {"units": "px", "dpi": OCR_DPI, "strings": strings, "pages": out_pages}
+
+
+# ----------------------------------------------------------
+# MODEL LIFECYCLE
+# ----------------------------------------------------------
+model_state = {"status": "not_loaded", "error": None, "timings": {}}
+_models_ready = threading.Event()
+_load_lock = threading.Lock()
+
+
+def synthetic_page():
+    """Small invoice-like image for the warm-up inference."""
+    img = Image.new("RGB", (900, 260), "white")
+    draw = ImageDraw.Draw(img)
+    draw.text((30, 30), "FACTURA N 2024-00123   Fecha 15/03/2024", fill="black")
+    draw.text((30, 90), "Proveedor: Ejemplo S.L.   Total 1.234,56 EUR", fill="black")
+    draw.text((30, 150), "Invoice total amount due 1,234.56", fill="black")
+    return np.array(img)
+
+
+def load_models():
+    """Build the reader pool + cascade and run one warm-up inference per reader.
+
+    Safe to call more than once; only the first call does the work."""
+    global readers, reader, cascade
+    with _load_lock:
+        if _models_ready.is_set():
+            return
+        t_start = time.perf_counter()
+        try:
+            model_state["status"] = "loading"
+            t0 = time.perf_counter()
+            readers = build_readers()
+            reader = readers["mixed"]
+            cascade = build_cascade()
+            model_state["timings"]["load_s"] = round(time.perf_counter() - t0, 3)
+            print(f"[OCR] Models loaded in {model_state['timings']['load_s']}s "
+                  f"(mode={OCR_MODEL_MODE}, readers={', '.join(readers)})")
+
+            model_state["status"] = "warming_up"
+            t0 = time.perf_counter()
+            img = synthetic_page()
+            for r in readers.values():
+                r.readtext(img, detail=0)
+            run_cascade(img)
+            model_state["timings"]["warmup_s"] = round(time.perf_counter() - t0, 3)
+            print(f"[OCR] Warm-up inference done in {model_state['timings']['warmup_s']}s")
+
+            model_state["timings"]["total_s"] = round(time.perf_counter() - t_start, 3)
+            model_state["status"] = "ready"
+            _models_ready.set()
+            print(f"[OCR] Ready after {model_state['timings']['total_s']}s")
+        except Exception as e:
+            model_state["status"] = "failed"
+            model_state["error"] = str(e)
+            print(f"[OCR] Model loading failed: {e}")
+            raise
+
+
+def start_model_loading():
+    def _run():
+        try:
+            load_models()
+        except Exception:
+            pass  # already recorded in model_state, /ready reports it
+
+    threading.Thread(target=_run, name="ocr-model-loader", daemon=True).start()
+
+
+def ocr_page(img, stop=None):
+    """OCR one rendered page through the page cache.
+
+    Returns ({"text", "confidence", "engine", "script", "words"}, cache_hit);
+    words are [x, y, w, h, conf 0-100, text] lists in pixel coordinates.
+    A page cut short by `stop` carries "truncated": true and is not cached."""
+    key = page_key(img)
+    cached = page_cache.get(key)
+    if cached is not None:
+        return dict(cached), True  # callers may pop keys; keep the cached entry intact
+    result = run_tiled(img, stop)
+    out = {"text": result.text, "confidence": round(result.confidence, 4),
+           "engine": result.engine, "script": result.script,
+           "words": [[int(x), int(y), int(w), int(h), int(round(c * 100)), t]
+                     for line_words in result.words for x, y, w, h, t, c in line_words]}
+    if result.tiles > 1:
+        out["tiles"] = result.tiles
+    if result.truncated:
+        out["truncated"] = True
+        return out, False
+    page_cache.put(key, out)
+    return dict(out), False
+
+
+def _scan_page(page, stop):
+    """Rasterize + OCR one image-only page (runs in the threadpool)."""
+    img = rasterize(page)
+    res, hit = ocr_page(img, stop)
+    return res, hit, (img.shape[1], img.shape[0])
+
+
+async def _watch_disconnect(request, cancel):
+    while not cancel.is_set():
+        if await request.is_disconnected():
+            cancel.set()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_S)
 
-# Initialize EasyOCR reader ONCE at startup
-reader = easyocr.Reader(['es', 'el', 'en'], gpu=False)
 
 @app.get("/")
 def root():
-    """Status endpoint"""
+    """Liveness endpoint — the process is up (models may still be loading, see /ready)"""
     return {
         "status": "online",
-        "engine": "EasyOCR",
-        "languages": "spa+ell+eng"
+        "model_status": model_state["status"],
+        "engine": " → ".join(e.name for e in cascade),
+        "languages": "spa+ell+eng",
+        "model_mode": OCR_MODEL_MODE,
+        "readers": {k: "+".join(v) for k, v in READER_LANGUAGES.items() if k in readers},
+        "thresholds": {e.name: e.min_conf for e in cascade}
     }
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 only once models are loaded and warmed up"""
+    body = {"ready": _models_ready.is_set(), "status": model_state["status"],
+            "timings": model_state["timings"]}
+    if model_state["error"]:
+        body["error"] = model_state["error"]
+    return JSONResponse(body, status_code=200 if _models_ready.is_set() else 503)
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss statistics of the page-result cache"""
+    return page_cache.stats()
+
 @app.post("/ocr")
-async def ocr(file: UploadFile = File(...)):
+async def ocr(request: Request, file: UploadFile = File(...), layout: bool = False,
+              page_budget: float = None, doc_budget: float = None):
     """
     Perform OCR on a scanned PDF.
-    Returns all text + page-separated results.
+    Pages that already carry a usable text layer are read directly;
+    image-only pages go through the OCR cascade (Tesseract first, EasyOCR for
+    low-confidence lines or pages).
+    Already-seen scans are served from the page cache.
+    Returns all text + page-separated results (each page marked with its source).
+    With ?layout=true also returns word boxes + confidences in columnar form.
+    Stops early when the client disconnects or, if one is set, a time budget
+    (?page_budget= / ?doc_budget= seconds, default OCR_*_BUDGET_S = none)
+    runs out, returning the pages done so far with "truncated": true.
     """
+    if not _models_ready.is_set():
+        return JSONResponse({"error": f"OCR models not ready ({model_state['status']})"},
+                            status_code=503, headers={"Retry-After": "5"})
     try:
         pdf_bytes = await file.read()
-        images = convert_from_bytes(pdf_bytes, dpi=200)
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
 
         pages_output = []
         all_text = []
+        sources = {"text": 0, "ocr": 0, "cache": 0}
+        layout_pages = []
+
+        page_budget = OCR_PAGE_BUDGET_S if page_budget is None else page_budget
+        doc_budget = OCR_DOC_BUDGET_S if doc_budget is None else doc_budget
+        started = time.monotonic()
+        doc_deadline = started + doc_budget if doc_budget > 0 else float("inf")
+        cancel = threading.Event()
+        watcher = asyncio.create_task(_watch_disconnect(request, cancel))
+        truncated_reason = None
+
+        try:
+            for i, page in enumerate(doc):
+                if cancel.is_set():
+                    truncated_reason = "client_disconnected"
+                    break
+                if time.monotonic() >= doc_deadline:
+                    truncated_reason = "doc_budget"
+                    break
+                page_deadline = doc_deadline
+                if page_budget > 0:
+                    page_deadline = min(doc_deadline, time.monotonic() + page_budget)
+
+                def stop(deadline=page_deadline):
+                    return cancel.is_set() or time.monotonic() >= deadline
 
-        for i, img in enumerate(images):
-            results = reader.readtext(img, detail=0, paragraph=True)
-            page_text = "\n".join(results)
-            pages_output.append({"page": i + 1, "text": page_text})
-            all_text.append(page_text)
+                page_text = embedded_text(page)
+                entry = {"page": i + 1, "text": page_text, "source": "text",
+                         "engine": None, "confidence": None, "script": script_from_text(page_text)}
+                if page_text is None:
+                    res, hit, size = await run_in_threadpool(_scan_page, page, stop)
+                    words = res.pop("words", [])
+                    page_text = res["text"]
+                    entry.update(res, source="cache" if hit else "ocr")
+                    entry["low_confidence"] = res["confidence"] < cascade[-1].min_conf
+                    if res.get("truncated"):
+                        truncated_reason = ("client_disconnected" if cancel.is_set()
+                                            else "page_budget")
+                elif layout:
+                    words = embedded_words(page)
+                    k = OCR_DPI / 72.0
+                    size = (round(page.rect.width * k), round(page.rect.height * k))
+                if layout:
+                    layout_pages.append((i + 1, size[0], size[1], words))
+                sources[entry["source"]] += 1
+                pages_output.append(entry)
+                all_text.append(page_text)
+                if cancel.is_set():
+                    truncated_reason = "client_disconnected"
+                    break
+            page_count = doc.page_count
+        finally:
+            cancel.set()  # also stops the disconnect watcher
+            watcher.cancel()
+            doc.close()
 
-        if not any(all_text):
+        if truncated_reason:
+            print(f"[OCR] Request truncated ({truncated_reason}) after {len(pages_output)}/{page_count} "
+                  f"pages, {time.monotonic() - started:.1f}s")
+        elif not any(all_text):
             return JSONResponse({"error": "No text detected"}, status_code=422)
 
-        return {
+        response = {
             "pages": pages_output,
-            "text": "\n\n".join(all_text)
+            "text": "\n\n".join(all_text),
+            "sources": sources,
+            "pages_total": page_count,
+            "truncated": truncated_reason is not None,
+            "truncated_reason": truncated_reason
         }
+        if layout:
+            response["layout"] = columnar_layout(layout_pages)
+        return response
 
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -0,0 +1,223 @@
+# ==========================================================
+# AMOUNT / DATE PARSING (shared by The Remitator and ReconRaptor)
+# The scalar functions are the reference behaviour; the plural versions
+# (parse_amounts, normalize_numbers, normalize_dates) do the same work on
+# a whole pandas Series at once:
+#   - numeric columns are used as-is (only cells whose str() would be in
+#     scientific notation go through the text path, like the scalar does)
+#   - text columns are cleaned with vectorised .str ops
+#   - dates are parsed on the column's unique values, one format at a
+#     time, so the matching format is found once per column, not per cell
+# Results are identical to the scalar functions (see parsing_benchmark.py).
+# ==========================================================
+
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+DATE_FORMATS = [
+    "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y",
+    "%m/%d/%Y", "%m-%d-%Y",
+    "%Y/%m/%d", "%Y-%m-%d",
+    "%d/%m/%y", "%d-%m-%y", "%d.%m.%y",
+    "%m/%d/%y", "%m-%d-%y",
+    "%Y.%m.%d",
+]
+
+
+# ----------------------------------------------------------
+# SCALAR (reference)
+# ----------------------------------------------------------
+def parse_amount(v):
+    if pd.isna(v):
+        return 0.0
+    s = str(v).strip()
+    s = re.sub(r"[^\d,.\-]", "", s)
+    if s.count(",") == 1 and s.count(".") == 1:
+        if s.find(",") > s.find("."):
+            s = s.replace(".", "").replace(",", ".")
+        else:
+            s = s.replace(",", "")
+    elif s.count(",") == 1:
+        s = s.replace(",", ".")
+    try:
+        return float(s)
+    except:
+        return 0.0
+
+
+def normalize_number(v):
+    if pd.isna(v) or str(v).strip() == "":
+        return 0.0
+    s = re.sub(r"[^\d,.\-]", "", str(v).strip())
+    if s.count(",") == 1 and s.count(".") == 1:
+        if s.find(",") > s.find("."):
+            s = s.replace(".", "").replace(",", ".")
+        else:
+            s = s.replace(",", "")
+    elif s.count(",") == 1:
+        s = s.replace(",", ".")
+    elif s.count(".") > 1:
+        s = s.replace(".", "", s.count(".") - 1)
+    try:
+        return float(s)
+    except:
+        return 0.0
+
+
+def fmt_date(v):
+    """Format a payment date from the Excel into dd/mm/yyyy (European). Falls back to raw text."""
+    if pd.isna(v):
+        return ""
+    if hasattr(v, "strftime"):
+        try:
+            return v.strftime("%d/%m/%Y")
+        except Exception:
+            pass
+    try:
+        ts = pd.to_datetime(v, dayfirst=True, errors="coerce")
+        if pd.notna(ts):
+            return ts.strftime("%d/%m/%Y")
+    except Exception:
+        pass
+    return str(v).strip()
+
+
+def normalize_date(v):
+    if pd.isna(v) or str(v).strip() == "":
+        return ""
+    s = str(v).strip().replace(".", "/").replace("-", "/").replace(",", "/")
+    for fmt in DATE_FORMATS:
+        try:
+            d = pd.to_datetime(s, format=fmt, errors="coerce")
+            if not pd.isna(d):
+                return d.strftime("%Y-%m-%d")
+        except:
+            continue
+    d = pd.to_datetime(s, errors="coerce")
+    if pd.isna(d):
+        d = pd.to_datetime(s, errors="coerce")
+    return d.strftime("%Y-%m-%d") if not pd.isna(d) else ""
+
+
+# ----------------------------------------------------------
+# VECTORISED
+# ----------------------------------------------------------
+_INT_TYPES = (int, np.int64, np.int32)
+_NUMBER_TYPES = (float, np.float64) + _INT_TYPES
+
+
+def _plain_numbers(vals):
+    """Finite floats whose str() is not scientific notation (0 or 1e-4 <= |x| < 1e16)."""
+    a = np.abs(vals)
+    return np.isfinite(vals) & ((vals == 0) | ((a >= 1e-4) & (a < 1e16)))
+
+
+def _amounts(col, collapse_dots):
+    col = col if isinstance(col, pd.Series) else pd.Series(col)
+    out = np.zeros(len(col), dtype=float)
+    todo = col.notna().to_numpy().copy()
+
+    # numeric cells: the value already is the answer for almost every one
+    if is_numeric_dtype(col.dtype) and not is_bool_dtype(col.dtype):
+        vals = col.to_numpy(dtype=float, na_value=np.nan)
+        plain = np.ones(len(col), dtype=bool) if col.dtype.kind in "iu" else _plain_numbers(vals)
+    else:
+        # object columns from Excel are mostly floats with a few text cells
+        is_num = np.fromiter((type(v) in _NUMBER_TYPES for v in col), dtype=bool, count=len(col))
+        vals = np.full(len(col), np.nan)
+        if is_num.any():
+            vals[is_num] = col[is_num].to_numpy(dtype=float)
+        plain = is_num & _plain_numbers(vals)
+        plain[is_num] |= np.fromiter((type(v) in _INT_TYPES for v in col[is_num]),
+                                     dtype=bool, count=int(is_num.sum()))
+    plain &= todo
+    out[plain] = vals[plain]
+    todo &= ~plain
+    if not todo.any():
+        return pd.Series(out, index=col.index)
+
+    s = col[todo].astype(str).str.strip().str.replace(r"[^\d,.\-]", "", regex=True)
+    commas, dots = s.str.count(","), s.str.count(r"\.")
+    one_each = (commas == 1) & (dots == 1)
+    comma_decimal = one_each & (s.str.find(",") > s.str.find("."))
+    s = s.mask(comma_decimal, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    s = s.mask(one_each & ~comma_decimal, s.str.replace(",", "", regex=False))
+    s = s.mask(~one_each & (commas == 1), s.str.replace(",", ".", regex=False))
+    if collapse_dots:
+        # keep only the last of several dots (1.234.567 -> 1234.567)
+        s = s.mask((commas != 1) & (dots > 1), s.str.replace(r"\.(?=.*\.)", "", regex=True))
+    out[todo] = [_to_float(x) for x in s.tolist()]
+    return pd.Series(out, index=col.index)
+
+
+def _to_float(s):
+    try:
+        return float(s)
+    except ValueError:
+        return 0.0
+
+
+def parse_amounts(col):
+    """parse_amount over a whole column → float Series on the same index."""
+    return _amounts(col, collapse_dots=False)
+
+
+def normalize_numbers(col):
+    """normalize_number over a whole column → float Series on the same index."""
+    return _amounts(col, collapse_dots=True)
+
+
+def normalize_dates(col):
+    """normalize_date over a whole column → 'YYYY-MM-DD' strings ('' when unparseable)."""
+    col = col if isinstance(col, pd.Series) else pd.Series(col)
+    out = np.full(len(col), "", dtype=object)
+    todo = col.notna().to_numpy().copy()
+    if not todo.any():
+        return pd.Series(out, index=col.index)
+
+    if is_datetime64_any_dtype(col.dtype):
+        out[todo] = col[todo].dt.strftime("%Y-%m-%d").to_numpy()
+        return pd.Series(out, index=col.index)
+
+    s = (col[todo].astype(str).str.strip()
+         .str.replace(".", "/", regex=False)
+         .str.replace("-", "/", regex=False)
+         .str.replace(",", "/", regex=False))
+    pending = pd.Series(pd.unique(s[s != ""]), dtype=object)
+    found = {}
+    for fmt in DATE_FORMATS:
+        if pending.empty:
+            break
+        try:
+            d = pd.to_datetime(pending, format=fmt, errors="coerce")
+        except Exception:
+            d = pd.Series([_to_datetime(x, fmt) for x in pending], index=pending.index)
+        hit = d.notna().to_numpy()
+        if hit.any():
+            found.update(zip(pending[hit], d[hit].dt.strftime("%Y-%m-%d")))
+            pending = pending[~hit]
+    # whatever no explicit format matched: free-form parse ("mixed" parses each
+    # value on its own, like the scalar call); per value if that fails
+    if not pending.empty:
+        try:
+            d = pd.to_datetime(pending, format="mixed", errors="coerce")
+            if not is_datetime64_any_dtype(d.dtype):
+                raise TypeError("mixed time zones")
+            found.update(zip(pending, d.dt.strftime("%Y-%m-%d").fillna("")))
+        except Exception:
+            for x in pending:
+                d = pd.to_datetime(x, errors="coerce")
+                found[x] = d.strftime("%Y-%m-%d") if not pd.isna(d) else ""
+
+    out[todo] = s.map(found).fillna("").to_numpy()
+    return pd.Series(out, index=col.index)
+
+
+def _to_datetime(x, fmt):
+    try:
+        return pd.to_datetime(x, format=fmt, errors="coerce")
+    except Exception:
+        return pd.NaT
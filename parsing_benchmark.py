@@ -0,0 +1,145 @@
+# ==========================================================
+# parsing.py — equivalence check & speed benchmark
+# Generates random export-like columns (amounts in both decimal
+# conventions, currency symbols, junk, blanks, numeric cells, dates in
+# every format ReconRaptor accepts, real datetimes) and checks that the
+# vectorised functions return exactly what the scalar ones return cell by
+# cell. Then times both on --rows rows per column.
+#
+#   python parsing_benchmark.py                 # 100k rows, 20 random trials
+#   python parsing_benchmark.py --rows 20000 --trials 200 --seed 7
+# ==========================================================
+
+import argparse
+import datetime
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+import parsing
+
+JUNK = "0123456789.,-€$ abce+"
+DATE_OUT = ["%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%m/%d/%Y", "%Y-%m-%d", "%Y.%m.%d",
+            "%d/%m/%y", "%d.%m.%y", "%Y-%m-%d %H:%M:%S", "%d %b %Y", "%B %d, %Y"]
+
+
+def random_amount(rng):
+    r = rng.random()
+    x = rng.uniform(0, 1e6) * rng.choice([1, -1])
+    if r < 0.15:
+        return "".join(rng.choice(JUNK) for _ in range(rng.randint(0, 12)))
+    if r < 0.30:
+        return round(x, 2)
+    if r < 0.35:
+        return rng.randint(-10**6, 10**6)
+    if r < 0.40:
+        return rng.choice([None, float("nan"), "", "  ", 1e-5, 1e20, float("inf"), True])
+    us = f"{x:,.2f}"
+    eu = us.replace(",", "X").replace(".", ",").replace("X", ".")
+    return rng.choice([us, eu, f"€ {x:.2f}", f"{x:.2f}".replace(".", ","), f"{x:.3f}",
+                       f"{x:,.0f}".replace(",", "."), f"{eu} €", f"({x:.2f})"])
+
+
+def random_date(rng):
+    r = rng.random()
+    d = datetime.datetime(2020, 1, 1) + datetime.timedelta(days=rng.randint(0, 2500),
+                                                           seconds=rng.randint(0, 86399))
+    if r < 0.05:
+        return rng.choice([None, float("nan"), "", "n/a", "31/02/2024", "2024-13-01", 45123])
+    if r < 0.15:
+        return pd.Timestamp(d)
+    return d.strftime(rng.choice(DATE_OUT))
+
+
+def amount_column(rng, n):
+    kind = rng.random()
+    if kind < 0.2:
+        return pd.Series([round(rng.uniform(-1e6, 1e6), 2) for _ in range(n)])
+    if kind < 0.3:
+        return pd.Series([rng.randint(-10**6, 10**6) for _ in range(n)])
+    return pd.Series([random_amount(rng) for _ in range(n)], dtype=object)
+
+
+def date_column(rng, n):
+    if rng.random() < 0.2:
+        base = datetime.datetime(2020, 1, 1)
+        vals = [base + datetime.timedelta(days=rng.randint(0, 2500)) for _ in range(n)]
+        vals[rng.randrange(n)] = None
+        return pd.Series(pd.to_datetime(vals))
+    # real exports use one or two formats per column, plus stray junk
+    fmts = rng.sample(DATE_OUT, rng.randint(1, 2))
+    vals = []
+    for _ in range(n):
+        v = random_date(rng)
+        if isinstance(v, str) and v and v[0].isdigit() and rng.random() < 0.8:
+            v = datetime.datetime.strptime("2020-01-01", "%Y-%m-%d").replace(
+                day=rng.randint(1, 28), month=rng.randint(1, 12)).strftime(rng.choice(fmts))
+        vals.append(v)
+    return pd.Series(vals, dtype=object)
+
+
+def same(a, b):
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype.kind == "f":
+        return np.flatnonzero(~((a == b) | (np.isnan(a) & np.isnan(b))))
+    return np.flatnonzero(a != b)
+
+
+def check(rng, trials, n):
+    pairs = [(parsing.parse_amount, parsing.parse_amounts, amount_column),
+             (parsing.normalize_number, parsing.normalize_numbers, amount_column),
+             (parsing.normalize_date, parsing.normalize_dates, date_column)]
+    failures = 0
+    for _ in range(trials):
+        for scalar, vector, make in pairs:
+            col = make(rng, n)
+            bad = same(col.map(scalar).to_numpy(), vector(col).to_numpy())
+            if len(bad):
+                failures += 1
+                i = bad[0]
+                print(f"  MISMATCH {vector.__name__}: {col.iloc[i]!r} -> "
+                      f"{scalar(col.iloc[i])!r} vs {vector(col).iloc[i]!r}")
+    return failures
+
+
+def timed(fn, col):
+    t0 = time.perf_counter()
+    fn(col)
+    return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Equivalence + speed of the vectorised parsers in parsing.py")
+    ap.add_argument("--rows", type=int, default=100_000, help="rows per benchmark column")
+    ap.add_argument("--trials", type=int, default=20, help="random columns checked per function")
+    ap.add_argument("--seed", type=int, default=1234)
+    args = ap.parse_args()
+    rng = random.Random(args.seed)
+
+    failures = check(rng, args.trials, 2_000)
+    print(f"equivalence: {3 * args.trials} random columns, {failures} mismatching")
+
+    n = args.rows
+    cols = {
+        "amounts (text, mixed)": pd.Series([random_amount(rng) for _ in range(n)], dtype=object),
+        "amounts (numeric)": pd.Series(np.round(np.random.default_rng(args.seed).uniform(-1e5, 1e5, n), 2)),
+        "dates (text)": date_column(rng, n),
+        "dates (datetime)": pd.Series(pd.to_datetime("2020-01-01")
+                                      + pd.to_timedelta(np.arange(n) % 2000, unit="D")),
+    }
+    print(f"\n{'column':<24} {'function':<18} {'scalar s':>9} {'vector s':>9} {'speed-up':>9}")
+    for name, col in cols.items():
+        fns = ([(parsing.normalize_date, parsing.normalize_dates)] if name.startswith("dates")
+               else [(parsing.parse_amount, parsing.parse_amounts),
+                     (parsing.normalize_number, parsing.normalize_numbers)])
+        for scalar, vector in fns:
+            ts = timed(lambda c: c.apply(scalar), col)
+            tv = timed(vector, col)
+            print(f"{name:<24} {vector.__name__:<18} {ts:>9.3f} {tv:>9.3f} {ts / tv:>8.1f}×")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# ==========================================================
+# PAYMENT ANALYSIS EXCEL EXPORT (used by The Remitator)
+# One sheet per payment code + a combined Summary sheet, totals recomputed.
+#
+#   build_excel_export_pandas — the reference: pd.ExcelWriter(openpyxl),
+#       the whole workbook is built in memory before it is saved
+#   write_excel_export        — xlsxwriter in constant_memory mode: every
+#       row is flushed as soon as it is written, sheets are written straight
+#       from per-code row arrays (code_sheet), same layout and header style
+#       as pandas produces
+#
+# app.py caches code_sheet per code, so an export only re-derives the codes
+# that were edited. export_benchmark.py checks both paths give the same
+# workbook and times them.
+# ==========================================================
+
+import io
+import math
+import re
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+SUMMARY_COLUMNS = ["Payment Code", "Payment Date", "Vendor", "Total (€)"]
+
+# what pandas' to_excel puts on header cells: bold, bordered and centred up
+# to pandas 2, plain from pandas 3 on
+_HEADER_FORMAT = ({"bold": True, "border": 1, "align": "center", "valign": "top"}
+                  if int(pd.__version__.split(".")[0]) < 3 else {})
+
+
+def body_no_total(rows):
+    """Return rows without any TOTAL line, with clean numeric Invoice Value."""
+    body = rows[rows["Alt. Document"].astype(str) != "TOTAL"].copy()
+    body["Alt. Document"] = body["Alt. Document"].fillna("").astype(str)
+    body["Invoice Value"] = pd.to_numeric(body["Invoice Value"], errors="coerce").fillna(0.0)
+    return body.reset_index(drop=True)
+
+
+def sheet_name(code, used):
+    """Excel-safe, unique sheet name for a payment code (adds it to `used`)."""
+    base = re.sub(r'[\\/*?:\[\]]', '_', str(code))[:28] or "Sheet"
+    name, n = base, 1
+    while name in used:
+        n += 1
+        name = f"{base[:25]}_{n}"
+    used.add(name)
+    return name
+
+
+def code_sheet(code, vendor, pay_date, rows):
+    """One code's export as plain arrays → (summary row, header, data rows).
+    body_no_total runs once; the TOTAL line is the last data row."""
+    body = body_no_total(rows)
+    total = body["Invoice Value"].sum()
+    header = ["Payment Code", "Payment Date", "Vendor", *body.columns]
+    lead = [code, pay_date, vendor]
+    data = [lead + list(r) for r in body.itertuples(index=False, name=None)]
+    data.append(lead + ["TOTAL", total])
+    return (code, pay_date, vendor, total), header, data
+
+
+def _cell(v):
+    """numpy scalars → Python, NaN / None → blank (as pandas writes them)."""
+    if isinstance(v, np.generic):
+        v = v.item()
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return None
+    return v
+
+
+def _write_rows(ws, header, rows, header_fmt):
+    for c, h in enumerate(header):
+        ws.write_string(0, c, str(h), header_fmt)
+    for r, row in enumerate(rows, start=1):
+        for c, v in enumerate(row):
+            v = _cell(v)
+            if v is None:
+                continue
+            if isinstance(v, bool):
+                ws.write_boolean(r, c, v)
+            elif isinstance(v, (int, float)):
+                ws.write_number(r, c, v)
+            else:
+                ws.write_string(r, c, str(v))
+
+
+def write_excel_export(sheets):
+    """sheets: [(code, code_sheet(...) result)] in export order → xlsx bytes.
+    Written row by row in xlsxwriter's constant_memory mode."""
+    buf = io.BytesIO()
+    wb = xlsxwriter.Workbook(buf, {"constant_memory": True, "strings_to_numbers": False,
+                                   "strings_to_formulas": False, "strings_to_urls": False})
+    header_fmt = wb.add_format(_HEADER_FORMAT)
+    if sheets:
+        _write_rows(wb.add_worksheet("Summary"), SUMMARY_COLUMNS,
+                    (summary for _, (summary, _, _) in sheets), header_fmt)
+    used = set()
+    for code, (_, header, data) in sheets:
+        _write_rows(wb.add_worksheet(sheet_name(code, used)), header, data, header_fmt)
+    wb.close()
+    return buf.getvalue()
+
+
+def build_excel_export(export_data):
+    """export_data {code: {'vendor', 'pay_date', 'rows'}} → xlsx bytes (streaming)."""
+    return write_excel_export([
+        (code, code_sheet(code, info["vendor"], info.get("pay_date", ""), info["rows"]))
+        for code, info in export_data.items()
+    ])
+
+
+def build_excel_export_pandas(export_data):
+    """Reference path: one sheet per payment code + a combined Summary sheet
+    through pd.ExcelWriter(openpyxl). Totals recomputed."""
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        summary_rows = []
+        for code, info in export_data.items():
+            body = body_no_total(info["rows"])
+            total = body["Invoice Value"].sum()
+            summary_rows.append({
+                "Payment Code": code,
+                "Payment Date": info.get("pay_date", ""),
+                "Vendor": info["vendor"],
+                "Total (€)": total,
+            })
+        if summary_rows:
+            pd.DataFrame(summary_rows).to_excel(writer, sheet_name="Summary", index=False)
+
+        used = set()
+        for code, info in export_data.items():
+            name = sheet_name(code, used)
+            body = body_no_total(info["rows"])
+            total = body["Invoice Value"].sum()
+            out = body.copy()
+            out.loc[len(out)] = ["TOTAL", total]
+            out.insert(0, "Vendor", info["vendor"])
+            out.insert(0, "Payment Date", info.get("pay_date", ""))
+            out.insert(0, "Payment Code", code)
+            out.to_excel(writer, sheet_name=name, index=False)
+    return buf.getvalue()
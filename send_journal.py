@@ -0,0 +1,261 @@
+# ==========================================================
+# GLPI BULK-SEND JOURNAL (used by The Remitator)
+# Every ticket of a bulk send is written to a local SQLite file before any
+# call goes out, keyed by a hash of (ticket id, message). The sender's
+# worker threads mark a ticket 'sending' right before its calls and
+# record its final state with the result string right after — so results
+# are recorded even when the Streamlit run that started the send is gone
+# (browser refresh, dropped connection).
+#
+#   - the same message to the same ticket is not sent twice by accident:
+#     tickets already 'done' are left out, whichever batch they were sent in,
+#     unless the send asks for it (resend_done — e.g. a reopened ticket)
+#   - 'failed' (❌ 408 / 429 — GLPI did not take the call) and 'skipped'
+#     (⏭️, e.g. closed) tickets are retried on the next send / resume
+#   - 'rejected' tickets (❌ not found, any other 4xx — permissions,
+#     validation) are final like 'done': sending again would fail again
+#   - a batch that stopped half-way can be resumed from its stored message
+#     and attachment (kept with the batch until GLPI has it as a Document)
+#   - tickets left 'sending' were in flight when the run died, and 'unknown'
+#     ones (❌ Error, ❌ 5xx, ⚠️ Outcome unknown) got no clear answer; GLPI
+#     may or may not have them, so they are only re-sent when asked to
+#
+# GLPI_JOURNAL_DIR="" keeps the journal in memory (per process only).
+# ==========================================================
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+JOURNAL_DIR = os.getenv("GLPI_JOURNAL_DIR", ".glpi_journal")
+KEEP_BATCHES = int(os.getenv("GLPI_JOURNAL_BATCHES", "200"))
+
+PENDING, SENDING, DONE, FAILED, SKIPPED = "pending", "sending", "done", "failed", "skipped"
+UNKNOWN, REJECTED = "unknown", "rejected"
+RETRYABLE = (PENDING, FAILED, SKIPPED)
+FINAL = (DONE, REJECTED)         # never re-sent unless asked for (resend_done)
+INTERRUPTED = (SENDING, UNKNOWN)  # re-sent only when asked for (retry_interrupted)
+
+_STATUS = re.compile(r"\((\d{3})\)")
+
+
+def action_key(ticket_id, html_message):
+    """Identity of one ticket action: the same message to the same ticket."""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{ticket_id}|".encode())
+    h.update((html_message or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+def _final_state(result):
+    """✅ / ⚠️ results are done and ⏭️ ones skipped. A ❌ is 'unknown' when
+    GLPI may have stored the write anyway (an exception, a 5xx), 'failed'
+    when it surely did not and may take it later (408 / 429) and 'rejected'
+    when it refused the ticket (not found, other 4xx)."""
+    if result.startswith("⚠️ Outcome unknown"):
+        return UNKNOWN
+    if result.startswith("⏭️"):
+        return SKIPPED
+    if not result.startswith("❌"):
+        return DONE
+    if result.startswith("❌ Error"):
+        return UNKNOWN
+    status = _STATUS.search(result)
+    if status is None:
+        return REJECTED
+    code = int(status.group(1))
+    return UNKNOWN if code >= 500 else FAILED if code in (408, 429) else REJECTED
+
+
+class SendJournal:
+    """SQLite journal of bulk-send batches and their per-ticket actions.
+    One connection per process, shared by all threads. Thread-safe."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " batch_id TEXT PRIMARY KEY, created REAL NOT NULL, html TEXT NOT NULL,"
+            " category TEXT NOT NULL, tickets TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS actions ("
+            " key TEXT PRIMARY KEY, batch_id TEXT NOT NULL, ticket TEXT NOT NULL,"
+            " state TEXT NOT NULL, result TEXT NOT NULL DEFAULT '', updated REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS actions_batch ON actions (batch_id, state);"
+            "CREATE TABLE IF NOT EXISTS attachments ("
+            " batch_id TEXT PRIMARY KEY, filename TEXT NOT NULL, mime TEXT NOT NULL,"
+            " data BLOB, document INTEGER);"
+        )
+        self._db.commit()
+
+    def open_batch(self, ticket_ids, html_message, category_id, batch_id=None, resend_done=False,
+                   attachment=None):
+        """Record a send of html_message to ticket_ids (a new batch, or
+        `batch_id` to resume one) and split the tickets by what the journal
+        already knows. resend_done=True sends again to tickets that already
+        got this message or had it rejected. attachment=(filename, bytes,
+        mime) is stored with a new batch so a resume can still attach it.
+        Returns a JournalBatch."""
+        now = time.time()
+        keys = {tid: action_key(tid, html_message) for tid in ticket_ids}
+        todo, done, interrupted = [], {}, []
+        with self._lock:
+            if batch_id is None:
+                batch_id = uuid.uuid4().hex[:12]
+                self._db.execute(
+                    "INSERT INTO batches (batch_id, created, html, category, tickets) VALUES (?, ?, ?, ?, ?)",
+                    (batch_id, now, html_message, str(category_id or ""), json.dumps(list(ticket_ids))),
+                )
+                if attachment:
+                    filename, data, mime = attachment
+                    self._db.execute(
+                        "INSERT INTO attachments (batch_id, filename, mime, data) VALUES (?, ?, ?, ?)",
+                        (batch_id, filename, mime, data),
+                    )
+            for tid, key in keys.items():
+                row = self._db.execute("SELECT state, result FROM actions WHERE key=?", (key,)).fetchone()
+                if row and row[0] in FINAL and not resend_done:
+                    done[tid] = row[1]
+                    continue
+                if row and row[0] in INTERRUPTED:
+                    interrupted.append(tid)
+                    self._db.execute("UPDATE actions SET batch_id=? WHERE key=?", (batch_id, key))
+                    continue
+                todo.append(tid)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO actions (key, batch_id, ticket, state, result, updated)"
+                    " VALUES (?, ?, ?, ?, COALESCE((SELECT result FROM actions WHERE key=?), ''), ?)",
+                    (key, batch_id, str(tid), PENDING, key, now),
+                )
+            stored = self._db.execute(
+                "SELECT filename, data, mime, document FROM attachments WHERE batch_id=?", (batch_id,)).fetchone()
+            self._trim()
+            self._db.commit()
+        batch = JournalBatch(self, batch_id, keys, todo, done, interrupted)
+        if stored:
+            batch.attachment, batch.document = stored[:3], stored[3]
+        return batch
+
+    def _trim(self):
+        """Forget batches beyond the newest KEEP_BATCHES (caller holds the lock)."""
+        old = [r[0] for r in self._db.execute(
+            "SELECT batch_id FROM batches ORDER BY created DESC LIMIT -1 OFFSET ?", (KEEP_BATCHES,))]
+        for batch_id in old:
+            self._db.execute("DELETE FROM actions WHERE batch_id=?", (batch_id,))
+            self._db.execute("DELETE FROM attachments WHERE batch_id=?", (batch_id,))
+            self._db.execute("DELETE FROM batches WHERE batch_id=?", (batch_id,))
+
+    def claim(self, keys, states=RETRYABLE):
+        """Mark keys 'sending' if they are still in `states`; returns the ones claimed."""
+        claimed = []
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                cur = self._db.execute(
+                    f"UPDATE actions SET state=?, updated=? WHERE key=? AND state IN ({','.join('?' * len(states))})",
+                    (SENDING, now, key, *states),
+                )
+                if cur.rowcount:
+                    claimed.append(key)
+            self._db.commit()
+        return claimed
+
+    def set_document(self, batch_id, document_id):
+        """The batch's attachment is in GLPI as `document_id`: keep the id
+        for a resume to link, drop the stored bytes."""
+        with self._lock:
+            self._db.execute("UPDATE attachments SET document=?, data=NULL WHERE batch_id=?",
+                             (int(document_id), batch_id))
+            self._db.commit()
+
+    def sent(self, batch_id):
+        """Tickets of the batch that got the message ('done')."""
+        with self._lock:
+            return [r[0] for r in self._db.execute(
+                "SELECT ticket FROM actions WHERE batch_id=? AND state=?", (batch_id, DONE))]
+
+    def finish(self, key, result):
+        with self._lock:
+            self._db.execute("UPDATE actions SET state=?, result=?, updated=? WHERE key=?",
+                             (_final_state(result), result, time.time(), key))
+            self._db.commit()
+
+    def last_unfinished(self):
+        """The newest batch that still has tickets not sent ('pending',
+        'sending', 'unknown', 'failed'), as {'batch_id', 'created', 'html',
+        'category', 'tickets', 'counts', 'attachment'} ('attachment' is the
+        stored file's name, or None); or None. Skipped and rejected tickets
+        alone do not count."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT b.batch_id, b.created, b.html, b.category, b.tickets FROM batches b"
+                " WHERE EXISTS (SELECT 1 FROM actions a WHERE a.batch_id=b.batch_id AND a.state NOT IN (?, ?, ?))"
+                " ORDER BY b.created DESC LIMIT 1", (DONE, SKIPPED, REJECTED),
+            ).fetchone()
+            if row is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM actions WHERE batch_id=? GROUP BY state", (row[0],)))
+            attachment = self._db.execute(
+                "SELECT filename FROM attachments WHERE batch_id=?", (row[0],)).fetchone()
+        tickets = json.loads(row[4])
+        # tickets finished by a later batch no longer point here — they are done
+        counts[DONE] = len(tickets) - sum(n for s, n in counts.items() if s != DONE)
+        return {"batch_id": row[0], "created": row[1], "html": row[2],
+                "category": row[3], "tickets": tickets, "counts": counts,
+                "attachment": attachment[0] if attachment else None}
+
+
+class JournalBatch:
+    """One open batch. `todo` are the tickets to send, `done` maps tickets the
+    journal already has a final result for, `interrupted` were 'sending'
+    when a previous run stopped or got an 'unknown' result. `attachment`
+    is the batch's stored (filename, bytes, mime) — bytes None once uploaded
+    — and `document` its GLPI Document id once uploaded; both None when the
+    batch has no attachment.
+
+    The GLPI senders call begin(ticket_ids) before a ticket's calls (it
+    returns the ones this run may send) and finish(ticket_id, result)
+    after them."""
+
+    def __init__(self, journal, batch_id, keys, todo, done, interrupted):
+        self.journal = journal
+        self.batch_id = batch_id
+        self.keys = keys
+        self.todo = todo
+        self.done = done
+        self.interrupted = interrupted
+        self.attachment = None
+        self.document = None
+        self._retry_interrupted = False
+
+    def retry_interrupted(self):
+        """Send the interrupted tickets again too (GLPI may already have them)."""
+        self._retry_interrupted = True
+        self.todo = self.todo + [t for t in self.interrupted if t not in self.todo]
+        self.interrupted = []
+
+    def begin(self, ticket_ids):
+        states = RETRYABLE + INTERRUPTED if self._retry_interrupted else RETRYABLE
+        claimed = set(self.journal.claim([self.keys[t] for t in ticket_ids], states))
+        return [t for t in ticket_ids if self.keys[t] in claimed]
+
+    def finish(self, ticket_id, result):
+        self.journal.finish(self.keys[ticket_id], result)
+
+    def set_document(self, document_id):
+        self.document = document_id
+        self.journal.set_document(self.batch_id, document_id)
+
+    def sent(self):
+        return self.journal.sent(self.batch_id)
+
+
+journal = SendJournal(os.path.join(JOURNAL_DIR, "sends.sqlite3") if JOURNAL_DIR else None)
@@ -0,0 +1,55 @@
+import random
+
+from cn_matching import CNIndex, assign_globally, first_fit
+
+
+def pool(amounts):
+    return CNIndex([(i, f"CN{i}", a) for i, a in enumerate(amounts)])
+
+
+def covered(combos):
+    return sum(1 for c in combos if c)
+
+
+def test_global_assignment_not_worse_than_first_fit_counterexample():
+    # most-constrained-first gives 23 = 2 + 10 + 11 and strands 11 and 12
+    index = pool([1, 11, 2, 9, 10])
+    combos, stats = assign_globally(index, [11, 23, 12], max_combo=4)
+    assert covered(combos) == 2
+    assert [sorted(e[2] for e in c) if c else None for c in combos] == [[11], None, [2, 10]]
+    assert stats["greedy_kept"] and stats["matched"] == 2
+
+
+def test_global_assignment_random_pools():
+    rng = random.Random(7)
+    for _ in range(300):
+        index = pool([rng.randint(1, 30) for _ in range(rng.randint(2, 10))])
+        targets = [rng.randint(1, 60) for _ in range(rng.randint(1, 5))]
+        combos, _ = assign_globally(index, targets, max_combo=4)
+        assert covered(combos) >= covered(first_fit(index, targets, max_combo=4))
+        taken = [e[0] for c in combos if c for e in c]
+        assert len(taken) == len(set(taken))
+        for t, c in zip(targets, combos):
+            assert c is None or sum(e[2] for e in c) == t
+
+
+def test_tolerance_prefers_closest_amount_below_on_tie():
+    index = pool([10.02, 9.98, 10.01, 9.99])
+    assert index.find(10.00, tolerance=0.05) == [(3, "CN3", 9.99)]
+    assert index.find(10.00, tolerance=0.05, used={3}) == [(2, "CN2", 10.01)]
+    assert index.find(20.00, max_combo=2, tolerance=0.01) == [(0, "CN0", 10.02), (1, "CN1", 9.98)]
+    assert index.find(10.00, tolerance=0.0) is None
+
+
+def test_spent_budget_does_not_rerun_first_fit():
+    rng = random.Random(11)
+    index = pool([rng.randint(1, 400) for _ in range(200)])
+    targets = [rng.randint(1, 1200) for _ in range(60)]
+    calls = []
+    find = index.find
+    index.find = lambda *a, **k: calls.append(a) or find(*a, **k)
+    combos, stats = assign_globally(index, targets, max_combo=4, time_budget=0.0)
+    assert stats["timed_out"]
+    assert len(calls) == len(targets)          # the first-fit pass only
+    index.find = find
+    assert covered(combos) == covered(first_fit(index, targets, max_combo=4))
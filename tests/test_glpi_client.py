@@ -0,0 +1,111 @@
+import json
+
+import requests
+
+import glpi_client
+
+
+def response(status, body):
+    r = requests.Response()
+    r.status_code = status
+    r._content = json.dumps(body).encode()
+    return r
+
+
+def fake_glpi(monkeypatch, answers):
+    """glpi_request stand-in: (method, path) -> response (or a list, answered
+    in order), calls recorded."""
+    calls = []
+
+    def request(method, path, token=None, **kwargs):
+        calls.append((method, path, kwargs.get("json")))
+        answer = answers[(method, path)]
+        return answer.pop(0) if isinstance(answer, list) else answer
+
+    monkeypatch.setattr(glpi_client, "glpi_request", request)
+    return calls
+
+
+def test_send_chunk_follows_up_only_on_already_solved(monkeypatch):
+    calls = fake_glpi(monkeypatch, {
+        ("PUT", "/Ticket"): response(200, [{"1": True}, {"2": True}, {"3": True}]),
+        ("POST", "/Ticket_User"): response(201, [{"id": 11}, {"id": 12}, {"id": 13}]),
+        ("POST", "/ITILSolution"): response(207, [
+            {"id": 21, "message": ""},
+            {"id": False, "message": "The item is already solved, did anyone pushed a solution before yours?"},
+            {"id": False, "message": "You don't have permission to perform this action."},
+        ]),
+        ("POST", "/ITILFollowup"): response(201, [{"id": 31}]),
+    })
+    out = glpi_client.glpi_send_chunk("tok", ["1", "2", "3"], "<p>hi</p>", None)
+    assert out == {"1": "✅ Solution added",
+                   "2": "⚠️ Already solved — follow-up posted",
+                   "3": "❌ Solution failed (400)"}
+    followups = [c for c in calls if c[1] == "/ITILFollowup"]
+    assert [row["items_id"] for row in followups[0][2]["input"]] == [2]
+
+
+def test_plan_assigned_matches_exact_user_id():
+    from glpi_mock import MockGLPI
+    mock = MockGLPI(tickets=250, latency_ms=0, item_ms=0, assigned_rate=0.5, seed=3).start()
+    try:
+        glpi_client.configure(url=mock.url, app_token="app", user_token="user")
+        ids = [str(t) for t in range(1, 251)] + ["99999"]
+        plan, err = glpi_client.glpi_plan(None, ids)
+        assert err is None
+        assert plan["99999"]["action"] == "not found"
+        for tid in ids[:-1]:
+            t = mock.ticket(tid)
+            assert plan[tid]["assigned"] is (glpi_client.DEFAULT_USER_ID in t["techs"]), tid
+            assert plan[tid]["status"] == t["status"]
+        # colleagues whose ID contains ours are in the mock and do not count
+        assert any(glpi_client.DEFAULT_USER_ID not in mock.ticket(t)["techs"] and mock.ticket(t)["techs"]
+                   for t in ids[:-1])
+    finally:
+        glpi_client.configure(url="", app_token="", user_token="")
+        mock.stop()
+
+
+def test_send_settings_stay_with_the_send(monkeypatch):
+    calls = []
+
+    def request(method, url, **kwargs):
+        calls.append(url)
+        return response(503, {})
+
+    monkeypatch.setattr(glpi_client._session, "request", request)
+    monkeypatch.setattr(glpi_client, "BACKOFF_S", 0)
+    rate, retries = glpi_client.RATE_LIMIT, glpi_client.RETRIES
+    out = dict(glpi_client.glpi_link_document_many("tok", 5, ["1"], workers=1, rate_limit=0, retries=0))
+    assert out == {"1": False} and len(calls) == 1
+    assert (glpi_client.RATE_LIMIT, glpi_client.RETRIES) == (rate, retries)
+    calls.clear()
+    glpi_client.glpi_request("POST", "/Document_Item", token="tok")
+    assert len(calls) == 1 + glpi_client.RETRIES
+
+
+def test_send_chunk_does_not_repost_after_5xx(monkeypatch):
+    calls = fake_glpi(monkeypatch, {
+        ("PUT", "/Ticket"): response(200, [{"1": True}, {"2": True}]),
+        ("POST", "/Ticket_User"): response(201, [{"id": 11}, {"id": 12}]),
+        ("POST", "/ITILSolution"): response(502, "Bad Gateway"),
+    })
+    out = glpi_client.glpi_send_chunk("tok", ["1", "2"], "<p>hi</p>", None)
+    assert out == dict.fromkeys(["1", "2"], "⚠️ Outcome unknown (solution 502) — not retried")
+    assert [c[1] for c in calls].count("/ITILSolution") == 1
+    assert not any(c[1].startswith("/Ticket/") for c in calls)
+
+
+def test_send_chunk_falls_back_per_ticket_after_4xx(monkeypatch):
+    calls = fake_glpi(monkeypatch, {
+        ("PUT", "/Ticket"): response(200, [{"1": True}, {"2": True}]),
+        ("POST", "/Ticket_User"): response(201, [{"id": 11}, {"id": 12}]),
+        ("POST", "/ITILSolution"): [
+            response(400, ["ERROR_BAD_ARRAY", "input parameter must be an array"]),
+            response(201, {"id": 21}),
+            response(400, ["ERROR_GLPI_ADD", "You don't have permission to perform this action."]),
+        ],
+    })
+    out = glpi_client.glpi_send_chunk("tok", ["1", "2"], "<p>hi</p>", None)
+    assert out == {"1": "✅ Solution added", "2": "❌ Solution failed (400)"}
+    assert not any("Followup" in c[1] for c in calls)
@@ -0,0 +1,56 @@
+"""build_readers() against a stand-in for easyocr.Reader that binds its
+detection functions the way EasyOCR 1.7.x does: only when detector=True."""
+
+import sys
+import types
+
+import numpy as np
+import pytest
+
+import ocr_worker
+
+
+class FakeReader:
+    def __init__(self, lang_list, gpu=True, detector=True, quantize=True, detect_network="craft"):
+        self.lang_list = lang_list
+        self.recognizer_quantized = quantize
+        self.quantize = quantize,  # sic — EasyOCR 1.7 stores a tuple
+        if detector:
+            self.setDetector(detect_network)
+
+    def getDetectorPath(self, detect_network):
+        self.detect_network = detect_network
+        self.get_textbox = lambda detector, img: [(0, 0, img.shape[1], img.shape[0])]
+        self.get_detector = lambda path, quantize=True: {"path": path, "quantized": bool(quantize)}
+        return "craft.pth"
+
+    def setDetector(self, detect_network):
+        path = self.getDetectorPath(detect_network)
+        self.detector = self.get_detector(path, quantize=self.quantize)
+
+    def readtext(self, img, detail=1):
+        boxes = self.get_textbox(self.detector, img)
+        return ["+".join(self.lang_list) for _ in boxes]
+
+
+@pytest.fixture
+def fake_easyocr(monkeypatch):
+    monkeypatch.setitem(sys.modules, "easyocr", types.SimpleNamespace(Reader=FakeReader))
+    monkeypatch.setattr(ocr_worker, "SCRIPT_ROUTING", True)
+
+
+def test_routed_readers_can_read(fake_easyocr):
+    pool = ocr_worker.build_readers("int8")
+    assert set(pool) == {"mixed", "latin", "greek"}
+    img = np.zeros((20, 40, 3), dtype=np.uint8)
+    for script, reader in pool.items():
+        assert reader.readtext(img, detail=0) == ["+".join(ocr_worker.READER_LANGUAGES[script])]
+        assert reader.detector is pool["mixed"].detector
+
+
+@pytest.mark.parametrize("mode, quantized", [("int8", True), ("float32", False)])
+def test_model_mode_reaches_detector_and_recognizer(fake_easyocr, mode, quantized):
+    pool = ocr_worker.build_readers(mode)
+    for reader in pool.values():
+        assert reader.recognizer_quantized is quantized
+        assert reader.detector["quantized"] is quantized
@@ -0,0 +1,89 @@
+"""The vectorised parsers must return exactly what the scalar reference
+functions return, cell by cell (parsing_benchmark.py does the same on
+random data at scale)."""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import parsing
+
+BLANKS = [None, np.nan, pd.NA, "", "   ", "\t"]
+EUROPEAN = ["1.234,56", "1.234.567,89", "-1.234,56", "€ 1.234,56", "1234,5", "0,01", "12,345"]
+US = ["1,234.56", "1,234,567.89", "-1,234.56", "$1,234.56", "1234.5", "0.01", "1.234.567"]
+PARENTHESES = ["(1.234,56)", "(1,234.56)", "(500)", "-(12,00)", "( 7 )"]
+JUNK = ["abc", "-", ".", ",", "--5", "1-2", "1e5", "12 34", "TOTAL", "€"]
+NUMBERS = [0, 0.0, -0.0, 12, -12, 1234.56, -0.005, 1e-5, 1e16, 1e20, float("inf"),
+           np.int64(7), np.float64(2.5), True, False]
+SERIALS = [45000, 45000.0, "45000", 45366.5, 1, "1"]
+DATES = ["15/03/2024", "15-03-2024", "15.03.2024", "03/15/2024", "2024-03-15", "2024/03/15",
+         "2024.03.15", "15/03/24", "15.03.24", "31/02/2024", "2024-03-15 10:30:00",
+         "15 Mar 2024", "March 15, 2024", "15,03,2024", "not a date",
+         pd.Timestamp("2024-03-15"), datetime.date(2024, 3, 15), datetime.datetime(2024, 3, 15, 8)]
+
+AMOUNT_CASES = {
+    "blanks": BLANKS,
+    "european": EUROPEAN,
+    "us": US,
+    "parentheses": PARENTHESES,
+    "junk": JUNK,
+    "numbers": NUMBERS,
+    "serials": SERIALS,
+    "mixed": BLANKS + EUROPEAN + US + PARENTHESES + JUNK + NUMBERS + SERIALS + DATES,
+}
+
+
+def scalar(fn, values):
+    return [fn(v) for v in values]
+
+
+@pytest.mark.parametrize("vector, reference", [
+    (parsing.parse_amounts, parsing.parse_amount),
+    (parsing.normalize_numbers, parsing.normalize_number),
+])
+@pytest.mark.parametrize("case", sorted(AMOUNT_CASES))
+def test_amounts_match_scalar(vector, reference, case):
+    values = AMOUNT_CASES[case]
+    col = pd.Series(values, dtype=object, index=range(10, 10 + len(values)))
+    got = vector(col)
+    assert list(got.index) == list(col.index)
+    assert got.tolist() == scalar(reference, values)
+
+
+@pytest.mark.parametrize("vector, reference", [
+    (parsing.parse_amounts, parsing.parse_amount),
+    (parsing.normalize_numbers, parsing.normalize_number),
+])
+@pytest.mark.parametrize("col", [
+    pd.Series([1.5, np.nan, -2.25, 1e-5, 1e20, 0.0]),
+    pd.Series([1, -2, 0, 10**12]),
+    pd.Series([1, None, 3], dtype="Int64"),
+    pd.Series([True, False]),
+    pd.Series(["1.234,56", None, "(7,00)"], dtype="string"),
+    pd.Series([], dtype=object),
+], ids=["float", "int", "nullable-int", "bool", "string", "empty"])
+def test_amounts_match_scalar_typed_columns(vector, reference, col):
+    assert vector(col).tolist() == scalar(reference, col.tolist())
+
+
+def test_known_amounts():
+    col = pd.Series(["1.234,56", "1,234.56", "(1.234,56)", "-12,5", "", None, "x"])
+    assert parsing.parse_amounts(col).tolist() == [1234.56, 1234.56, 1234.56, -12.5, 0.0, 0.0, 0.0]
+    assert parsing.normalize_numbers(pd.Series(["1.234.567", "1.234.567,89"])).tolist() == \
+        [1234.567, 0.0]
+
+
+@pytest.mark.parametrize("values", [
+    BLANKS, DATES, SERIALS, BLANKS + DATES + SERIALS + EUROPEAN,
+    ["15/03/2024"] * 3 + ["2024-03-15"] * 2,
+], ids=["blanks", "dates", "serials", "mixed", "repeated"])
+def test_dates_match_scalar(values):
+    col = pd.Series(values, dtype=object)
+    assert parsing.normalize_dates(col).tolist() == scalar(parsing.normalize_date, values)
+
+
+def test_dates_match_scalar_datetime_column():
+    col = pd.Series([pd.Timestamp("2024-03-15"), pd.NaT, pd.Timestamp("1999-12-31 23:59")])
+    assert parsing.normalize_dates(col).tolist() == scalar(parsing.normalize_date, col.tolist())
@@ -0,0 +1,74 @@
+from send_journal import SendJournal
+
+
+def send(batch, results):
+    """What a sender does: claim, then record each ticket's result."""
+    for tid in batch.begin(list(results)):
+        batch.finish(tid, results[tid])
+
+
+def test_done_tickets_are_left_out_unless_resend_is_asked():
+    journal = SendJournal(None)
+    first = journal.open_batch(["1", "2"], "<p>x</p>", None)
+    send(first, {"1": "✅ Solution added", "2": "✅ Solution added"})
+
+    again = journal.open_batch(["1", "2", "3"], "<p>x</p>", None)
+    assert again.todo == ["3"] and set(again.done) == {"1", "2"}
+
+    resend = journal.open_batch(["1", "2"], "<p>x</p>", None, resend_done=True)
+    assert resend.todo == ["1", "2"] and not resend.done
+    assert resend.begin(["1", "2"]) == ["1", "2"]
+
+
+def test_skipped_and_failed_tickets_are_retried():
+    journal = SendJournal(None)
+    first = journal.open_batch(["1", "2", "3"], "<p>x</p>", None)
+    send(first, {"1": "✅ Solution added", "2": "⏭️ Closed — skipped", "3": "❌ Solution failed (429)"})
+    # skipped tickets alone do not make a batch unfinished; failed ones do
+    assert journal.last_unfinished()["counts"] == {"skipped": 1, "failed": 1, "done": 1}
+
+    later = journal.open_batch(["1", "2", "3"], "<p>x</p>", None)
+    assert later.todo == ["2", "3"]
+    send(later, {"2": "⏭️ Closed — skipped", "3": "✅ Solution added"})
+    assert journal.last_unfinished() is None
+
+
+def test_rejected_tickets_are_final():
+    journal = SendJournal(None)
+    first = journal.open_batch(["1", "2", "3"], "<p>x</p>", None)
+    send(first, {"1": "✅ Solution added", "2": "❌ Ticket not found",
+                 "3": "❌ Solution failed (400) (assign?)"})
+    assert journal.last_unfinished() is None
+
+    again = journal.open_batch(["1", "2", "3"], "<p>x</p>", None)
+    assert again.todo == [] and again.done["2"] == "❌ Ticket not found"
+
+
+def test_unknown_outcomes_are_resent_only_when_asked():
+    journal = SendJournal(None)
+    first = journal.open_batch(["1", "2", "3"], "<p>x</p>", None)
+    send(first, {"1": "❌ Error: ReadTimeout", "2": "❌ Follow-up failed (502)",
+                 "3": "⚠️ Outcome unknown (solution 504) — not retried"})
+    assert journal.last_unfinished()["counts"] == {"unknown": 3, "done": 0}
+
+    resume = journal.open_batch(["1", "2", "3"], "<p>x</p>", None, batch_id=first.batch_id)
+    assert resume.todo == [] and resume.interrupted == ["1", "2", "3"]
+    assert resume.begin(["1", "2", "3"]) == []
+    resume.retry_interrupted()
+    assert resume.begin(["1", "2", "3"]) == ["1", "2", "3"]
+
+
+def test_attachment_is_kept_for_the_resume():
+    journal = SendJournal(None)
+    first = journal.open_batch(["1", "2"], "<p>x</p>", None, attachment=("pay.xlsx", b"xlsx", "application/x"))
+    send(first, {"1": "✅ Solution added"})
+    assert journal.last_unfinished()["attachment"] == "pay.xlsx"
+
+    resume = journal.open_batch(["1", "2"], "<p>x</p>", None, batch_id=first.batch_id)
+    assert resume.attachment == ("pay.xlsx", b"xlsx", "application/x") and resume.document is None
+    send(resume, {"2": "⚠️ Already solved — follow-up posted"})
+    assert sorted(resume.sent()) == ["1", "2"]
+    resume.set_document(77)
+
+    again = journal.open_batch(["1", "2"], "<p>x</p>", None, batch_id=first.batch_id)
+    assert again.attachment == ("pay.xlsx", None, "application/x") and again.document == 77